@@ -1,6 +1,13 @@
-from flask import Flask, render_template, request, send_file, send_from_directory
-import io
+from flask import Flask, Response, g, render_template, request, send_file, send_from_directory
 import time
+import threading
+import gzip
+import tempfile
+import hashlib
+import glob
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import json
 import os
 import pandas as pd
@@ -11,8 +18,35 @@ import config
 from utils import (
     gerar_tabela_desempenho_atendente,
     gerar_tabela_detalhes_rechamadas,
-    classificar_tipos_rechamada
+    classificar_tipos_rechamada,
+    mapear_com_padrao,
+    fatiar_periodo,
+    rotulos_calendario,
+    gerar_dimensao_agentes
 )
+from utils_armazenamento import (
+    ler_dados_consolidados, padronizar_texto, publicar_snapshot_arrow, carregar_snapshot_arrow,
+    caminho_dataset_atual, versao_publicada
+)
+from utils_datatables import (
+    ler_parametros_datatables, aplicar_filtros_colunas, aplicar_busca_global, mascara_busca_global, ordenar_e_paginar,
+    resposta_datatables, mascara_valores, preparar_facetas, contar_facetas, serializar_colunar
+)
+from utils_exportacao import FORMATOS_EXPORTACAO, TABELAS_EXPORTACAO, preparar_tabelas_exportacao, gerar_csv_em_blocos, escrever_exportacao
+from utils_indices import construir_indices_bitmap, salvar_indices_bitmap, carregar_indices_bitmap
+from utils_metricas import (
+    registrar_metrica, incrementar, definir, observar, gerar_exposicao, BUCKETS_BYTES, TIPO_CONTEUDO_METRICAS
+)
+from utils_diagnostico import ler_parametro_debug, ativar_diagnostico, desativar_diagnostico, diagnostico_ativo
+from utils_agregados import (
+    carregar_agregados_diarios, gerar_tabela_desempenho_atendente_agregada, gerar_tendencia_agregada,
+    gerar_agregados_diarios, gerar_reconciliacao_agregada, gerar_nao_mapeados_agregado, aplicar_correcoes_supervisor_agregados,
+    AGREGADOS_RECONCILIACAO
+)
+try:
+    import brotli  # Opcional: sem ele as respostas usam gzip
+except ImportError:
+    brotli = None
 
 log_dir = 'logs'
 if not os.path.exists(log_dir):
@@ -36,76 +70,429 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = config.SECRET_KEY
 
 DF_CACHE = None
-CACHE_FILE = '/tmp/rechamada_cache.pkl'
-CACHE_TIMESTAMP_FILE = '/tmp/rechamada_cache_timestamp'
-logger.info("Aplicação iniciada com cache vazio. Dados serão carregados sob demanda.")
-
-def ensure_data_in_cache():
-    global DF_CACHE
-    # Forçar reload se existe flag especial
-    if os.path.exists('/tmp/force_reload_flag'):
-        DF_CACHE = None
-        try:
-            os.remove('/tmp/force_reload_flag')
-        except (PermissionError, OSError):
-            pass  # Ignorar erros de permissão
-    if DF_CACHE is not None:
-        return
+AGREGADOS_CACHE = None
+# Versão publicada do dataset (stat do manifesto) carregada em DF_CACHE
+VERSAO_CACHE = None
+# Índices bitmap das dimensões de filtro do DF_CACHE (construir_indices_bitmap), trocados junto com ele
+INDICES_CACHE = None
+# Single-flight: no máximo uma recarga por processo; _CACHE_LOCK torna a troca dos três atômica
+_RECARGA_LOCK = threading.Lock()
+_CACHE_LOCK = threading.Lock()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CAMINHO_MANIFESTO = os.path.join(BASE_DIR, config.ARQUIVO_MANIFESTO_DADOS)
+CAMINHO_CORRECOES_SUPERVISOR = os.path.join(BASE_DIR, config.ARQUIVO_CORRECOES_SUPERVISOR)
+# Snapshot Arrow IPC e índices bitmap (.npy) compartilhados entre workers (memory-map, sem cópia privada por processo), um por versão
+PASTA_CACHE_COMPARTILHADO = '/tmp'
+PREFIXO_CACHE_COMPARTILHADO = 'rechamada_cache_'
+# Payloads (JSON já serializado ou DataFrames) por (versão, rota, períodos, filtros), em ordem LRU: chave -> (payloads, bytes)
+_RESULTADOS_CACHE = OrderedDict()
+_RESULTADOS_BYTES = 0
+_RESULTADOS_LOCK = threading.Lock()
+# Exportações em segundo plano: poucas threads, para não disputar CPU com as requisições do dashboard
+PASTA_EXPORTACOES = os.path.join(BASE_DIR, config.PASTA_EXPORTACOES)
+os.makedirs(PASTA_EXPORTACOES, exist_ok=True)
+_EXECUTOR_EXPORTACOES = ThreadPoolExecutor(max_workers=config.EXPORTACAO_MAX_WORKERS, thread_name_prefix='exportacao')
+# Colunas com filtro de cabeçalho na Tabela 2 e chaves dos gráficos de ranking
+COLUNAS_FILTRO_TABELA2 = ['Nome', 'Supervisor', 'Origem', 'Local (Cidade e Estado)', 'DDD', 'MVNO', 'Categoria', 'Tipo de Rechamada', 'Semana', 'Status']
+COLUNAS_RANKING = ['mvno', 'motivo_categoria', 'rechamada_atribuida_nome', 'rechamada_atribuida_supervisor']
+# Compressão das respostas (after_request)
+TIPOS_COMPRIMIVEIS = {'text/html', 'application/json'}
+TAMANHO_MINIMO_COMPRESSAO = 1024
+# Entra no ETag: um deploy (código ou templates novos) não reaproveita páginas em cache do navegador
+_VERSAO_CODIGO = str(max(os.path.getmtime(caminho) for caminho in
+                         glob.glob(os.path.join(BASE_DIR, '*.py')) + glob.glob(os.path.join(BASE_DIR, 'templates', '*'))))
+# Métricas expostas em /metrics (utils_metricas)
+registrar_metrica('rechamada_requisicao_duracao_segundos', 'histogram', 'Latência das requisições por rota, método e status')
+registrar_metrica('rechamada_etapa_duracao_segundos', 'histogram', 'Duração das etapas de geração das tabelas e exportações')
+registrar_metrica('rechamada_cache_resultados_total', 'counter', 'Consultas ao cache de resultados por rota (acerto/falta)')
+registrar_metrica('rechamada_cache_resultados_bytes', 'gauge', 'Tamanho estimado dos resultados em cache')
+registrar_metrica('rechamada_cache_resultados_entradas', 'gauge', 'Entradas no cache de resultados')
+registrar_metrica('rechamada_cache_dados_total', 'counter',
+                  'Acessos ao cache de dados: atual, desatualizado (servido durante a recarga) ou carga (requisição aguardou)')
+registrar_metrica('rechamada_carga_dados_duracao_segundos', 'histogram', 'Duração da preparação de uma versão dos dados',
+                  buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+registrar_metrica('rechamada_cache_dados_linhas', 'gauge', 'Linhas do DF_CACHE')
+registrar_metrica('rechamada_cache_dados_memoria_bytes', 'gauge', 'Memória do DF_CACHE (memory_usage deep)')
+registrar_metrica('rechamada_exportacao_bytes', 'histogram', 'Tamanho dos relatórios exportados por formato e modo', buckets=BUCKETS_BYTES)
+logger.info("Aplicação iniciada. Cache será carregado em segundo plano.")
+
+def _caminho_cache_compartilhado(versao):
+    return os.path.join(PASTA_CACHE_COMPARTILHADO, f"{PREFIXO_CACHE_COMPARTILHADO}{versao}.arrow")
+
+def _caminho_indices_compartilhados(versao):
+    return os.path.join(PASTA_CACHE_COMPARTILHADO, f"{PREFIXO_CACHE_COMPARTILHADO}{versao}.indices.npy")
+
+def _remover_caches_compartilhados_antigos(caminho_atual):
+    # Remove as outras versões do mesmo tipo de arquivo (snapshot .arrow ou índices .indices.npy com as categorias
+    # em .indices.json). Workers que ainda mapeiam uma versão antiga continuam lendo-a até trocar (o inode só some depois)
+    sufixos = ('.indices.npy', '.indices.json') if caminho_atual.endswith('.indices.npy') else ('.arrow',)
+    atual = os.path.splitext(os.path.basename(caminho_atual))[0]
+    for nome in os.listdir(PASTA_CACHE_COMPARTILHADO):
+        if nome.startswith(PREFIXO_CACHE_COMPARTILHADO) and nome.endswith(sufixos) and os.path.splitext(nome)[0] != atual:
+            try:
+                os.remove(os.path.join(PASTA_CACHE_COMPARTILHADO, nome))
+            except OSError:
+                pass
+
+def _versao_dados():
+    """
+    (versão servida, versão do snapshot): a do snapshot é o stat do manifesto; a servida acrescenta o stat
+    do arquivo de correções de supervisor, se houver. Ambas vêm do disco, iguais em todos os workers.
+    """
+    versao_snapshot = versao_publicada(CAMINHO_MANIFESTO)
+    try:
+        stat = os.stat(CAMINHO_CORRECOES_SUPERVISOR)
+    except OSError:
+        return versao_snapshot, versao_snapshot
+    return f"{versao_snapshot}+{stat.st_mtime_ns:x}-{stat.st_size:x}", versao_snapshot
 
-    # Verifica se existe cache compartilhado válido
+def _ler_correcoes_supervisor():
+    """Correções persistidas: {'contador': n, 'correcoes': {l5: supervisor}}"""
+    try:
+        with open(CAMINHO_CORRECOES_SUPERVISOR, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'contador': 0, 'correcoes': {}}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Erro ao ler correções de supervisor: {e}")
+        return {'contador': 0, 'correcoes': {}}
+
+def _gravar_correcoes_supervisor(correcoes):
+    """Acrescenta as correções (L5 -> supervisor) às persistidas e incrementa o contador; troca atômica do arquivo"""
+    atuais = _ler_correcoes_supervisor()
+    dados = {'contador': atuais['contador'] + 1, 'correcoes': {**atuais['correcoes'], **correcoes}}
+    caminho_tmp = f"{CAMINHO_CORRECOES_SUPERVISOR}.{os.getpid()}.tmp"
+    with open(caminho_tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(caminho_tmp, CAMINHO_CORRECOES_SUPERVISOR)
+    return dados
+
+def _aplicar_correcoes_supervisor(df, correcoes):
+    """
+    DataFrame com o supervisor dos L5s corrigidos. Cópia rasa com a coluna supervisor substituída inteira:
+    o DataFrame recebido (mapeado do snapshot Arrow) não é alterado.
+    """
+    if not correcoes or df.empty or 'supervisor' not in df.columns:
+        return df
+    mascara = df['l5_agente'].isin(list(correcoes)).to_numpy()
+    if not mascara.any():
+        return df
+    supervisor = df['supervisor']
+    if isinstance(supervisor.dtype, pd.CategoricalDtype):
+        # Categórica: registra as categorias novas antes de atribuir
+        novas = sorted(set(correcoes.values()) - set(supervisor.cat.categories))
+        supervisor = supervisor.cat.add_categories(novas) if novas else supervisor.copy()
+    else:
+        supervisor = supervisor.copy()
+    supervisor[mascara] = df['l5_agente'][mascara].astype(str).map(correcoes).to_numpy()
+    df_corrigido = df.copy(deep=False)
+    df_corrigido['supervisor'] = supervisor
+    logger.info(f"Correções de supervisor aplicadas: {len(correcoes)} L5s, {int(mascara.sum())} registros")
+    return df_corrigido
+
+def _carregar_agregados(caminho_dataset):
     try:
-        if os.path.exists(CACHE_FILE) and os.path.exists(CACHE_TIMESTAMP_FILE):
-            with open(CACHE_TIMESTAMP_FILE, 'r') as f:
-                cache_timestamp = float(f.read().strip())
-            
-            # Cache válido por 2 horas
-            if time.time() - cache_timestamp < 7200:
-                logger.info("Carregando dados do cache compartilhado...")
-                DF_CACHE = pd.read_pickle(CACHE_FILE)
-                logger.info(f"Cache compartilhado carregado com {len(DF_CACHE)} linhas.")
-                return
+        agregados = carregar_agregados_diarios(
+            caminho_dataset,
+            data_inicio=date(date.today().year, 1, 1)
+        )
+        if agregados:
+            logger.info(f"Agregados diários carregados: {', '.join(f'{nome}={len(df)}' for nome, df in agregados.items())}")
+        return agregados
     except Exception as e:
-        logger.warning(f"Erro ao carregar cache compartilhado: {e}")
+        logger.warning(f"Erro ao carregar agregados diários: {e}")
+        return {}
+
+def _preparar_dados_versao(versao):
+    """
+    Prepara o DataFrame do dashboard para a versão publicada: mapeia o snapshot Arrow da versão
+    se outro worker já o publicou; senão lê o dataset, prepara e publica. Retorna (df, agregados).
+    """
+    caminho_dataset = caminho_dataset_atual(CAMINHO_MANIFESTO)
+    caminho_cache = _caminho_cache_compartilhado(versao)
+    if os.path.exists(caminho_cache):
+        try:
+            logger.info(f"Carregando dados do cache compartilhado (versão {versao})...")
+            df = carregar_snapshot_arrow(caminho_cache)
+            if df['data_hora_contato'].is_monotonic_increasing:
+                logger.info(f"Cache compartilhado carregado com {len(df)} linhas.")
+                return df, _carregar_agregados(caminho_dataset)
+            logger.warning("Cache compartilhado fora de ordem cronológica; será refeito.")
+        except Exception as e:
+            logger.warning(f"Erro ao carregar cache compartilhado: {e}")
 
-    logger.info("Cache vazio. Iniciando carregamento e preparação dos dados (Início do Ano até Hoje)...")
+    logger.info(f"Preparando dados da versão {versao} (Início do Ano até Hoje)...")
     start_load_time = time.time()
-    filepath = os.path.join(os.path.dirname(os.path.abspath(__file__)), config.ARQUIVO_DADOS_CONSOLIDADO)
-    if not os.path.exists(filepath):
-        logger.error(f"Arquivo de dados não encontrado: {filepath}")
-        DF_CACHE = pd.DataFrame()
-        return
+    if not os.path.exists(caminho_dataset):
+        logger.error(f"Arquivo de dados não encontrado: {caminho_dataset}")
+        return pd.DataFrame(), {}
 
+    ano_atual = date.today().year
+    data_limite = datetime(ano_atual, 1, 1)
+    filtros = [('data_hora_contato', '>=', data_limite)]
+    df_principal_temp = ler_dados_consolidados(caminho_dataset, filters=filtros)
+    df_principal_temp['data_hora_contato'] = pd.to_datetime(df_principal_temp['data_hora_contato'], errors='coerce')
+    df_principal_temp.dropna(subset=['data_hora_contato'], inplace=True)
+
+    logger.info("Padronizando colunas de nomes e supervisores...")
+    colunas_para_padronizar = ['nome_agente', 'supervisor']
+    for col in colunas_para_padronizar:
+        if col in df_principal_temp.columns:
+            df_principal_temp[col] = padronizar_texto(df_principal_temp[col])
+
+    df = classificar_tipos_rechamada(df_principal_temp)
+    # Cache ordenado por data_hora_contato: os filtros de período são buscas binárias (fatiar_periodo)
+    df = df.sort_values(['data_hora_contato', 'origem'], kind='stable', ignore_index=True)
+
+    # Publica o cache compartilhado da versão
     try:
-        ano_atual = date.today().year
-        data_limite = datetime(ano_atual, 1, 1)
-        filtros = [('data_hora_contato', '>=', data_limite)]
-        df_principal_temp = pd.read_parquet(filepath, filters=filtros)
-        df_principal_temp['data_hora_contato'] = pd.to_datetime(df_principal_temp['data_hora_contato'], errors='coerce')
-        df_principal_temp.dropna(subset=['data_hora_contato'], inplace=True)
-
-        logger.info("Padronizando colunas de nomes e supervisores...")
-        colunas_para_padronizar = ['nome_agente', 'supervisor']
-        for col in colunas_para_padronizar:
-            if col in df_principal_temp.columns:
-                df_principal_temp[col] = df_principal_temp[col].astype(str).str.strip().str.title()
-        
-        DF_CACHE = classificar_tipos_rechamada(df_principal_temp)
-        
-        # Salva cache compartilhado
+        publicar_snapshot_arrow(df, caminho_cache)
+        # Passa a usar o arquivo mapeado também neste worker (libera a cópia privada)
+        df = carregar_snapshot_arrow(caminho_cache)
+        _remover_caches_compartilhados_antigos(caminho_cache)
+        logger.info("Cache compartilhado salvo com sucesso.")
+    except Exception as e:
+        logger.warning(f"Erro ao salvar cache compartilhado: {e}")
+
+    logger.info(f"Dados preparados em {time.time() - start_load_time:.2f} segundos: {len(df)} linhas.")
+    return df, _carregar_agregados(caminho_dataset)
+
+def _preparar_indices(df):
+    """
+    Índices bitmap do DataFrame da versão (df.attrs['versao']): mapeia os que outro worker já publicou;
+    senão monta, publica e passa a usar o arquivo mapeado, como o snapshot Arrow.
+    """
+    if df.empty or df.attrs.get('versao') is None:
+        return construir_indices_bitmap(df)
+    caminho = _caminho_indices_compartilhados(df.attrs.get('versao'))
+    if os.path.exists(caminho):
         try:
-            DF_CACHE.to_pickle(CACHE_FILE)
-            with open(CACHE_TIMESTAMP_FILE, 'w') as f:
-                f.write(str(time.time()))
-            logger.info("Cache compartilhado salvo com sucesso.")
+            indices = carregar_indices_bitmap(df, caminho)
+            if indices is not None:
+                logger.info("Índices bitmap carregados do cache compartilhado.")
+                return indices
+            logger.warning("Índices compartilhados não correspondem aos dados; serão refeitos.")
         except Exception as e:
-            logger.warning(f"Erro ao salvar cache compartilhado: {e}")
-        
-        logger.info(f"DataFrame principal carregado no cache com {len(DF_CACHE)} linhas.")
-        logger.info(f"Dados preparados e cacheados com sucesso em {time.time() - start_load_time:.2f} segundos.")
+            logger.warning(f"Erro ao carregar índices compartilhados: {e}")
+    indices = construir_indices_bitmap(df)
+    try:
+        salvar_indices_bitmap(indices, caminho)
+        indices = carregar_indices_bitmap(df, caminho) or indices
+        _remover_caches_compartilhados_antigos(caminho)
+    except Exception as e:
+        logger.warning(f"Erro ao salvar índices compartilhados: {e}")
+    return indices
 
+def _recarregar_cache(versao, versao_snapshot):
+    """
+    Prepara a versão (snapshot mais correções de supervisor) e troca o cache de uma vez.
+    Executa com _RECARGA_LOCK adquirido e o libera ao final.
+    """
+    global DF_CACHE, AGREGADOS_CACHE, VERSAO_CACHE, INDICES_CACHE
+    try:
+        inicio_carga = time.time()
+        df_novo, agregados_novos = _preparar_dados_versao(versao_snapshot)
+        correcoes = _ler_correcoes_supervisor()['correcoes']
+        df_novo = _aplicar_correcoes_supervisor(df_novo, correcoes)
+        # Os relatórios somados dos agregados diários (reconciliação, não mapeados) veem as mesmas correções
+        agregados_novos = aplicar_correcoes_supervisor_agregados(agregados_novos, correcoes)
+        observar('rechamada_carga_dados_duracao_segundos', time.time() - inicio_carga)
+        # Versão acompanha o DataFrame: a requisição usa a da cópia que recebeu, mesmo após uma troca
+        df_novo.attrs['versao'] = versao
+        df_novo.attrs['versao_snapshot'] = versao_snapshot
+        try:
+            inicio_indices = time.time()
+            indices_novos = _preparar_indices(df_novo)
+            _registrar_etapa('indices_bitmap', inicio_indices)
+        except Exception as e:
+            # Sem índice os filtros continuam funcionando, por isin
+            logger.warning(f"Erro ao montar índices bitmap: {e}")
+            indices_novos = None
+        with _CACHE_LOCK:
+            DF_CACHE, AGREGADOS_CACHE, VERSAO_CACHE, INDICES_CACHE = df_novo, agregados_novos, versao, indices_novos
+        definir('rechamada_cache_dados_linhas', len(df_novo))
+        definir('rechamada_cache_dados_memoria_bytes', int(df_novo.memory_usage(deep=True).sum()))
+        # Resultados da versão anterior não serão mais pedidos
+        _limpar_resultados()
     except Exception as e:
         logger.critical(f"Erro crítico durante o carregamento dos dados para o cache: {e}", exc_info=True)
-        DF_CACHE = pd.DataFrame()
+        # Mantém a versão anterior, se houver; a próxima requisição tenta de novo
+        with _CACHE_LOCK:
+            if DF_CACHE is None:
+                DF_CACHE = pd.DataFrame()
+    finally:
+        _RECARGA_LOCK.release()
+
+def ensure_data_in_cache():
+    """
+    Retorna (DataFrame, agregados) da versão em cache. A cada requisição faz só o stat do manifesto e o das correções;
+    quando há versão nova publicada, a recarga roda em segundo plano (uma por processo) e a requisição
+    segue com a versão atual. Só sem nenhum dado carregado (início do processo) a requisição aguarda.
+    Os chamadores devem usar o DataFrame retornado, não DF_CACHE: a troca pode ocorrer durante a requisição.
+    Para forçar a recarga, republique o manifesto (ou atualize o seu mtime): todos os workers veem a nova versão.
+    """
+    versao, versao_snapshot = _versao_dados()
+    with _CACHE_LOCK:
+        df_atual, agregados_atuais, versao_atual = DF_CACHE, AGREGADOS_CACHE, VERSAO_CACHE
+    if df_atual is not None and versao == versao_atual:
+        incrementar('rechamada_cache_dados_total', resultado='atual')
+        return df_atual, agregados_atuais
+
+    if df_atual is not None:
+        incrementar('rechamada_cache_dados_total', resultado='desatualizado')
+        # Stale-while-revalidate: serve a versão atual enquanto a próxima é preparada
+        if _RECARGA_LOCK.acquire(blocking=False):
+            logger.info(f"Nova versão dos dados ({versao_atual} → {versao}). Recarregando cache em segundo plano...")
+            threading.Thread(target=_recarregar_cache, args=(versao, versao_snapshot),
+                             name='recarga-cache', daemon=True).start()
+        return df_atual, agregados_atuais
+
+    # Sem dados em memória: aguarda a carga em andamento (single-flight) ou faz a carga
+    incrementar('rechamada_cache_dados_total', resultado='carga')
+    _RECARGA_LOCK.acquire()
+    with _CACHE_LOCK:
+        carregado = DF_CACHE is not None
+    if carregado:
+        _RECARGA_LOCK.release()
+    else:
+        _recarregar_cache(versao, versao_snapshot)
+    with _CACHE_LOCK:
+        return DF_CACHE, AGREGADOS_CACHE
+
+def _carga_inicial():
+    # Aquece o cache ao subir o worker, antes da primeira requisição
+    ensure_data_in_cache()
+
+def _chave_resultado(versao, rota, periodos, filtros=None):
+    """Chave do cache de resultados: versão dos dados, rota, períodos e filtros normalizados (ordem irrelevante)."""
+    filtros_normalizados = tuple(sorted(
+        (coluna, tuple(sorted(str(v) for v in valores))) for coluna, valores in (filtros or {}).items() if valores
+    ))
+    return (versao, rota, tuple(str(p) for p in periodos), filtros_normalizados)
+
+def _obter_resultado(chave):
+    # Com diagnóstico ligado as tabelas são recalculadas, senão não haveria o que registrar
+    if chave[0] is None or diagnostico_ativo():
+        return None
+    with _RESULTADOS_LOCK:
+        entrada = _RESULTADOS_CACHE.get(chave)
+        if entrada is not None:
+            _RESULTADOS_CACHE.move_to_end(chave)
+    incrementar('rechamada_cache_resultados_total', rota=chave[1], resultado='falta' if entrada is None else 'acerto')
+    return None if entrada is None else entrada[0]
+
+def _guardar_resultado(chave, payloads):
+    """Guarda os payloads (JSON serializado ou DataFrames); remove os menos usados quando o total passa de CACHE_RESULTADOS_MAX_BYTES."""
+    global _RESULTADOS_BYTES
+    if chave[0] is None:
+        return
+    tamanho = sum(len(v) if isinstance(v, str) else int(v.memory_usage(deep=True).sum())
+                  for v in payloads.values() if isinstance(v, (str, pd.DataFrame)))
+    if tamanho > config.CACHE_RESULTADOS_MAX_BYTES:
+        return
+    with _RESULTADOS_LOCK:
+        anterior = _RESULTADOS_CACHE.pop(chave, None)
+        if anterior is not None:
+            _RESULTADOS_BYTES -= anterior[1]
+        _RESULTADOS_CACHE[chave] = (payloads, tamanho)
+        _RESULTADOS_BYTES += tamanho
+        while _RESULTADOS_BYTES > config.CACHE_RESULTADOS_MAX_BYTES:
+            _, (_, tamanho_removido) = _RESULTADOS_CACHE.popitem(last=False)
+            _RESULTADOS_BYTES -= tamanho_removido
+
+def _limpar_resultados():
+    global _RESULTADOS_BYTES
+    with _RESULTADOS_LOCK:
+        _RESULTADOS_CACHE.clear()
+        _RESULTADOS_BYTES = 0
+
+def _etag_requisicao(versao):
+    """
+    ETag da resposta: versão dos dados (manifesto e correções, estado em disco: igual em todos os workers),
+    dia (períodos padrão), código e query normalizada
+    """
+    partes = [request.path, str(versao), date.today().isoformat(), _VERSAO_CODIGO,
+              repr(sorted(request.args.items(multi=True)))]
+    return hashlib.sha1('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+def condicional_por_versao(rota):
+    """
+    Responde 304 quando o If-None-Match bate com o ETag da versão servida, antes de qualquer cálculo.
+    ETag fraco: o mesmo conteúdo pode sair em gzip, br ou sem compressão. Só GET/HEAD: POST segue sem validação.
+    """
+    @wraps(rota)
+    def rota_condicional(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return rota(*args, **kwargs)
+        df_cache, _ = ensure_data_in_cache()
+        versao = df_cache.attrs.get('versao')
+        if versao is None or df_cache.empty or diagnostico_ativo():
+            return rota(*args, **kwargs)
+        etag = _etag_requisicao(versao)
+        if request.if_none_match.contains_weak(etag):
+            resposta = Response(status=304)
+        else:
+            resposta = app.make_response(rota(*args, **kwargs))
+            if resposta.status_code != 200:
+                return resposta
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'no-cache'
+        resposta.vary.add('Accept-Encoding')
+        return resposta
+    return rota_condicional
+
+@app.before_request
+def _ligar_diagnostico():
+    """?debug=1 (resumos) ou ?debug=2073,2074 (detalhe desses L5s) liga o diagnóstico das tabelas só nesta requisição"""
+    l5s = ler_parametro_debug(request.args.get('debug'))
+    if l5s is not None:
+        g.token_diagnostico = ativar_diagnostico(l5s)
+
+@app.teardown_request
+def _desligar_diagnostico(_erro):
+    token = g.pop('token_diagnostico', None)
+    if token is not None:
+        desativar_diagnostico(token)
+
+def _registrar_etapa(etapa, inicio):
+    """Observa a duração da etapa desde `inicio` (time.time()) e a devolve, para o log"""
+    duracao = time.time() - inicio
+    observar('rechamada_etapa_duracao_segundos', duracao, etapa=etapa)
+    return duracao
+
+@app.before_request
+def _iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+# Registrado antes da compressão: os after_request rodam em ordem inversa, então a latência inclui a compressão
+@app.after_request
+def _registrar_latencia(response):
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        # Pela regra da rota (não o caminho), para não criar uma série por URL
+        rota = request.url_rule.rule if request.url_rule is not None else 'sem_rota'
+        observar('rechamada_requisicao_duracao_segundos', time.perf_counter() - inicio,
+                 rota=rota, metodo=request.method, status=response.status_code)
+    return response
+
+@app.after_request
+def _comprimir_resposta(response):
+    """Comprime HTML/JSON conforme o Accept-Encoding do navegador (br se disponível, senão gzip)"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in TIPOS_COMPRIMIVEIS):
+        return response
+    response.vary.add('Accept-Encoding')
+    dados = response.get_data()
+    if len(dados) < TAMANHO_MINIMO_COMPRESSAO:
+        return response
+    codificacoes = request.accept_encodings
+    if brotli is not None and codificacoes['br']:
+        response.set_data(brotli.compress(dados, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif codificacoes['gzip']:
+        response.set_data(gzip.compress(dados, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
 
 def _get_date_filters(df, start_date_arg, end_date_arg, default_days_range=6):
     # Cron runs at 6am to pull previous day complete data (00:00-23:59)
@@ -118,11 +505,11 @@ def _get_date_filters(df, start_date_arg, end_date_arg, default_days_range=6):
         return default_start, default_end
 
     # Use yesterday as default end, but don't exceed max date in dataframe
-    max_data_date = df['data_hora_contato'].max().date()
+    max_data_date = df['data_hora_contato'].iloc[-1].date()
     default_end = min(yesterday, max_data_date)
     
     if default_days_range > 360:
-        default_start = df['data_hora_contato'].min().date()
+        default_start = df['data_hora_contato'].iloc[0].date()
     else:
         default_start = default_end - timedelta(days=default_days_range)
 
@@ -138,16 +525,11 @@ def _get_date_filters(df, start_date_arg, end_date_arg, default_days_range=6):
 
 @app.route('/debug-supervisores')
 def debug_supervisores():
-    ensure_data_in_cache()
+    df_cache, _ = ensure_data_in_cache()
 
-    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(DF_CACHE, 'data_inicio', 'data_fim', 6)
-    start_dt_tabelas = datetime.combine(data_inicio_tabelas, datetime.min.time())
-    end_dt_tabelas = datetime.combine(data_fim_tabelas, datetime.max.time())
+    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
 
-    df_filtrado_para_tabelas = DF_CACHE[
-        (DF_CACHE['data_hora_contato'] >= start_dt_tabelas) &
-        (DF_CACHE['data_hora_contato'] <= end_dt_tabelas)
-    ].copy()
+    df_filtrado_para_tabelas = fatiar_periodo(df_cache, data_inicio_tabelas, data_fim_tabelas)
 
     df_rechamadas_no_periodo = df_filtrado_para_tabelas[df_filtrado_para_tabelas['is_rechamada'] == True].copy()
 
@@ -156,8 +538,8 @@ def debug_supervisores():
     name_map = agent_map_df.set_index('l5_agente')['nome_agente']
     supervisor_map = agent_map_df.set_index('l5_agente')['supervisor']
 
-    df_rechamadas_no_periodo['rechamada_atribuida_nome'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(name_map).fillna('Agente Desconhecido')
-    df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(supervisor_map).fillna('Supervisor Não Identificado')
+    df_rechamadas_no_periodo['rechamada_atribuida_nome'] = mapear_com_padrao(df_rechamadas_no_periodo['rechamada_atribuida_l5'], name_map, 'Agente Desconhecido')
+    df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = mapear_com_padrao(df_rechamadas_no_periodo['rechamada_atribuida_l5'], supervisor_map, 'Supervisor Não Identificado')
 
     # VERIFICAÇÃO: Se ainda há 'Supervisor Não Identificado', investigar
     problemas = df_rechamadas_no_periodo[df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] == 'Supervisor Não Identificado']
@@ -181,96 +563,184 @@ def debug_supervisores():
     {debug_info}
     """
 
-@app.route('/')
-@app.route('/dashboard')
-def dashboard():
-    ensure_data_in_cache()
-
-    if DF_CACHE.empty:
-        return render_template('dashboard.html', error_message="Os dados não puderam ser carregados.")
-
-    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(DF_CACHE, 'data_inicio', 'data_fim', 6)
-    start_dt_tabelas = datetime.combine(data_inicio_tabelas, datetime.min.time())
-    end_dt_tabelas = datetime.combine(data_fim_tabelas, datetime.max.time())
-    
+def _gerar_payloads_dashboard(df_cache, agregados_cache, data_inicio_tabelas, data_fim_tabelas, data_inicio_tendencia, data_fim_tendencia):
+    """Calcula a Tabela 1 e a tendência do dashboard e devolve os payloads JSON já serializados."""
     logger.info(f"FILTRO PRINCIPAL: {data_inicio_tabelas} a {data_fim_tabelas}")
     filtro_start = time.time()
-    df_filtrado_para_tabelas = DF_CACHE[
-        (DF_CACHE['data_hora_contato'] >= start_dt_tabelas) &
-        (DF_CACHE['data_hora_contato'] <= end_dt_tabelas)
-    ].copy()
-    logger.info(f"Filtro aplicado em {time.time() - filtro_start:.2f}s - {len(df_filtrado_para_tabelas)} registros")
+    df_filtrado_para_tabelas = fatiar_periodo(df_cache, data_inicio_tabelas, data_fim_tabelas)
+    logger.info(f"Filtro aplicado em {_registrar_etapa('fatiar_periodo', filtro_start):.2f}s - {len(df_filtrado_para_tabelas)} registros")
 
     tabela1_start = time.time()
-    df_tabela1 = gerar_tabela_desempenho_atendente(df_filtrado_para_tabelas, format_output=False)
-    logger.info(f"Tabela1 gerada em {time.time() - tabela1_start:.2f}s")
-    
-    tabela2_start = time.time()
-    df_tabela2 = gerar_tabela_detalhes_rechamadas(df_filtrado_para_tabelas, data_inicio_tabelas, data_fim_tabelas)
-    logger.info(f"Tabela2 gerada em {time.time() - tabela2_start:.2f}s - {len(df_tabela2)} registros")
-    
-    total_records = len(df_tabela2)
-    total_pages = 1  # Sem paginação
-    page = 1  # Sempre página 1
+    dimensao_agentes = _obter_dimensao_agentes(df_cache, data_inicio_tabelas, data_fim_tabelas)
+    # Soma dos agregados diários do pipeline; sem eles, cálculo sobre os registros do período
+    df_tabela1 = gerar_tabela_desempenho_atendente_agregada(agregados_cache, data_inicio_tabelas, data_fim_tabelas, dimensao_agentes) if agregados_cache else None
+    origem_tabela1 = 'agregados diários'
+    if df_tabela1 is None:
+        df_tabela1 = gerar_tabela_desempenho_atendente(df_filtrado_para_tabelas, format_output=False, dimensao_agentes=dimensao_agentes)
+        origem_tabela1 = 'registros'
+    logger.info(f"Tabela1 gerada em {_registrar_etapa('tabela1', tabela1_start):.2f}s (a partir de {origem_tabela1})")
     
     json_start = time.time()
-    tabela1_json = df_tabela1.to_json(orient='records', date_format='iso')
-    tabela2_json = df_tabela2.to_json(orient='records', date_format='iso')
-    logger.info(f"JSON tabelas gerado em {time.time() - json_start:.2f}s")
-    logger.info(f"Tabela1: {len(df_tabela1)} registros, Tabela2: {len(df_tabela2)} registros")
-
-    df_rechamadas_no_periodo = df_filtrado_para_tabelas[df_filtrado_para_tabelas['is_rechamada'] == True].copy()
-    
-    agent_map_df = df_filtrado_para_tabelas.drop_duplicates(subset=['l5_agente'])
-    name_map = agent_map_df.set_index('l5_agente')['nome_agente']
-    supervisor_map = agent_map_df.set_index('l5_agente')['supervisor']
-    
-    df_rechamadas_no_periodo['rechamada_atribuida_nome'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(name_map).fillna('Agente Desconhecido')
-    df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(supervisor_map).fillna('Não Mapeado')
-
-    # SOLUÇÃO HÍBRIDA: Fornece ranking_json_raw SEM LIMITAÇÃO
-    ranking_json_raw = df_rechamadas_no_periodo.to_json(orient='records', date_format='iso')
-    logger.info(f"Fornecendo ranking_data com {len(df_rechamadas_no_periodo)} registros")
-
-    # A variável ranking_json_raw foi removida pois era a causa do problema
-    # --- FIM DA ALTERAÇÃO ---
-
-    ano_atual = date.today().year
-    dias_desde_inicio_do_ano = (date.today() - date(ano_atual, 1, 1)).days
-    data_inicio_tendencia, data_fim_tendencia = _get_date_filters(DF_CACHE, 'data_inicio_tendencia', 'data_fim_tendencia', dias_desde_inicio_do_ano)
-    
-    df_filtrado_tendencia = DF_CACHE[
-        (DF_CACHE['data_hora_contato'].dt.date >= data_inicio_tendencia) &
-        (DF_CACHE['data_hora_contato'].dt.date <= data_fim_tendencia)
-    ]
-
-    if not df_filtrado_tendencia.empty:
+    tabela1_json = serializar_colunar(df_tabela1)
+    logger.info(f"JSON tabela1 gerado em {_registrar_etapa('serializar_tabela1', json_start):.2f}s - {len(df_tabela1)} registros")
+
+    start_time = time.time()
+    # Rechamadas por dia: soma dos agregados diários do pipeline; sem eles, agrupamento dos registros
+    df_dias_tendencia = gerar_tendencia_agregada(agregados_cache, data_inicio_tendencia, data_fim_tendencia) if agregados_cache else None
+    if df_dias_tendencia is None:
+        df_filtrado_tendencia = fatiar_periodo(df_cache, data_inicio_tendencia, data_fim_tendencia)
         logger.info(f"Processando tendências para {len(df_filtrado_tendencia)} registros...")
-        start_time = time.time()
-        df_temp = df_filtrado_tendencia.copy()
-        df_temp = df_temp[df_temp['is_rechamada'] == True]
-        df_temp['dia_label'] = df_temp['data_hora_contato'].dt.strftime('%d/%m')
-        df_temp['semana_label'] = 'S' + df_temp['data_hora_contato'].dt.isocalendar().week.astype(str)
-        df_temp['mes_label'] = df_temp['data_hora_contato'].dt.strftime('%B').str.capitalize()
-        df_temp['dia_sort_key'] = df_temp['data_hora_contato'].dt.date
-        df_temp['semana_sort_key'] = (df_temp['data_hora_contato'].dt.date - pd.to_timedelta(df_temp['data_hora_contato'].dt.weekday, unit='D')).astype(str)
-        df_temp['mes_sort_key'] = df_temp['data_hora_contato'].dt.strftime('%Y-%m')
-        df_agregado = df_temp.groupby(['dia_label', 'semana_label', 'mes_label', 'dia_sort_key', 'semana_sort_key', 'mes_sort_key']).agg(
+        df_temp = df_filtrado_tendencia[df_filtrado_tendencia['is_rechamada'] == True]
+        df_dias_tendencia = df_temp.groupby(df_temp['data_hora_contato'].dt.floor('D').rename('dia')).agg(
             total=('is_rechamada', 'size'),
             com_motivo=('tipo_rechamada', lambda s: (s == 'Com Motivo').sum()),
             sem_motivo=('tipo_rechamada', lambda s: (s == 'Sem Motivo').sum())
         ).reset_index()
-        tendencia_json_agregado = df_agregado.to_json(orient='records', date_format='iso')
-        logger.info(f"Tendências processadas em {time.time() - start_time:.2f}s - {len(df_agregado)} pontos")
+
+    if not df_dias_tendencia.empty:
+        dias = df_dias_tendencia['dia']
+        # Rótulos e chaves de ordenação da dimensão calendário
+        rotulos = rotulos_calendario(dias, ['dia_label', 'semana_label', 'mes_label', 'semana_sort_key', 'mes_sort_key'])
+        df_agregado = pd.DataFrame({
+            'dia_label': rotulos['dia_label'],
+            'semana_label': rotulos['semana_label'],
+            'mes_label': rotulos['mes_label'],
+            'dia_sort_key': dias,
+            'semana_sort_key': rotulos['semana_sort_key'],
+            'mes_sort_key': rotulos['mes_sort_key'],
+            'total': df_dias_tendencia['total'],
+            'com_motivo': df_dias_tendencia['com_motivo'],
+            'sem_motivo': df_dias_tendencia['sem_motivo'],
+        })
+        # Mesma ordem do agrupamento por rótulos usado antes
+        df_agregado = df_agregado.sort_values(['dia_label', 'semana_label', 'mes_label', 'dia_sort_key'], kind='stable').reset_index(drop=True)
+        tendencia_json_agregado = serializar_colunar(df_agregado)
+        logger.info(f"Tendências processadas em {_registrar_etapa('tendencia', start_time):.2f}s - {len(df_agregado)} pontos")
     else:
         tendencia_json_agregado = "[]"
+        _registrar_etapa('tendencia', start_time)
+
+
+    return {
+        'tabela1_json': tabela1_json,
+        'tendencia_json_agregado': tendencia_json_agregado,
+    }
+
+def _gerar_dados_rechamadas(df_cache, data_inicio_tabelas, data_fim_tabelas):
+    """Tabela 2 e base do ranking do período (DataFrames), servidas em páginas por /api/tabela2 e /api/ranking."""
+    df_filtrado_para_tabelas = fatiar_periodo(df_cache, data_inicio_tabelas, data_fim_tabelas)
+    dimensao_agentes = _obter_dimensao_agentes(df_cache, data_inicio_tabelas, data_fim_tabelas)
+
+    tabela2_start = time.time()
+    df_tabela2 = gerar_tabela_detalhes_rechamadas(df_filtrado_para_tabelas, data_inicio_tabelas, data_fim_tabelas, dimensao_agentes=dimensao_agentes)
+    logger.info(f"Tabela2 gerada em {_registrar_etapa('tabela2', tabela2_start):.2f}s - {len(df_tabela2)} registros")
+
+    ranking_start = time.time()
+    df_rechamadas_no_periodo = df_filtrado_para_tabelas[df_filtrado_para_tabelas['is_rechamada'] == True].copy()
+    # Atribuição pela mesma dimensão de agentes das Tabelas 1 e 2
+    df_rechamadas_no_periodo['rechamada_atribuida_nome'] = mapear_com_padrao(df_rechamadas_no_periodo['rechamada_atribuida_l5'], dimensao_agentes['nome_agente'], 'Agente Desconhecido')
+    df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = mapear_com_padrao(df_rechamadas_no_periodo['rechamada_atribuida_l5'], dimensao_agentes['supervisor'], 'Não Mapeado')
+    _registrar_etapa('ranking', ranking_start)
+
+    facetas_start = time.time()
+    df_facetas = preparar_facetas(df_tabela2, COLUNAS_FILTRO_TABELA2)
+    _registrar_etapa('facetas_tabela2', facetas_start)
+    return {
+        'tabela2': df_tabela2,
+        'facetas_tabela2': df_facetas,
+        'ranking': df_rechamadas_no_periodo,
+    }
+
+def _obter_dimensao_agentes(df_cache, data_inicio, data_fim):
+    """Dimensão de agentes (L5 -> nome/supervisor) do período, calculada uma vez por versão e período"""
+    chave = _chave_resultado(df_cache.attrs.get('versao'), 'dimensao_agentes', (data_inicio, data_fim))
+    dados = _obter_resultado(chave)
+    if dados is None:
+        inicio = time.time()
+        dados = {'dimensao': gerar_dimensao_agentes(fatiar_periodo(df_cache, data_inicio, data_fim))}
+        _registrar_etapa('dimensao_agentes', inicio)
+        _guardar_resultado(chave, dados)
+    return dados['dimensao']
+
+def _obter_dados_rechamadas(df_cache, data_inicio_tabelas, data_fim_tabelas):
+    chave = _chave_resultado(df_cache.attrs.get('versao'), 'rechamadas', (data_inicio_tabelas, data_fim_tabelas))
+    dados = _obter_resultado(chave)
+    if dados is None:
+        dados = _gerar_dados_rechamadas(df_cache, data_inicio_tabelas, data_fim_tabelas)
+        _guardar_resultado(chave, dados)
+    return dados
+
+def _obter_indices_filtros(df_cache):
+    """Índices bitmap do snapshot df_cache; None se o cache já foi trocado por outra versão"""
+    with _CACHE_LOCK:
+        indices = INDICES_CACHE
+    if indices is None or indices['versao'] != df_cache.attrs.get('versao'):
+        return None
+    return indices
+
+def _nomes_tabela1():
+    """Nomes visíveis na Tabela 1 (filtro cruzado T1 -> T2), enviados pela página como lista JSON; None se ausente"""
+    try:
+        nomes = json.loads(request.values.get('nomes', 'null'))
+    except ValueError:
+        return None
+    return nomes if isinstance(nomes, list) else None
+
+def _filtrar_tabela2(df_tabela2, parametros, nomes):
+    df_filtrado = aplicar_filtros_colunas(df_tabela2, parametros['filtros_colunas'])
+    if nomes:
+        df_filtrado = df_filtrado[mascara_valores(df_filtrado['Nome'], nomes)]
+    return aplicar_busca_global(df_filtrado, parametros['busca'])
+
+def _resumo_ranking(df_ranking):
+    """Rechamadas (total, com/sem motivo) por chave dos gráficos de ranking, em ordem decrescente de total"""
+    tipo = df_ranking['tipo_rechamada'].astype(object)
+    resumo = {}
+    for coluna in COLUNAS_RANKING:
+        chave = df_ranking[coluna].astype(object)
+        valido = chave.notna() & ~chave.isin(['', 'N/A', 'Agente Desconhecido'])
+        contagem = pd.DataFrame({
+            'chave': chave[valido],
+            'com_motivo': tipo[valido] == 'Com Motivo',
+            'sem_motivo': tipo[valido] == 'Sem Motivo',
+        }).groupby('chave', sort=False).agg(total=('chave', 'size'), com_motivo=('com_motivo', 'sum'), sem_motivo=('sem_motivo', 'sum'))
+        resumo[coluna] = contagem.sort_values('total', ascending=False, kind='stable').reset_index().to_dict(orient='records')
+    return resumo
+
+
+@app.route('/')
+@app.route('/dashboard')
+@condicional_por_versao
+def dashboard():
+    df_cache, agregados_cache = ensure_data_in_cache()
+
+    if df_cache.empty:
+        return render_template('dashboard.html', error_message="Os dados não puderam ser carregados.")
+
+    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
+    
+    ano_atual = date.today().year
+    dias_desde_inicio_do_ano = (date.today() - date(ano_atual, 1, 1)).days
+    data_inicio_tendencia, data_fim_tendencia = _get_date_filters(df_cache, 'data_inicio_tendencia', 'data_fim_tendencia', dias_desde_inicio_do_ano)
+
+    # Mesma versão dos dados e mesmos períodos: payloads já serializados do cache de resultados
+    chave = _chave_resultado(df_cache.attrs.get('versao'), 'dashboard',
+                             (data_inicio_tabelas, data_fim_tabelas, data_inicio_tendencia, data_fim_tendencia))
+    payloads = _obter_resultado(chave)
+    if payloads is None:
+        payloads = _gerar_payloads_dashboard(df_cache, agregados_cache, data_inicio_tabelas, data_fim_tabelas,
+                                             data_inicio_tendencia, data_fim_tendencia)
+        _guardar_resultado(chave, payloads)
+    # Tabela 2 e ranking vão em páginas pela API; aqui só o total (uma linha por rechamada do período),
+    # contado na fatia sem montar a Tabela 2
+    df_periodo = fatiar_periodo(df_cache, data_inicio_tabelas, data_fim_tabelas)
+    total_records = int((df_periodo['is_rechamada'] == True).sum())
+    total_pages = 1  # Sem paginação
+    page = 1  # Sempre página 1
 
     return render_template('dashboard.html',
-                           tabela1_json=tabela1_json,
-                           tabela2_json=tabela2_json,
-                           ranking_json_raw=ranking_json_raw,  # RESTAURADO com limitação segura
-                           
-                           tendencia_json_agregado=tendencia_json_agregado,
+                           tabela1_json=payloads['tabela1_json'],
+                           tendencia_json_agregado=payloads['tendencia_json_agregado'],
                            data_inicio_filtro=data_inicio_tabelas.isoformat(),
                            data_fim_filtro=data_fim_tabelas.isoformat(),
                            data_inicio_tendencia=data_inicio_tendencia.isoformat(),
@@ -280,133 +750,355 @@ def dashboard():
                            total_records=total_records,
                            showing_records=total_records)
 
+@app.route('/api/tabela2', methods=['GET', 'POST'])
+@condicional_por_versao
+def api_tabela2():
+    """Tabela 2 paginada no servidor (protocolo server-side do DataTables)"""
+    df_cache, _ = ensure_data_in_cache()
+    if df_cache.empty:
+        return Response(json.dumps({'error': 'Dados não carregados no servidor.'}), status=503, mimetype='application/json')
+
+    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
+    parametros = ler_parametros_datatables(request.values)
+    df_tabela2 = _obter_dados_rechamadas(df_cache, data_inicio_tabelas, data_fim_tabelas)['tabela2']
+    df_filtrado = _filtrar_tabela2(df_tabela2, parametros, _nomes_tabela1())
+    df_pagina = ordenar_e_paginar(df_filtrado, parametros['ordem'], parametros['inicio'], parametros['tamanho'])
+    return Response(resposta_datatables(parametros['draw'], len(df_tabela2), len(df_filtrado), df_pagina,
+                                        formato=request.values.get('formato', 'registros')),
+                    mimetype='application/json')
+
+@app.route('/api/facetas', methods=['GET', 'POST'])
+@condicional_por_versao
+def api_facetas():
+    """
+    Opções dos filtros de cabeçalho da Tabela 2: valores distintos e contagens por faceta no período,
+    sob os filtros ativos (mesmos parâmetros enviados a /api/tabela2).
+    """
+    df_cache, _ = ensure_data_in_cache()
+    if df_cache.empty:
+        return Response(json.dumps({'error': 'Dados não carregados no servidor.'}), status=503, mimetype='application/json')
+
+    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
+    parametros = ler_parametros_datatables(request.values)
+    dados = _obter_dados_rechamadas(df_cache, data_inicio_tabelas, data_fim_tabelas)
+    df_tabela2 = dados['tabela2']
+
+    # Nomes da Tabela 1 e busca global restringem todas as facetas; os filtros de coluna, as demais
+    mascara_base = pd.Series(True, index=df_tabela2.index)
+    nomes = _nomes_tabela1()
+    if nomes:
+        mascara_base &= mascara_valores(df_tabela2['Nome'], nomes)
+    if parametros['busca']:
+        mascara_base &= mascara_busca_global(df_tabela2, parametros['busca'])
+
+    facetas = contar_facetas(dados['facetas_tabela2'], parametros['filtros_colunas'], mascara_base)
+    return Response(json.dumps({'facetas': facetas}, ensure_ascii=False), mimetype='application/json')
+
+@app.route('/api/ranking', methods=['GET', 'POST'])
+@condicional_por_versao
+def api_ranking():
+    """
+    Rechamadas do ranking restritas ao que está visível nas tabelas: nomes da Tabela 1 e MVNO/categoria/tipo
+    visíveis na Tabela 2 (mesmos parâmetros enviados a /api/tabela2). Devolve o resumo dos gráficos e,
+    se length > 0, a página de registros.
+    """
+    df_cache, _ = ensure_data_in_cache()
+    if df_cache.empty:
+        return Response(json.dumps({'error': 'Dados não carregados no servidor.'}), status=503, mimetype='application/json')
+
+    data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
+    parametros = ler_parametros_datatables(request.values)
+    nomes = _nomes_tabela1()
+    dados = _obter_dados_rechamadas(df_cache, data_inicio_tabelas, data_fim_tabelas)
+    df_tabela2 = _filtrar_tabela2(dados['tabela2'], parametros, nomes)
+
+    df_ranking = dados['ranking']
+    visivel = (mascara_valores(df_ranking['mvno'], df_tabela2['MVNO'].dropna().unique()) &
+               mascara_valores(df_ranking['motivo_categoria'], df_tabela2['Categoria'].dropna().unique()) &
+               mascara_valores(df_ranking['tipo_rechamada'], df_tabela2['Tipo de Rechamada'].dropna().unique()))
+    if nomes is not None:
+        visivel &= mascara_valores(df_ranking['rechamada_atribuida_nome'], nomes)
+    df_visivel = df_ranking[visivel]
+
+    df_pagina = df_visivel.iloc[parametros['inicio']:parametros['inicio'] + parametros['tamanho']]
+    return Response(resposta_datatables(parametros['draw'], len(df_ranking), len(df_visivel), df_pagina,
+                                        {'resumo': _resumo_ranking(df_visivel)}, formato=request.values.get('formato', 'registros')),
+                    mimetype='application/json')
+
+# Mapeia os nomes das colunas do frontend para o backend
+MAPEAMENTO_FILTROS_EXPORTACAO = {
+    'Nome': 'nome_agente',
+    'Supervisor': 'supervisor',
+    'L5': 'l5_agente',
+    'Origem': 'origem',
+    'Local (Cidade e Estado)': 'local',
+    'DDD': 'ddd',
+    'MVNO': 'mvno',
+    'Categoria': 'motivo_categoria',
+    'Tipo de Rechamada': 'tipo_rechamada',
+    'Status': 'status_ligacao',
+    'Semana': 'semana',
+    'Tempo de Atendimento': 'tempo_atendimento'
+}
+
+def _ler_filtros_exportacao():
+    """Filtros do corpo JSON (POST) já com os nomes das colunas do backend"""
+    filtros_adicionais = {}
+    if request.method != 'POST':
+        logger.info("EXPORTAR - Nenhum filtro recebido (GET request)")
+        return filtros_adicionais
+    filtros_json = request.get_json(silent=True) or {}
+    for filtro_frontend, valores in filtros_json.items():
+        if filtro_frontend in MAPEAMENTO_FILTROS_EXPORTACAO and valores:
+            filtros_adicionais[MAPEAMENTO_FILTROS_EXPORTACAO[filtro_frontend]] = valores
+
+    logger.info(f"EXPORTAR - Filtros JSON recebidos: {filtros_json}")
+    logger.info(f"EXPORTAR - Filtros adicionais mapeados: {filtros_adicionais}")
+    logger.info(f"EXPORTAR - Total filtros aplicados: {len(filtros_adicionais)}")
+    return filtros_adicionais
+
+def _ler_formato_exportacao():
+    """(formato, tabela) da query string; None se inválidos"""
+    formato = request.args.get('formato', 'xlsx').lower()
+    tabela = request.args.get('tabela', 'detalhes').lower()
+    if formato not in FORMATOS_EXPORTACAO or tabela not in TABELAS_EXPORTACAO:
+        return None
+    return formato, tabela
+
+def _nome_arquivo_exportacao(formato, tabela):
+    sufixo = '' if formato == 'xlsx' else f"_{tabela.capitalize()}"
+    return f"Relatorio_Completo{sufixo}_{date.today().strftime('%Y%m%d')}.{FORMATOS_EXPORTACAO[formato][1]}"
+
+def _gerar_tabelas_exportacao(df_cache, data_inicio_export, data_fim_export, filtros_adicionais):
+    # IMPORTANTE: Usar EXATAMENTE os mesmos datasets que o dashboard usa
+    logger.info(f"EXPORTAR - FILTRO: {data_inicio_export} a {data_fim_export}")
+    df_filtrado_raw = fatiar_periodo(df_cache, data_inicio_export, data_fim_export)
+    logger.info(f"EXPORTAR - Gerando tabelas com {len(df_filtrado_raw)} registros base")
+
+    # Gera dados brutos com os MESMOS dados, filtros e dimensão de agentes que o dashboard
+    dimensao_agentes = _obter_dimensao_agentes(df_cache, data_inicio_export, data_fim_export)
+    indices_filtros = _obter_indices_filtros(df_cache)
+    inicio = time.time()
+    df_tabela1_bruto = gerar_tabela_desempenho_atendente(df_filtrado_raw, filtros_adicionais=filtros_adicionais, dimensao_agentes=dimensao_agentes,
+                                                         indices_filtros=indices_filtros)
+    _registrar_etapa('exportacao_tabela1', inicio)
+    inicio = time.time()
+    df_tabela2_bruto = gerar_tabela_detalhes_rechamadas(df_filtrado_raw, data_inicio_export, data_fim_export, filtros_adicionais=filtros_adicionais,
+                                                        dimensao_agentes=dimensao_agentes, indices_filtros=indices_filtros)
+    _registrar_etapa('exportacao_tabela2', inicio)
+    return df_tabela1_bruto, df_tabela2_bruto
+
 @app.route('/exportar-tudo', methods=['GET', 'POST'])
+@condicional_por_versao
 def exportar_tudo():
     logger.info("Requisição para exportar todas as tabelas recebida.")
-    ensure_data_in_cache()
-    if DF_CACHE.empty:
+    df_cache, _ = ensure_data_in_cache()
+    if df_cache.empty:
         return "Erro: dados não carregados no servidor.", 400
 
+    # xlsx (padrão, as duas abas), csv ou parquet (uma tabela: ?tabela=detalhes|desempenho)
+    formato_tabela = _ler_formato_exportacao()
+    if formato_tabela is None:
+        return "Formato ou tabela de exportação inválidos.", 400
+    formato, tabela = formato_tabela
+
     # USAR EXATAMENTE AS MESMAS VARIÁVEIS E LÓGICA QUE O DASHBOARD
-    data_inicio_export, data_fim_export = _get_date_filters(DF_CACHE, 'data_inicio', 'data_fim', 6)
-    start_dt_export = datetime.combine(data_inicio_export, datetime.min.time())
-    end_dt_export = datetime.combine(data_fim_export, datetime.max.time())
-    
-    logger.info(f"EXPORTAR - FILTRO: {data_inicio_export} a {data_fim_export}")
-    df_filtrado_raw = DF_CACHE[(DF_CACHE['data_hora_contato'] >= start_dt_export) & (DF_CACHE['data_hora_contato'] <= end_dt_export)]
-    logger.info(f"EXPORTAR - Dataset filtrado: {len(df_filtrado_raw)} registros")
-    
-    # Processa filtros adicionais se enviados via POST
-    filtros_adicionais = {}
-    if request.method == 'POST':
-        filtros_json = request.json or {}
-
-        # Mapeia os nomes das colunas do frontend para o backend
-        mapeamento_colunas = {
-            'Nome': 'nome_agente',
-            'Supervisor': 'supervisor',
-            'L5': 'l5_agente',
-            'Origem': 'origem',
-            'Local (Cidade e Estado)': 'local',
-            'DDD': 'ddd',
-            'MVNO': 'mvno',
-            'Categoria': 'motivo_categoria',
-            'Tipo de Rechamada': 'tipo_rechamada',
-            'Status': 'status_ligacao',
-            'Semana': 'semana',
-            'Tempo de Atendimento': 'tempo_atendimento'
-        }
+    data_inicio_export, data_fim_export = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
+    filtros_adicionais = _ler_filtros_exportacao()
+    df_tabela1_bruto, df_tabela2_bruto = _gerar_tabelas_exportacao(df_cache, data_inicio_export, data_fim_export, filtros_adicionais)
 
-        for filtro_frontend, valores in filtros_json.items():
-            if filtro_frontend in mapeamento_colunas and valores:
-                coluna_backend = mapeamento_colunas[filtro_frontend]
-                filtros_adicionais[coluna_backend] = valores
+    mimetype, extensao = FORMATOS_EXPORTACAO[formato]
+    filename = _nome_arquivo_exportacao(formato, tabela)
 
-        logger.info(f"EXPORTAR - Filtros JSON recebidos: {filtros_json}")
-        logger.info(f"EXPORTAR - Filtros adicionais mapeados: {filtros_adicionais}")
-        logger.info(f"EXPORTAR - Total filtros aplicados: {len(filtros_adicionais)}")
-    else:
-        logger.info("EXPORTAR - Nenhum filtro recebido (GET request)")
-    
-    # IMPORTANTE: Usar EXATAMENTE os mesmos datasets que o dashboard usa
-    # O df_filtrado_raw já foi criado com as datas corretas acima
-    logger.info(f"EXPORTAR - Gerando tabelas com {len(df_filtrado_raw)} registros base")
-    
-    # Gera dados brutos com os MESMOS dados e filtros que o dashboard
-    df_tabela1_bruto = gerar_tabela_desempenho_atendente(df_filtrado_raw, filtros_adicionais=filtros_adicionais)
-    df_tabela2_bruto = gerar_tabela_detalhes_rechamadas(df_filtrado_raw, data_inicio_export, data_fim_export, filtros_adicionais=filtros_adicionais)
-
-    # FORMATA TABELA 1 IGUAL AO FRONTEND (11 colunas)
-    def format_seconds(seconds):
-        if pd.isna(seconds):
-            return '00:00:00'
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        return f'{hours:02d}:{minutes:02d}:{secs:02d}'
-    
-    def format_percent(value):
-        if pd.isna(value):
-            return '0,0%'
-        return f'{(value * 100):.1f}%'.replace('.', ',')
-
-    df_tabela1_formatado = df_tabela1_bruto.copy()
-    df_tabela1_formatado['Média de Ligação'] = df_tabela1_formatado['Média de Ligação'].apply(format_seconds)
-    df_tabela1_formatado['% com Motivo'] = df_tabela1_formatado['perc_com_motivo'].apply(format_percent)
-    df_tabela1_formatado['% sem Motivo'] = df_tabela1_formatado['perc_sem_motivo'].apply(format_percent)
-    df_tabela1_formatado['% Total'] = df_tabela1_formatado['perc_total'].apply(format_percent)
-    
-    # Remove colunas brutas e reordena igual ao frontend
-    df_tabela1_final = df_tabela1_formatado[[
-        'Nome', 'L5', 'Supervisor', 'Média de Ligação', 'Contagem de Ligações',
-        'Rechamada com Motivo', 'Rechamada sem Motivo', 'Rechamada Total',
-        '% com Motivo', '% sem Motivo', '% Total'
-    ]]
-
-    # FORMATA TABELA 2 IGUAL AO FRONTEND 
-    def format_datetime(dt_value):
-        if pd.isna(dt_value):
-            return ''
+    try:
+        if formato == 'csv':
+            # CSV sai direto do gerador, em blocos: o primeiro byte vai antes do arquivo inteiro estar pronto
+            df_exportar = preparar_tabelas_exportacao(df_tabela1_bruto, df_tabela2_bruto)[TABELAS_EXPORTACAO[tabela]]
+            logger.info(f"Enviando CSV '{filename}' em streaming ({len(df_exportar)} linhas).")
+            return Response(_contar_bytes_exportacao(gerar_csv_em_blocos(df_exportar), formato), mimetype=mimetype,
+                            headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+        # xlsx/parquet precisam do arquivo fechado (zip/rodapé): grava em disco em modo write-only e envia
+        # o arquivo em blocos, sem manter o relatório inteiro em memória
+        descritor, caminho_temp = tempfile.mkstemp(prefix='exportacao_', suffix=f'.{extensao}')
+        os.close(descritor)
         try:
-            if isinstance(dt_value, str):
-                dt = pd.to_datetime(dt_value)
-            else:
-                dt = dt_value
-            return dt.strftime('%d/%m/%Y %H:%M:%S')
-        except:
-            return str(dt_value)
-
-    df_tabela2_formatado = df_tabela2_bruto.copy()
-    df_tabela2_formatado['Data/Hora da Chamada Original'] = df_tabela2_formatado['Data/Hora da Chamada Original'].apply(format_datetime)
-    df_tabela2_formatado['Data/Hora da Rechamada'] = df_tabela2_formatado['Data/Hora da Rechamada'].apply(format_datetime)
-    
-    # 13 colunas exatamente iguais ao frontend
-    colunas_tabela2_frontend = [
-        'Nome', 'Supervisor', 'Origem', 'DDD', 'Local (Cidade e Estado)', 'MVNO', 'Categoria',
-        'Tipo de Rechamada', 'Semana', 'Tempo de Atendimento', 'Data/Hora da Chamada Original', 
-        'Data/Hora da Rechamada', 'Status'
-    ]
-    df_tabela2_final = df_tabela2_formatado[[col for col in colunas_tabela2_frontend if col in df_tabela2_formatado.columns]]
+            inicio_escrita = time.time()
+            escrever_exportacao(caminho_temp, formato, df_tabela1_bruto, df_tabela2_bruto, tabela=tabela)
+            _registrar_etapa('exportacao_escrita', inicio_escrita)
+            arquivo = open(caminho_temp, 'rb')
+        finally:
+            # O arquivo aberto continua legível até a resposta terminar; nada fica para trás em /tmp
+            os.remove(caminho_temp)
+        tamanho = os.fstat(arquivo.fileno()).st_size
+        observar('rechamada_exportacao_bytes', tamanho, formato=formato, modo='sincrona')
+        logger.info(f"Enviando arquivo '{filename}' ({tamanho} bytes) para download.")
+        return send_file(arquivo, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+    except Exception as e:
+        logger.error(f"Falha ao gerar o arquivo de exportação: {e}", exc_info=True)
+        return "Ocorreu um erro ao gerar o relatório.", 500
+
+def _contar_bytes_exportacao(blocos, formato):
+    """Repassa os blocos do CSV em streaming e registra o tamanho total ao terminar o envio"""
+    total = 0
+    for bloco in blocos:
+        total += len(bloco)
+        yield bloco
+    observar('rechamada_exportacao_bytes', total, formato=formato, modo='sincrona')
+
+# --- Exportações em segundo plano ---
+# Cada job é um arquivo de status <id>.json (mais o resultado <id>.<ext>) em PASTA_EXPORTACOES: qualquer
+# worker responde ao polling e ao download. O id é o hash de (versão, período, filtros, formato), então
+# pedidos iguais caem no mesmo job em vez de gerar o relatório de novo.
+
+def _caminho_exportacao(job_id, extensao='json'):
+    return os.path.join(PASTA_EXPORTACOES, f"{job_id}.{extensao}")
+
+def _id_exportacao(versao, data_inicio, data_fim, filtros, formato, tabela):
+    chave = _chave_resultado(versao, 'exportacao', (data_inicio, data_fim, formato, tabela), filtros)
+    return hashlib.sha1(repr(chave).encode('utf-8')).hexdigest()[:20]
 
+def _ler_status_exportacao(job_id):
     try:
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_tabela1_final.to_excel(writer, sheet_name='Desempenho por Agente', index=False)
-            df_tabela2_final.to_excel(writer, sheet_name='Detalhes de Rechamadas', index=False)
-        output.seek(0)
-
-        filename = f"Relatorio_Completo_{date.today().strftime('%Y%m%d')}.xlsx"
-        logger.info(f"Enviando arquivo Excel '{filename}' para download.")
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        with open(_caminho_exportacao(job_id), encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def _gravar_status_exportacao(status):
+    """Grava o status atomicamente (temporário + os.replace): o polling nunca lê um JSON parcial"""
+    status['atualizado_em'] = time.time()
+    caminho = _caminho_exportacao(status['id'])
+    caminho_tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(caminho_tmp, 'w', encoding='utf-8') as arquivo:
+        json.dump(status, arquivo, ensure_ascii=False)
+    os.replace(caminho_tmp, caminho)
+
+def _limpar_exportacoes_expiradas():
+    """Remove status, resultados e temporários sem atualização há mais de EXPORTACAO_TTL_SEGUNDOS"""
+    limite = time.time() - config.EXPORTACAO_TTL_SEGUNDOS
+    for nome in os.listdir(PASTA_EXPORTACOES):
+        caminho = os.path.join(PASTA_EXPORTACOES, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+def _reivindicar_exportacao(status):
+    """Cria o status do job se ainda não existir (O_EXCL, vale entre workers). False se outro pedido já criou."""
+    try:
+        descritor = os.open(_caminho_exportacao(status['id']), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(descritor)
+    _gravar_status_exportacao(status)
+    return True
+
+def _executar_exportacao(job_id, df_cache, data_inicio_export, data_fim_export, filtros_adicionais, formato, tabela):
+    status = _ler_status_exportacao(job_id) or {'id': job_id}
+    ultima_gravacao = [0.0]
+
+    def atualizar(progresso, forcar=False):
+        # No máximo uma gravação por segundo durante a escrita
+        agora = time.time()
+        if forcar or agora - ultima_gravacao[0] >= 1:
+            ultima_gravacao[0] = agora
+            status['progresso'] = round(progresso, 3)
+            _gravar_status_exportacao(status)
 
+    try:
+        status['status'] = 'processando'
+        atualizar(0.0, forcar=True)
+        df_tabela1_bruto, df_tabela2_bruto = _gerar_tabelas_exportacao(df_cache, data_inicio_export, data_fim_export, filtros_adicionais)
+        atualizar(0.3, forcar=True)
+
+        caminho_final = _caminho_exportacao(job_id, FORMATOS_EXPORTACAO[formato][1])
+        caminho_tmp = f"{caminho_final}.{os.getpid()}.tmp"
+        inicio_escrita = time.time()
+        escrever_exportacao(caminho_tmp, formato, df_tabela1_bruto, df_tabela2_bruto, tabela=tabela,
+                            progresso=lambda fracao: atualizar(0.3 + 0.7 * fracao))
+        _registrar_etapa('exportacao_escrita', inicio_escrita)
+        os.replace(caminho_tmp, caminho_final)
+
+        status.update({'status': 'concluido', 'tamanho_bytes': os.path.getsize(caminho_final)})
+        observar('rechamada_exportacao_bytes', status['tamanho_bytes'], formato=formato, modo='segundo_plano')
+        atualizar(1.0, forcar=True)
+        logger.info(f"EXPORTAR - Job {job_id} concluído ({status['tamanho_bytes']} bytes)")
     except Exception as e:
-        logger.error(f"Falha ao gerar o arquivo Excel completo: {e}", exc_info=True)
-        return "Ocorreu um erro ao gerar o relatório.", 500
+        logger.error(f"EXPORTAR - Falha no job {job_id}: {e}", exc_info=True)
+        status.update({'status': 'erro', 'erro': str(e)})
+        _gravar_status_exportacao(status)
+
+def _resposta_status_exportacao(status, codigo=200):
+    corpo = dict(status)
+    corpo['url_status'] = f"/exportacoes/{status['id']}"
+    if status.get('status') == 'concluido':
+        corpo['url_download'] = f"/exportacoes/{status['id']}/arquivo"
+    return Response(json.dumps(corpo, ensure_ascii=False), status=codigo, mimetype='application/json')
+
+@app.route('/exportacoes', methods=['POST'])
+def criar_exportacao():
+    """Enfileira a exportação (mesmos parâmetros de /exportar-tudo) e devolve o id para acompanhar o progresso"""
+    df_cache, _ = ensure_data_in_cache()
+    if df_cache.empty:
+        return "Erro: dados não carregados no servidor.", 400
+    formato_tabela = _ler_formato_exportacao()
+    if formato_tabela is None:
+        return "Formato ou tabela de exportação inválidos.", 400
+    formato, tabela = formato_tabela
+
+    data_inicio_export, data_fim_export = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
+    filtros_adicionais = _ler_filtros_exportacao()
+    _limpar_exportacoes_expiradas()
+
+    job_id = _id_exportacao(df_cache.attrs.get('versao'), data_inicio_export, data_fim_export, filtros_adicionais, formato, tabela)
+    status = {
+        'id': job_id, 'status': 'na_fila', 'progresso': 0.0, 'formato': formato, 'tabela': tabela,
+        'nome_arquivo': _nome_arquivo_exportacao(formato, tabela),
+        'data_inicio': str(data_inicio_export), 'data_fim': str(data_fim_export), 'criado_em': time.time(),
+    }
+    for _ in range(2):
+        if _reivindicar_exportacao(status):
+            _EXECUTOR_EXPORTACOES.submit(_executar_exportacao, job_id, df_cache, data_inicio_export, data_fim_export,
+                                         filtros_adicionais, formato, tabela)
+            logger.info(f"EXPORTAR - Job {job_id} enfileirado ({formato}, {data_inicio_export} a {data_fim_export})")
+            return _resposta_status_exportacao(status, 202)
+
+        existente = _ler_status_exportacao(job_id)
+        if existente is None:
+            continue
+        concluido_sem_arquivo = existente.get('status') == 'concluido' and not os.path.exists(
+            _caminho_exportacao(job_id, FORMATOS_EXPORTACAO[formato][1]))
+        if existente.get('status') != 'erro' and not concluido_sem_arquivo:
+            # Pedido idêntico em andamento ou pronto: reaproveita o mesmo job
+            logger.info(f"EXPORTAR - Job {job_id} reaproveitado ({existente.get('status')})")
+            return _resposta_status_exportacao(existente, 202 if existente.get('status') != 'concluido' else 200)
+        # Falhou ou o arquivo expirou: descarta o status e tenta de novo
+        try:
+            os.remove(_caminho_exportacao(job_id))
+        except FileNotFoundError:
+            pass
+    return "Não foi possível enfileirar a exportação.", 503
+
+@app.route('/exportacoes/<job_id>')
+def status_exportacao(job_id):
+    status = _ler_status_exportacao(job_id) if job_id.isalnum() else None
+    if status is None:
+        return Response(json.dumps({'id': job_id, 'status': 'inexistente'}), status=404, mimetype='application/json')
+    return _resposta_status_exportacao(status)
+
+@app.route('/exportacoes/<job_id>/arquivo')
+def baixar_exportacao(job_id):
+    status = _ler_status_exportacao(job_id) if job_id.isalnum() else None
+    if status is None or status.get('status') != 'concluido':
+        return "Exportação inexistente, expirada ou ainda em andamento.", 404
+    mimetype, extensao = FORMATOS_EXPORTACAO[status['formato']]
+    caminho = _caminho_exportacao(job_id, extensao)
+    if not os.path.exists(caminho):
+        return "Exportação expirada.", 404
+    return send_file(caminho, mimetype=mimetype, as_attachment=True, download_name=status['nome_arquivo'])
 
 @app.route('/corrigir-mapeamento-l5s')
 def corrigir_mapeamento_l5s():
@@ -425,44 +1117,34 @@ def corrigir_mapeamento_l5s():
     }
 
     try:
-        # Forçar reload do cache
-        global DF_CACHE
-        DF_CACHE = None
-        ensure_data_in_cache()
-
-        if DF_CACHE.empty:
+        # Correções persistidas: mudam a versão servida em todos os workers (os outros recarregam em segundo plano)
+        _gravar_correcoes_supervisor(correção_l5s)
+        versao, versao_snapshot = _versao_dados()
+        # Neste worker a troca é feita já, pela mesma recarga (cópia corrigida do snapshot mapeado, troca sob lock);
+        # as requisições em andamento seguem com o DataFrame que receberam
+        _RECARGA_LOCK.acquire()
+        _recarregar_cache(versao, versao_snapshot)
+        df_cache, _ = ensure_data_in_cache()
+
+        if df_cache.empty:
             return "<h2>Erro: Cache vazio</h2>"
 
-        # Aplicar correções diretamente no cache
-        correções_aplicadas = 0
-        for l5, supervisor_correto in correção_l5s.items():
-            mask = DF_CACHE['l5_agente'] == l5
-            registros_encontrados = mask.sum()
-
-            if registros_encontrados > 0:
-                # Aplicar correção
-                DF_CACHE.loc[mask, 'supervisor'] = supervisor_correto
-                correções_aplicadas += 1
+        correções_aplicadas = df_cache.loc[df_cache['l5_agente'].isin(list(correção_l5s)), 'l5_agente'].nunique()
 
         # Verificar resultado
         resultado = {"timestamp": datetime.now().isoformat(), "correções": {}}
 
         # Testar com período padrão
-        data_inicio_tabelas, data_fim_tabelas = _get_date_filters(DF_CACHE, 'data_inicio', 'data_fim', 6)
-        start_dt_tabelas = datetime.combine(data_inicio_tabelas, datetime.min.time())
-        end_dt_tabelas = datetime.combine(data_fim_tabelas, datetime.max.time())
+        data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
 
-        df_filtrado_para_tabelas = DF_CACHE[
-            (DF_CACHE['data_hora_contato'] >= start_dt_tabelas) &
-            (DF_CACHE['data_hora_contato'] <= end_dt_tabelas)
-        ].copy()
+        df_filtrado_para_tabelas = fatiar_periodo(df_cache, data_inicio_tabelas, data_fim_tabelas)
 
         df_rechamadas_no_periodo = df_filtrado_para_tabelas[df_filtrado_para_tabelas['is_rechamada'] == True].copy()
 
         agent_map_df = df_filtrado_para_tabelas.drop_duplicates(subset=['l5_agente'])
         supervisor_map = agent_map_df.set_index('l5_agente')['supervisor']
 
-        df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(supervisor_map).fillna('Não Mapeado')
+        df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = mapear_com_padrao(df_rechamadas_no_periodo['rechamada_atribuida_l5'], supervisor_map, 'Não Mapeado')
 
         supervisores_resultado = sorted(df_rechamadas_no_periodo['rechamada_atribuida_supervisor'].unique())
         nao_mapeados_restantes = df_rechamadas_no_periodo[df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] == 'Não Mapeado']
@@ -506,52 +1188,29 @@ def corrigir_mapeamento_l5s():
 @app.route('/validar-contagem')
 def validar_contagem():
     """Endpoint de validação técnica para confirmar contagens com o cliente"""
-    ensure_data_in_cache()
+    df_cache, agregados_cache = ensure_data_in_cache()
 
-    if DF_CACHE.empty:
+    if df_cache.empty:
         return "<h2>Erro: Cache vazio</h2>"
 
     try:
         # Usar mesmo período do dashboard
-        data_inicio, data_fim = _get_date_filters(DF_CACHE, 'data_inicio', 'data_fim', 6)
-        start_dt = datetime.combine(data_inicio, datetime.min.time())
-        end_dt = datetime.combine(data_fim, datetime.max.time())
-
-        # Aplicar filtro de período
-        df_periodo = DF_CACHE[
-            (DF_CACHE['data_hora_contato'] >= start_dt) &
-            (DF_CACHE['data_hora_contato'] <= end_dt)
-        ].copy()
+        data_inicio, data_fim = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
 
-        # ESTATÍSTICAS GERAIS
-        total_cache = len(DF_CACHE)
-        total_periodo = len(df_periodo)
+        # ESTATÍSTICAS GERAIS: somadas dos fatos diários de reconciliação do pipeline
+        fatos = gerar_reconciliacao_agregada(_agregados_reconciliacao(df_cache, agregados_cache, data_inicio, data_fim), data_inicio, data_fim)
+        total_cache = len(df_cache)
+        total_periodo = fatos['total_periodo']
 
         # CONTAGEM POR AGENTE (igual à Tabela 1)
-        contagem_por_agente = df_periodo.groupby(['l5_agente', 'nome_agente']).agg(
-            total_ligacoes=('protocolo', 'count'),
-            total_registros=('protocolo', 'size')  # Inclui NULL
-        ).reset_index()
-
-        total_ligacoes_protocolos = contagem_por_agente['total_ligacoes'].sum()
-        total_registros_completo = contagem_por_agente['total_registros'].sum()
-
-        # MVNOs no período
-        mvnos_encontradas = df_periodo['mvno'].value_counts().to_dict()
-
-        # Rechamadas
-        total_rechamadas = len(df_periodo[df_periodo['is_rechamada'] == True])
+        total_ligacoes_protocolos = fatos['total_ligacoes_agentes']
+        total_registros_completo = fatos['total_registros_agentes']
 
-        # Status de ligações
-        status_counts = df_periodo['status_ligacao'].value_counts().to_dict()
-
-        # Registros sem protocolo
-        sem_protocolo = len(df_periodo[df_periodo['protocolo'].isna()])
-
-        # TOP 10 agentes com mais ligações
-        top_10_agentes = contagem_por_agente.nlargest(10, 'total_ligacoes')[
-            ['nome_agente', 'l5_agente', 'total_ligacoes']
-        ].to_dict('records')
+        mvnos_encontradas = fatos['mvnos']
+        total_rechamadas = fatos['total_rechamadas']
+        status_counts = fatos['status']
+        sem_protocolo = fatos['sem_protocolo']
+        top_10_agentes = fatos['top_agentes']
 
         html = f"""
         <html>
@@ -685,78 +1344,54 @@ def validar_contagem():
         logger.error(f"Erro no endpoint de validação: {e}", exc_info=True)
         return f"<h2>Erro na validação</h2><pre>{str(e)}</pre>"
 
+def _agregados_reconciliacao(df_cache, agregados_cache, data_inicio, data_fim):
+    """Agregados diários do pipeline; sem eles (ou de uma versão anterior), os mesmos agregados calculados só sobre o período"""
+    if agregados_cache and all(nome in agregados_cache for nome in AGREGADOS_RECONCILIACAO):
+        return agregados_cache
+    logger.info("Reconciliação: agregados diários indisponíveis, agregando os registros do período")
+    return gerar_agregados_diarios(fatiar_periodo(df_cache, data_inicio, data_fim))
+
 @app.route('/diagnostico-nao-mapeado')
 def diagnostico_nao_mapeado():
-    ensure_data_in_cache()
+    df_cache, agregados_cache = ensure_data_in_cache()
 
     try:
         # Replicar exatamente a lógica do dashboard
-        data_inicio_tabelas, data_fim_tabelas = _get_date_filters(DF_CACHE, 'data_inicio', 'data_fim', 6)
-        start_dt_tabelas = datetime.combine(data_inicio_tabelas, datetime.min.time())
-        end_dt_tabelas = datetime.combine(data_fim_tabelas, datetime.max.time())
+        data_inicio_tabelas, data_fim_tabelas = _get_date_filters(df_cache, 'data_inicio', 'data_fim', 6)
 
-        df_filtrado_para_tabelas = DF_CACHE[
-            (DF_CACHE['data_hora_contato'] >= start_dt_tabelas) &
-            (DF_CACHE['data_hora_contato'] <= end_dt_tabelas)
-        ].copy()
-
-        df_rechamadas_no_periodo = df_filtrado_para_tabelas[df_filtrado_para_tabelas['is_rechamada'] == True].copy()
-
-        # Aplicar mesma lógica do dashboard
-        agent_map_df = df_filtrado_para_tabelas.drop_duplicates(subset=['l5_agente'])
-        name_map = agent_map_df.set_index('l5_agente')['nome_agente']
-        supervisor_map = agent_map_df.set_index('l5_agente')['supervisor']
-
-        df_rechamadas_no_periodo['rechamada_atribuida_nome'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(name_map).fillna('Agente Desconhecido')
-        df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] = df_rechamadas_no_periodo['rechamada_atribuida_l5'].map(supervisor_map).fillna('Não Mapeado')
-
-        # Análise detalhada
-        supervisores = sorted(df_rechamadas_no_periodo['rechamada_atribuida_supervisor'].unique())
-        nao_mapeados = df_rechamadas_no_periodo[df_rechamadas_no_periodo['rechamada_atribuida_supervisor'] == 'Não Mapeado']
+        # Atribuição e contagens somadas dos fatos diários do pipeline (sem varrer os registros por L5)
+        fatos = gerar_nao_mapeados_agregado(_agregados_reconciliacao(df_cache, agregados_cache, data_inicio_tabelas, data_fim_tabelas),
+                                            data_inicio_tabelas, data_fim_tabelas)
 
         # Informações do sistema
-        import os
         import platform
 
         diagnostico = {
             'timestamp': datetime.now().isoformat(),
             'servidor': platform.node(),
             'periodo': f"{data_inicio_tabelas} a {data_fim_tabelas}",
-            'total_dados_cache': len(DF_CACHE),
-            'dados_filtrados': len(df_filtrado_para_tabelas),
-            'total_rechamadas': len(df_rechamadas_no_periodo),
-            'l5s_mapeados': len(supervisor_map),
-            'supervisores_unicos': supervisores,
-            'registros_nao_mapeado': len(nao_mapeados),
-            'arquivo_dados_existe': os.path.exists('dados_consolidado.parquet'),
-            'cache_files': {
-                'cache_pkl': os.path.exists('/tmp/rechamada_cache.pkl'),
-                'cache_timestamp': os.path.exists('/tmp/rechamada_cache_timestamp')
+            'total_dados_cache': len(df_cache),
+            'dados_filtrados': len(fatiar_periodo(df_cache, data_inicio_tabelas, data_fim_tabelas)),
+            'total_rechamadas': fatos['total_rechamadas'],
+            'l5s_mapeados': fatos['l5s_mapeados'],
+            'supervisores_unicos': fatos['supervisores_unicos'],
+            'registros_nao_mapeado': fatos['registros_nao_mapeado'],
+            # Snapshot apontado pelo manifesto (ou o arquivo legado, sem manifesto)
+            'arquivo_dados': caminho_dataset_atual(CAMINHO_MANIFESTO),
+            'arquivo_dados_existe': os.path.exists(caminho_dataset_atual(CAMINHO_MANIFESTO)),
+            # Snapshot Arrow compartilhado da versão servida (um arquivo por versão)
+            'cache_compartilhado': {
+                'versao': df_cache.attrs.get('versao_snapshot'),
+                'arquivo': _caminho_cache_compartilhado(df_cache.attrs.get('versao_snapshot')),
+                'existe': os.path.exists(_caminho_cache_compartilhado(df_cache.attrs.get('versao_snapshot')))
             }
         }
 
-        if len(nao_mapeados) > 0:
-            l5s_problema = nao_mapeados['rechamada_atribuida_l5'].value_counts()
-            diagnostico['l5s_problema'] = l5s_problema.to_dict()
-
-            # Investigar cada L5 problema
-            detalhes_problema = {}
-            for l5, count in l5s_problema.items():
-                existe_map = l5 in supervisor_map.index
-                existe_filtrado = len(df_filtrado_para_tabelas[df_filtrado_para_tabelas['l5_agente'] == l5])
-
-                detalhes_problema[str(l5)] = {
-                    'count': int(count),
-                    'existe_no_mapeamento': existe_map,
-                    'registros_no_periodo': existe_filtrado,
-                    'tipo_l5': str(type(l5))
-                }
-
-            diagnostico['detalhes_l5s_problema'] = detalhes_problema
+        if fatos['l5s_problema']:
+            diagnostico['l5s_problema'] = fatos['l5s_problema']
+            diagnostico['detalhes_l5s_problema'] = fatos['detalhes_l5s_problema']
 
-        # Verificar padronização de supervisores
-        supervisores_originais = df_filtrado_para_tabelas['supervisor'].unique()
-        diagnostico['supervisores_nos_dados'] = sorted([str(s) for s in supervisores_originais])
+        diagnostico['supervisores_nos_dados'] = fatos['supervisores_nos_dados']
 
         return f"""
         <h2>Diagnóstico Completo - Não Mapeado</h2>
@@ -770,6 +1405,14 @@ def diagnostico_nao_mapeado():
         <pre>{str(e.__class__.__name__)}: {str(e)}</pre>
         """
 
+@app.route('/metrics')
+def metricas():
+    """Métricas deste processo no formato texto do Prometheus"""
+    with _RESULTADOS_LOCK:
+        definir('rechamada_cache_resultados_bytes', _RESULTADOS_BYTES)
+        definir('rechamada_cache_resultados_entradas', len(_RESULTADOS_CACHE))
+    return Response(gerar_exposicao(), content_type=TIPO_CONTEUDO_METRICAS)
+
 @app.route('/static/<path:filename>')
 def static_files(filename):
     return send_from_directory('static', filename)
@@ -779,5 +1422,7 @@ def favicon():
     return send_from_directory('static', 'surf_logo_vertical_branco.png')
 
 
+threading.Thread(target=_carga_inicial, name='carga-inicial-cache', daemon=True).start()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
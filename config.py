@@ -8,6 +8,13 @@ PASTA_MOPS_HISTORICOS = "dados_exemplo"
 # Configurações de processamento
 USE_SIMPLE_SUPERVISOR_MAPPING = True
 ARQUIVO_DADOS_CONSOLIDADO = "dados_consolidado.parquet"
+# Manifesto do dataset (registros/não mapeados por dia, versão) mantido pelo pipeline.
+# Também aponta para o snapshot publicado: cada execução grava uma versão imutável em
+# PASTA_SNAPSHOTS e troca o manifesto atomicamente. ARQUIVO_DADOS_CONSOLIDADO fica como
+# arquivo legado (dados de demonstração / antes do primeiro snapshot).
+ARQUIVO_MANIFESTO_DADOS = "dados_consolidado.manifesto.json"
+PASTA_SNAPSHOTS = "snapshots"
+SNAPSHOTS_MANTIDOS = 3
 ARQUIVO_MAPEAMENTO_TEMPORAL = f"{PASTA_MOPS_HISTORICOS}/mapeamento_supervisor.parquet"
 
 # API - Credenciais de exemplo (não funcionais)
@@ -34,8 +41,80 @@ FILAS_PARA_EXCLUIR = [
 # Colunas chave para identificação de duplicatas
 COLUNAS_CHAVE_DUPLICATAS = ['data_hora_contato', 'protocolo', 'origem']
 
-# Colunas para conversão de tipo texto
-COLUNAS_PARA_TEXTO = ['origem', 'protocolo', 'agente', 'rechamada_atribuida']
+# Campos que a API pode revisar em um registro já extraído (chave igual, conteúdo diferente = atualização)
+COLUNAS_CONTEUDO_REGISTRO = [
+    'status_ligacao', 'motivo_original', 'mvno', 'l5_agente', 'nome_agente',
+    'tempo_espera', 'tempo_atendimento', 'tempo_ligacao_total'
+]
+
+# Janela de revisita: últimos N dias (até ontem) re-extraídos a cada execução, pois a API
+# pode revisar chamadas recentes (status, identificação). 0 desativa.
+JANELA_REVISITA_DIAS = 3
+
+# Índice persistente de deduplicação (hash das chaves, uma partição Parquet por dia)
+PASTA_INDICE_DEDUPLICACAO = "indice_deduplicacao"
+
+# Agregados diários (somas/contagens por dia) gerados pelo pipeline para o dashboard: uma pasta por
+# snapshot, ao lado dele (<snapshot>_agregados_diarios), removida junto com o snapshot
+PASTA_AGREGADOS_DIARIOS = "agregados_diarios"
+
+# Correções de supervisor por L5 feitas pelo app (/corrigir-mapeamento-l5s): persistidas em arquivo
+# para valer em todos os workers; o stat do arquivo entra na versão dos dados servida
+ARQUIVO_CORRECOES_SUPERVISOR = "correcoes_supervisor.json"
+
+# Schema de armazenamento do dataset consolidado (coluna -> dtype pandas)
+# Aplicado pelo pipeline antes de salvar e pelo app ao carregar
+SCHEMA_ARMAZENAMENTO = {
+    # Identificadores: origem como inteiro quando puramente numérica, senão texto (visão texto via origem_como_texto)
+    'origem': 'Int64',
+    # Alta cardinalidade: strings Arrow (sem objeto Python por célula)
+    'protocolo': 'string[pyarrow]',
+    'protocolo_chamada_original': 'string[pyarrow]',
+    'nome_agente': 'string[pyarrow]',
+    'motivo_original': 'string[pyarrow]',
+    # Baixa cardinalidade: categóricas (dicionário no Parquet)
+    'l5_agente': 'category',
+    'rechamada_atribuida_l5': 'category',
+    'mvno': 'category',
+    'supervisor': 'category',
+    'motivo_categoria': 'category',
+    'local': 'category',
+    'ddd': 'category',
+    'status_ligacao': 'category',
+    'tipo_rechamada': 'category',
+    'mes': 'category',
+    'semana': 'category',
+    # Durações em segundos (anuláveis: ausente não é 0)
+    'tempo_atendimento': 'Int32',
+    'tempo_espera': 'Int32',
+    'tempo_ligacao_total': 'Int32',
+    'tempo_atendimento_original': 'Int32',
+    # Flags
+    'is_rechamada': 'bool',
+    'causou_rechamada': 'bool',
+    'is_expurgado': 'bool',
+}
+
+# Escrita do dataset consolidado (salvar_dados_consolidados): ordenado por data_hora_contato,
+# row groups pequenos o bastante para o filtro por período pular os que ficam fora do intervalo
+PARQUET_LINHAS_POR_ROW_GROUP = 50_000
+PARQUET_OPCOES_ESCRITA = {
+    'compression': 'snappy',
+    # Dicionário nas colunas repetitivas (origem, l5_agente e categóricas); texto único fica plano
+    'use_dictionary': ['origem', 'l5_agente', 'rechamada_atribuida_l5', 'mvno', 'supervisor', 'motivo_categoria',
+                       'local', 'ddd', 'status_ligacao', 'tipo_rechamada', 'mes', 'semana', 'nome_agente'],
+    # Índice de páginas (min/max por página) para buscas pontuais por origem/l5_agente
+    'write_page_index': True,
+}
+
+# Cache LRU dos payloads JSON do dashboard (app.py), limitado pelo tamanho total dos payloads guardados
+CACHE_RESULTADOS_MAX_BYTES = 64 * 1024 * 1024
+
+# Exportações em segundo plano (/exportacoes): arquivos gerados ficam em PASTA_EXPORTACOES e são
+# removidos após EXPORTACAO_TTL_SEGUNDOS sem atualização
+PASTA_EXPORTACOES = "exportacoes"
+EXPORTACAO_TTL_SEGUNDOS = 60 * 60
+EXPORTACAO_MAX_WORKERS = 1
 
 # Chave secreta para Flask (exemplo)
 SECRET_KEY = 'chave_secreta_exemplo_nao_usar_em_producao'
@@ -35,3 +35,9 @@ MAPEAMENTO_MOTIVOS = {
     "Reclamacao": "RECLAMAÇÃO",
     "Outro": "OUTRO",
 }
+
+# Rótulos de mês em pt-BR (dimensão calendário), independentes do locale do servidor
+MESES_PT_BR = [
+    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+    "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro",
+]
@@ -7,6 +7,8 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import random
+import config
+from utils_armazenamento import aplicar_schema_armazenamento, salvar_dados_consolidados, gerar_manifesto, salvar_manifesto
 
 def gerar_dados_demo():
     """Gera dados mockados para demonstração"""
@@ -123,9 +125,11 @@ if __name__ == "__main__":
 
     df = gerar_dados_demo()
 
-    # Salvar em parquet
+    # Salvar em parquet (com o mesmo schema de armazenamento do pipeline)
     output_file = "dados_consolidado.parquet"
-    df.to_parquet(output_file, index=False)
+    df = aplicar_schema_armazenamento(df)
+    salvar_dados_consolidados(df, output_file)
+    salvar_manifesto(gerar_manifesto(df, output_file), config.ARQUIVO_MANIFESTO_DADOS)
     print(f"\n✓ Dados salvos em: {output_file}")
 
     # Estatísticas
@@ -6,6 +6,13 @@ from datetime import datetime, date, timedelta
 import logging
 from utils import *
 import config
+from utils_armazenamento import (
+    aplicar_schema_armazenamento, ler_dados_consolidados, salvar_dados_consolidados, assinatura_dataset_valida, garantir_indice_deduplicacao,
+    classificar_registros_novos, remover_registros_substituidos, salvar_indice_deduplicacao,
+    registrar_assinatura_dataset, dias_sem_particao_indice, gerar_manifesto, salvar_manifesto, carregar_manifesto,
+    datas_do_dataset, proporcao_nao_mapeados, caminho_dataset_atual, caminho_snapshot_versao, remover_snapshots_antigos
+)
+from utils_agregados import gerar_agregados_diarios, salvar_agregados_diarios
 from utils_api_nova import extrair_dados_api_nova_completo
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,18 +26,19 @@ def processar_dataframe_bruto(df_bruto, series_expurgo, df_ddds, df_mapa_tempora
     df_enriquecido = aplicar_mapeamento_temporal_supervisor(df_proc, df_mapa_temporal, 
                                                           use_simple_fallback=config.USE_SIMPLE_SUPERVISOR_MAPPING)
     
-    return df_enriquecido
+    # Mesmos dtypes do histórico para que concat/deduplicação comparem valores iguais
+    return aplicar_schema_armazenamento(df_enriquecido)
 
 def carregar_dados_historicos():
     """
     Carrega dados históricos do parquet. Se não existir, tenta CSV como fallback.
     """
-    if os.path.exists(config.ARQUIVO_DADOS_CONSOLIDADO):
-        logger.info(f"Carregando dados históricos de '{config.ARQUIVO_DADOS_CONSOLIDADO}'...")
-        return pd.read_parquet(config.ARQUIVO_DADOS_CONSOLIDADO)
+    caminho_dataset = caminho_dataset_atual()
+    if os.path.exists(caminho_dataset):
+        logger.info(f"Carregando dados históricos de '{caminho_dataset}'...")
+        return ler_dados_consolidados(caminho_dataset)
 
-
-    logger.info(f"'{config.ARQUIVO_DADOS_CONSOLIDADO}' não encontrado. Iniciando com dados vazios - tudo será extraído da API.")
+    logger.info(f"'{caminho_dataset}' não encontrado. Iniciando com dados vazios - tudo será extraído da API.")
     return pd.DataFrame()
 
 def extrair_dados_api(data_inicio_str, data_fim_str, series_expurgo, df_ddds, df_mapa_temporal):
@@ -120,7 +128,7 @@ def extrair_dados_api_simples(data_inicio_str, data_fim_str, series_expurgo, df_
     """
     return extrair_dados_api_intervalo_unico(data_inicio_str, data_fim_str, series_expurgo, df_ddds, df_mapa_temporal)
 
-def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extraction=False):
+def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extraction=False, datas_existentes=None):
     """
     Verifica se existem gaps de datas nos dados e tenta preenchê-los automaticamente.
     
@@ -128,15 +136,22 @@ def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extract
         df_dados: DataFrame com os dados existentes
         max_gaps: Máximo de datas faltantes a preencher (padrão: 7)
         skip_api_extraction: Se True, não faz chamadas da API (evita loops)
+        datas_existentes: Dias com dados já conhecidos (ex.: manifesto + lote); se None, calculados de df_dados
+
+    Retorna (df_dados, dias_preenchidos): os dias preenchidos têm a partição do índice de deduplicação regravada
+    pelo chamador, como os dias do lote principal.
     """
+    dias_preenchidos = []
     if df_dados.empty:
-        return df_dados
+        return df_dados, dias_preenchidos
     
     try:
-        # Identifica o range de datas nos dados existentes
-        df_dados['data_hora_contato'] = pd.to_datetime(df_dados['data_hora_contato'])
-        data_min = df_dados['data_hora_contato'].min().date()
-        data_max = df_dados['data_hora_contato'].max().date()
+        # Identifica as datas com dados e o range coberto
+        if datas_existentes is None:
+            df_dados['data_hora_contato'] = pd.to_datetime(df_dados['data_hora_contato'])
+            datas_existentes = set(df_dados['data_hora_contato'].dt.date.unique())
+        data_min = min(datas_existentes)
+        data_max = max(datas_existentes)
         
         # Limita data_max até ontem para não tentar preencher datas futuras
         hoje = date.today()
@@ -146,10 +161,7 @@ def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extract
         # Se data_max ficou menor que data_min, não há o que preencher
         if data_max < data_min:
             logger.info("✅ Não há datas para preencher (dados são futuros)")
-            return df_dados
-        
-        # Identifica datas com dados
-        datas_existentes = set(df_dados['data_hora_contato'].dt.date.unique())
+            return df_dados, dias_preenchidos
         
         # Gera lista de todas as datas do período (até ontem no máximo)
         data_atual = data_min
@@ -173,7 +185,7 @@ def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extract
             # PROTEÇÃO CONTRA LOOP: Skip extração da API se solicitado
             if skip_api_extraction:
                 logger.info("Pulando extração da API conforme solicitado (evita loops)")
-                return df_dados
+                return df_dados, dias_preenchidos
             
             # Carrega dados auxiliares UMA ÚNICA VEZ (otimização)
             logger.info("Carregando dados auxiliares para preenchimento de gaps...")
@@ -200,7 +212,12 @@ def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extract
                     
                     if not df_novo.empty:
                         logger.info(f"✅ Dados encontrados para {data_faltante}: {len(df_novo)} registros")
-                        df_dados = pd.concat([df_dados, df_novo], ignore_index=True)
+                        # Mesmo upsert do lote principal: versões antigas dos registros atualizados saem do histórico
+                        df_novo, hashes_atualizados = classificar_registros_novos(df_novo, config.PASTA_INDICE_DEDUPLICACAO)
+                        if not df_novo.empty:
+                            df_dados = remover_registros_substituidos(df_dados, hashes_atualizados, df_novo['data_hora_contato'])
+                            df_dados = pd.concat([df_dados, df_novo], ignore_index=True)
+                            dias_preenchidos += list(df_novo['data_hora_contato'].dt.floor('D').unique())
                         dados_adicionados += len(df_novo)
                     else:
                         logger.info(f"⚠️  Nenhum dado encontrado na API para {data_faltante}")
@@ -215,11 +232,11 @@ def verificar_e_preencher_datas_faltantes(df_dados, max_gaps=7, skip_api_extract
         else:
             logger.info("✅ Não foram identificadas datas faltantes no período")
             
-        return df_dados
+        return df_dados, dias_preenchidos
         
     except Exception as e:
         logger.error(f"Erro na verificação de datas faltantes: {e}")
-        return df_dados
+        return df_dados, dias_preenchidos
 
 def verificar_e_regenerar_mapeamento_se_necessario():
     """
@@ -237,13 +254,12 @@ def verificar_e_regenerar_mapeamento_se_necessario():
 
         df_mapa = pd.read_parquet(config.ARQUIVO_MAPEAMENTO_TEMPORAL)
 
-        # Verificar se há dados consolidados para comparar
-        if os.path.exists(config.ARQUIVO_DADOS_CONSOLIDADO):
-            df_dados = pd.read_parquet(config.ARQUIVO_DADOS_CONSOLIDADO)
-            df_dados['data_hora_contato'] = pd.to_datetime(df_dados['data_hora_contato'])
-
+        # Verificar se há dados consolidados para comparar (pelo manifesto, sem ler o histórico)
+        manifesto = carregar_manifesto()
+        datas_dados = datas_do_dataset(manifesto=manifesto)
+        if datas_dados:
             # Período máximo dos dados
-            periodo_max_dados = df_dados['data_hora_contato'].max().date()
+            periodo_max_dados = max(datas_dados)
 
             # Período máximo do mapeamento
             df_mapa['data_fim_supervisor'] = pd.to_datetime(df_mapa['data_fim_supervisor']).dt.date
@@ -270,11 +286,9 @@ def verificar_e_regenerar_mapeamento_se_necessario():
 
             # Verificar porcentagem de "Não Mapeados" nos últimos 7 dias
             data_inicio_check = periodo_max_dados - timedelta(days=7)
-            df_ultimos_dias = df_dados[df_dados['data_hora_contato'] >= pd.Timestamp(data_inicio_check)]
-
-            if len(df_ultimos_dias) > 0:
-                pct_nao_mapeados = (df_ultimos_dias['supervisor'] == 'Não Mapeado').sum() / len(df_ultimos_dias)
+            pct_nao_mapeados = proporcao_nao_mapeados(data_inicio_check, manifesto=manifesto)
 
+            if pct_nao_mapeados is not None:
                 if pct_nao_mapeados > 0.3:  # Mais de 30% não mapeados
                     logger.warning(f"⚠️  {pct_nao_mapeados*100:.1f}% dos dados dos últimos 7 dias estão como 'Não Mapeado'")
                     logger.warning(f"   - Regenerando mapeamento...")
@@ -298,7 +312,30 @@ def verificar_e_regenerar_mapeamento_se_necessario():
         else:
             return pd.DataFrame()
 
-def executar_pipeline_principal(data_inicio_execucao, data_fim_execucao):
+def dias_janela_revisita(data_inicio_execucao, data_fim_execucao, janela_revisita_dias):
+    """
+    Dias recentes (até ontem) que a API ainda pode revisar e que não estão no período da execução.
+    """
+    if janela_revisita_dias <= 0:
+        return []
+    ontem = date.today() - timedelta(days=1)
+    dias = [ontem - timedelta(days=i) for i in range(janela_revisita_dias - 1, -1, -1)]
+    return [dia for dia in dias if not (data_inicio_execucao <= dia <= data_fim_execucao)]
+
+def extrair_janela_revisita(data_inicio_execucao, data_fim_execucao, janela_revisita_dias, series_expurgo, df_ddds, df_mapa_temporal):
+    dias = dias_janela_revisita(data_inicio_execucao, data_fim_execucao, janela_revisita_dias)
+    if not dias:
+        return pd.DataFrame()
+    logger.info(f"🔁 Janela de revisita: re-extraindo {len(dias)} dias recentes ({dias[0]} até {dias[-1]})")
+    dfs_revisita = []
+    for dia in dias:
+        dia_str = dia.strftime('%Y-%m-%d')
+        df_dia = extrair_dados_api(dia_str, dia_str, series_expurgo, df_ddds, df_mapa_temporal)
+        if not df_dia.empty:
+            dfs_revisita.append(df_dia)
+    return pd.concat(dfs_revisita, ignore_index=True) if dfs_revisita else pd.DataFrame()
+
+def executar_pipeline_principal(data_inicio_execucao, data_fim_execucao, janela_revisita_dias=config.JANELA_REVISITA_DIAS):
 
     # Verificar se o mapeamento temporal precisa ser regenerado
     df_mapa_temporal = verificar_e_regenerar_mapeamento_se_necessario()
@@ -306,72 +343,97 @@ def executar_pipeline_principal(data_inicio_execucao, data_fim_execucao):
     df_ddds = carregar_planilha_ddds(config.PASTA_PLANILHAS)
     series_expurgo = carregar_planilha_expurgo(config.PASTA_PLANILHAS)
     df_historico = carregar_dados_historicos()
+    manifesto_anterior = carregar_manifesto(validar=False)
+    # Dataset regravado fora do pipeline (índice dessincronizado): estado de rechamada recalculado por completo
+    caminho_historico = caminho_dataset_atual()
+    historico_sincronizado = assinatura_dataset_valida(config.PASTA_INDICE_DEDUPLICACAO, caminho_historico)
+    df_historico = garantir_indice_deduplicacao(config.PASTA_INDICE_DEDUPLICACAO, df_historico, caminho_historico)
     data_inicio_str = data_inicio_execucao.strftime('%Y-%m-%d')
     data_fim_str = data_fim_execucao.strftime('%Y-%m-%d')
     df_novos_dados = extrair_dados_api(data_inicio_str, data_fim_str, series_expurgo, df_ddds, df_mapa_temporal)
+
+    # Dias recentes são re-extraídos a cada execução para capturar revisões da API (upsert pela chave)
+    df_revisita = extrair_janela_revisita(data_inicio_execucao, data_fim_execucao, janela_revisita_dias, series_expurgo, df_ddds, df_mapa_temporal)
+    if not df_revisita.empty:
+        df_novos_dados = pd.concat([df for df in [df_novos_dados, df_revisita] if not df.empty], ignore_index=True)
+
+    # DEDUPLICAÇÃO pelo índice persistente: custo proporcional ao lote, não ao histórico
+    df_novos_dados, hashes_atualizados = classificar_registros_novos(df_novos_dados, config.PASTA_INDICE_DEDUPLICACAO)
+    if not df_novos_dados.empty:
+        df_historico = remover_registros_substituidos(df_historico, hashes_atualizados, df_novos_dados['data_hora_contato'])
     all_dfs = [df for df in [df_historico, df_novos_dados] if not df.empty]
     if not all_dfs:
         logger.warning("Nenhum dado (histórico ou novo) disponível para processamento final. Encerrando.")
         return
 
     df_final_consolidado = pd.concat(all_dfs, ignore_index=True)
-
-    # LOG DETALHADO DE DEDUPLICAÇÃO #1
-    registros_antes_dedup1 = len(df_final_consolidado)
-    logger.info(f"📊 DEDUPLICAÇÃO #1 - Registros ANTES: {registros_antes_dedup1:,}")
-
-    df_final_consolidado.drop_duplicates(subset=config.COLUNAS_CHAVE_DUPLICATAS, keep='last', inplace=True)
-
-    registros_apos_dedup1 = len(df_final_consolidado)
-    registros_removidos_dedup1 = registros_antes_dedup1 - registros_apos_dedup1
-    logger.info(f"📊 DEDUPLICAÇÃO #1 - Registros APÓS: {registros_apos_dedup1:,}")
-    logger.info(f"📊 DEDUPLICAÇÃO #1 - Removidos: {registros_removidos_dedup1:,} ({(registros_removidos_dedup1/registros_antes_dedup1*100):.2f}%)")
+    logger.info(f"📊 DEDUPLICAÇÃO - Chaves usadas: {config.COLUNAS_CHAVE_DUPLICATAS}")
 
     # Verificação de gaps agora é feita ANTES da extração, não depois
     # Esta função só rodará se houver pequenos gaps internos nos dados extraídos
+    # (os registros preenchidos também passam pelo índice de deduplicação)
     logger.debug("Verificando pequenos gaps internos nos dados extraídos...")
-    df_final_consolidado = verificar_e_preencher_datas_faltantes(
+    datas_existentes = None
+    if historico_sincronizado:
+        # Dias do histórico pelo manifesto + dias do lote novo
+        datas_existentes = datas_do_dataset()
+        if not df_novos_dados.empty:
+            datas_existentes |= set(df_novos_dados['data_hora_contato'].dt.date.unique())
+    df_final_consolidado, dias_preenchidos = verificar_e_preencher_datas_faltantes(
         df_final_consolidado,
         max_gaps=3,  # Apenas gaps muito pequenos (3 dias)
-        skip_api_extraction=False
+        skip_api_extraction=False,
+        datas_existentes=datas_existentes or None
     )
-
-    # LOG DETALHADO DE DEDUPLICAÇÃO #2
-    registros_antes_dedup2 = len(df_final_consolidado)
-    logger.info(f"📊 DEDUPLICAÇÃO #2 - Registros ANTES: {registros_antes_dedup2:,}")
-
-    df_final_consolidado.drop_duplicates(subset=config.COLUNAS_CHAVE_DUPLICATAS, keep='last', inplace=True)
-
-    registros_apos_dedup2 = len(df_final_consolidado)
-    registros_removidos_dedup2 = registros_antes_dedup2 - registros_apos_dedup2
-    logger.info(f"📊 DEDUPLICAÇÃO #2 - Registros APÓS: {registros_apos_dedup2:,}")
-    logger.info(f"📊 DEDUPLICAÇÃO #2 - Removidos: {registros_removidos_dedup2:,} ({(registros_removidos_dedup2/registros_antes_dedup2*100):.2f}%)")
-
-    # LOG TOTAL DE DEDUPLICAÇÃO
-    total_removido = registros_removidos_dedup1 + registros_removidos_dedup2
-    logger.info(f"📊 DEDUPLICAÇÃO TOTAL - Removidos: {total_removido:,} registros duplicados")
-    logger.info(f"📊 DEDUPLICAÇÃO - Chaves usadas: {config.COLUNAS_CHAVE_DUPLICATAS}")
     
-    df_final_com_rechamadas = calcular_rechamadas(df_final_consolidado)
-
-    # CORREÇÃO: Aplicar classificação de tipos de rechamada APÓS calcular as rechamadas
-    df_final_com_rechamadas = classificar_tipos_rechamada(df_final_com_rechamadas)
-
-    df_final_com_rechamadas["mes"] = df_final_com_rechamadas["data_hora_contato"].dt.strftime("%m-%Y")
-    df_final_com_rechamadas["semana"] = df_final_com_rechamadas["data_hora_contato"].apply(get_semana_customizada)
-
-    for col in config.COLUNAS_PARA_TEXTO:
-        if col in df_final_com_rechamadas.columns:
-            df_final_com_rechamadas[col] = df_final_com_rechamadas[col].astype(str)
-
-    logger.info(f"Salvando resultado final em '{config.ARQUIVO_DADOS_CONSOLIDADO}'...")
-    df_final_com_rechamadas.to_parquet(config.ARQUIVO_DADOS_CONSOLIDADO, index=False)
+    # Registros do lote/gaps ainda não têm is_rechamada: só as origens deles são recalculadas
+    mascara_novos = None
+    if historico_sincronizado and 'is_rechamada' in df_final_consolidado.columns:
+        mascara_novos = df_final_consolidado['is_rechamada'].isna()
+    df_final_com_rechamadas = atualizar_rechamadas_por_origem(df_final_consolidado, mascara_novos)
+
+    # mes/semana dependem só da data: calculados apenas para registros que ainda não têm
+    sem_periodo = pd.Series(True, index=df_final_com_rechamadas.index)
+    if mascara_novos is not None and 'mes' in df_final_com_rechamadas.columns:
+        sem_periodo = df_final_com_rechamadas['mes'].isna()
+    if sem_periodo.any():
+        datas_sem_periodo = df_final_com_rechamadas.loc[sem_periodo, 'data_hora_contato']
+        df_final_com_rechamadas = df_final_com_rechamadas.astype({col: 'object' for col in ['mes', 'semana'] if col in df_final_com_rechamadas.columns})
+        # Rótulos da dimensão calendário (um cálculo por dia, não por registro)
+        rotulos = rotulos_calendario(datas_sem_periodo, ['mes', 'semana'])
+        df_final_com_rechamadas.loc[sem_periodo, 'mes'] = rotulos['mes'].to_numpy()
+        df_final_com_rechamadas.loc[sem_periodo, 'semana'] = rotulos['semana'].to_numpy()
+
+    df_final_com_rechamadas = aplicar_schema_armazenamento(df_final_com_rechamadas)
+
+    # Nova versão imutável do dataset; só fica visível quando o manifesto é trocado (no final)
+    versao = (manifesto_anterior or {}).get('versao', 0) + 1
+    caminho_snapshot = caminho_snapshot_versao(versao)
+    logger.info(f"Salvando resultado final em '{caminho_snapshot}'...")
+    salvar_dados_consolidados(df_final_com_rechamadas, caminho_snapshot)
+
+    # Atualiza o índice apenas nos dias que receberam registros (lote da API + gaps preenchidos)
+    dias_afetados = list(df_novos_dados['data_hora_contato'].dt.floor('D').unique()) if not df_novos_dados.empty else []
+    dias_afetados += dias_preenchidos
+    dias_afetados += dias_sem_particao_indice(config.PASTA_INDICE_DEDUPLICACAO, df_final_com_rechamadas['data_hora_contato'])
+    if dias_afetados:
+        salvar_indice_deduplicacao(config.PASTA_INDICE_DEDUPLICACAO, df_final_com_rechamadas, dias=dias_afetados)
+    registrar_assinatura_dataset(config.PASTA_INDICE_DEDUPLICACAO, caminho_snapshot)
+
+    # Agregados diários aditivos consumidos pelo dashboard (tabela 1 e tendência)
+    salvar_agregados_diarios(gerar_agregados_diarios(df_final_com_rechamadas), caminho_snapshot)
+
+    # Publicação: troca atômica do manifesto (ponteiro) para o novo snapshot
+    salvar_manifesto(gerar_manifesto(df_final_com_rechamadas, caminho_snapshot, manifesto_anterior), config.ARQUIVO_MANIFESTO_DADOS)
+    remover_snapshots_antigos(caminho_snapshot)
     logger.info(df_final_com_rechamadas['supervisor'].value_counts(dropna=False))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Pipeline de dados de rechamada. Executa para o dia anterior por padrão ou para um período específico.")
     parser.add_argument("--data-inicio", help="Data de início no formato YYYY-MM-DD")
     parser.add_argument("--data-fim", help="Data de fim no formato YYYY-MM-DD")
+    parser.add_argument("--janela-revisita", type=int, default=config.JANELA_REVISITA_DIAS,
+                        help=f"Dias recentes re-extraídos a cada execução para capturar revisões da API (padrão: {config.JANELA_REVISITA_DIAS}, 0 desativa)")
     args = parser.parse_args()
 
     if args.data_inicio and args.data_fim:
@@ -383,15 +445,15 @@ if __name__ == "__main__":
             sys.exit(1) # Sai do script indicando que um erro ocorreu
     else:
         # Lógica inteligente: verifica gaps nos dados históricos
-        if os.path.exists(config.ARQUIVO_DADOS_CONSOLIDADO):
+        if os.path.exists(caminho_dataset_atual()):
             # Carrega dados históricos para analisar gaps
             try:
-                df_historico = pd.read_parquet(config.ARQUIVO_DADOS_CONSOLIDADO)
-                if not df_historico.empty and 'data_hora_contato' in df_historico.columns:
+                # Período coberto pelo manifesto (ou só a coluna de datas, se ele estiver ausente/desatualizado)
+                datas_historico = datas_do_dataset()
+                if datas_historico:
                     # Analisa período completo dos dados
-                    df_historico['data_hora_contato'] = pd.to_datetime(df_historico['data_hora_contato'])
-                    primeira_data = df_historico['data_hora_contato'].min().date()
-                    ultima_data = df_historico['data_hora_contato'].max().date()
+                    primeira_data = min(datas_historico)
+                    ultima_data = max(datas_historico)
                     
                     # Define período esperado (janeiro até ontem)
                     ano_atual = date.today().year
@@ -433,4 +495,4 @@ if __name__ == "__main__":
             data_fim_processamento = date.today() - timedelta(days=1)
             logger.info(f"Dados históricos NÃO encontrados. Extraindo período completo: {data_inicio_processamento} até {data_fim_processamento}")
 
-    executar_pipeline_principal(data_inicio_processamento, data_fim_processamento)
+    executar_pipeline_principal(data_inicio_processamento, data_fim_processamento, janela_revisita_dias=args.janela_revisita)
@@ -0,0 +1,45 @@
+import os
+import sys
+
+# Os módulos do projeto ficam na raiz do repositório (sem pacote)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def gerar_registros(linhas=600, dias=10, semente=7):
+    """Registros sintéticos no formato do cache do app: ordenados por data_hora_contato, categóricas e RangeIndex"""
+    rng = np.random.default_rng(semente)
+    agentes = {'2001': 'Ana Souza', '2002': 'Bruno Lima', '2003': 'Carla Dias', '2004': 'Davi Melo'}
+    l5 = rng.choice(list(agentes), linhas)
+    inicio = pd.Timestamp('2026-03-01')
+    df = pd.DataFrame({
+        'data_hora_contato': inicio + pd.to_timedelta(rng.integers(0, dias * 86400, linhas), unit='s'),
+        'protocolo': [f'P{i:05d}' for i in range(linhas)],
+        'origem': pd.array(rng.integers(1, 80, linhas), dtype='Int64'),
+        'l5_agente': l5,
+        'nome_agente': [agentes[x] for x in l5],
+        'supervisor': rng.choice(['Sup A', 'Sup B', 'Não Mapeado'], linhas),
+        'mvno': rng.choice(['OperadoraA', 'OperadoraB', 'OperadoraC'], linhas),
+        'motivo_categoria': rng.choice(['Financeiro', 'Técnico', 'Outros'], linhas),
+        'status_ligacao': rng.choice(['Atendida', 'Abandonada'], linhas),
+        'ddd': rng.choice(['11', '21', '31'], linhas),
+        'semana': rng.choice(['Semana 1', 'Semana 2'], linhas),
+        'tempo_atendimento': pd.array(rng.integers(30, 900, linhas), dtype='Int32'),
+        'is_rechamada': rng.random(linhas) < 0.3,
+    })
+    df['tipo_rechamada'] = np.where(df['is_rechamada'], rng.choice(['Com Motivo', 'Sem Motivo'], linhas), None)
+    # L5 que causou a rechamada; alguns fora dos agentes do período (sem atributo na dimensão)
+    df['rechamada_atribuida_l5'] = np.where(df['is_rechamada'], rng.choice(list(agentes) + ['2999'], linhas), None)
+    for coluna in ['l5_agente', 'supervisor', 'mvno', 'motivo_categoria', 'status_ligacao', 'ddd', 'semana',
+                   'tipo_rechamada', 'rechamada_atribuida_l5']:
+        df[coluna] = df[coluna].astype('category')
+    df['nome_agente'] = df['nome_agente'].astype('string[pyarrow]')
+    return df.sort_values('data_hora_contato', kind='stable', ignore_index=True)
+
+
+@pytest.fixture
+def registros():
+    return gerar_registros()
@@ -0,0 +1,39 @@
+import os
+
+import pandas as pd
+
+from utils_agregados import gerar_agregados_diarios, salvar_agregados_diarios, carregar_agregados_diarios
+from utils_armazenamento import invalidar_assinatura_dataset, pasta_agregados_snapshot
+
+
+def _snapshot(registros, tmp_path, versao):
+    caminho = tmp_path / f"dados_consolidado_v{versao:06d}.parquet"
+    registros.to_parquet(caminho, index=False)
+    return str(caminho)
+
+
+def test_agregados_ficam_na_pasta_do_snapshot(registros, tmp_path):
+    caminho = _snapshot(registros, tmp_path, 1)
+    agregados = gerar_agregados_diarios(registros)
+    salvar_agregados_diarios(agregados, caminho)
+    assert os.path.isdir(pasta_agregados_snapshot(caminho))
+    assert not [nome for nome in os.listdir(pasta_agregados_snapshot(caminho)) if nome.endswith('.tmp')]
+    carregados = carregar_agregados_diarios(caminho)
+    pd.testing.assert_frame_equal(carregados['agente_dia'], agregados['agente_dia'], check_dtype=False, check_categorical=False)
+
+
+def test_nova_versao_nao_afeta_os_agregados_publicados(registros, tmp_path):
+    caminho_v1 = _snapshot(registros, tmp_path, 1)
+    salvar_agregados_diarios(gerar_agregados_diarios(registros), caminho_v1)
+    # Próxima execução grava os agregados da v2 sem tocar nos da v1, ainda apontada pelo manifesto
+    caminho_v2 = _snapshot(registros.iloc[:100], tmp_path, 2)
+    salvar_agregados_diarios(gerar_agregados_diarios(registros.iloc[:100]), caminho_v2)
+    assert carregar_agregados_diarios(caminho_v1)['agente_dia']['registros'].sum() == len(registros)
+    assert carregar_agregados_diarios(caminho_v2)['agente_dia']['registros'].sum() == 100
+
+
+def test_agregados_sem_assinatura_sao_ignorados(registros, tmp_path):
+    caminho = _snapshot(registros, tmp_path, 1)
+    salvar_agregados_diarios(gerar_agregados_diarios(registros), caminho)
+    invalidar_assinatura_dataset(pasta_agregados_snapshot(caminho))
+    assert carregar_agregados_diarios(caminho) == {}
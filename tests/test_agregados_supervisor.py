@@ -0,0 +1,91 @@
+import pandas as pd
+import pytest
+from datetime import date
+
+from utils import gerar_dimensao_agentes, fatiar_periodo
+from utils_agregados import (
+    AGREGADOS_DIARIOS, aplicar_correcoes_supervisor_agregados, gerar_agregados_diarios, gerar_nao_mapeados_agregado,
+    supervisor_predominante, _contagens_supervisor_agregado
+)
+
+CORRECOES = {'2001': 'Sup C', '2003': 'Sup A'}
+
+
+def _corrigir_registros(df, correcoes):
+    """Correção aplicada aos registros (como no cache do app), para comparar com a dos agregados"""
+    df = df.copy()
+    supervisor = df['supervisor'].astype(object)
+    mascara = df['l5_agente'].isin(list(correcoes))
+    supervisor[mascara] = df.loc[mascara, 'l5_agente'].astype(str).map(correcoes)
+    df['supervisor'] = supervisor.astype('category')
+    return df
+
+
+def _ordenar(df_agregado, chaves):
+    """Linhas diárias em ordem canônica, com as chaves como texto (categóricas de origem diferente)"""
+    df_agregado = df_agregado.assign(**{col: df_agregado[col].astype(str) for col in chaves})
+    return df_agregado.sort_values(['dia'] + chaves, ignore_index=True)
+
+
+def _nao_mapeados_dos_registros(df, data_inicio, data_fim):
+    periodo = fatiar_periodo(df, data_inicio, data_fim)
+    dimensao = gerar_dimensao_agentes(periodo)
+    rechamadas = periodo.loc[periodo['is_rechamada'], 'rechamada_atribuida_l5'].astype(object)
+    atribuido = rechamadas.map(dimensao['supervisor'].astype(object)).fillna('Não Mapeado')
+    return {str(l5): int(n) for l5, n in rechamadas[atribuido == 'Não Mapeado'].value_counts().items()}
+
+
+def _empate(supervisores_por_dia):
+    """Um L5 com um registro por (dia, supervisor), na ordem dada: supervisores empatados em contagem"""
+    linhas = [(pd.Timestamp(dia) + pd.Timedelta(hours=10 + i), supervisor)
+              for i, (dia, supervisor) in enumerate(supervisores_por_dia)]
+    return pd.DataFrame({
+        'data_hora_contato': [t for t, _ in linhas], 'protocolo': [f'P{i}' for i in range(len(linhas))],
+        'l5_agente': '2001', 'nome_agente': 'Ana Souza', 'supervisor': [s for _, s in linhas],
+        'mvno': 'OperadoraA', 'motivo_categoria': 'Outros', 'status_ligacao': 'Atendida',
+        'tempo_atendimento': 60, 'is_rechamada': False, 'tipo_rechamada': None, 'rechamada_atribuida_l5': None,
+    })
+
+
+@pytest.mark.parametrize('supervisores_por_dia, esperado', [
+    ([('2026-03-01', 'Sup B'), ('2026-03-01', 'Sup A')], 'Sup A'),
+    ([('2026-03-01', 'Sup B'), ('2026-03-02', 'Sup A')], 'Sup B'),
+    ([('2026-03-01', 'Sup B'), ('2026-03-02', 'Sup A'), ('2026-03-03', 'Sup A')], 'Sup A'),
+])
+def test_empate_resolvido_igual_nos_registros_e_nos_agregados(supervisores_por_dia, esperado):
+    df = _empate(supervisores_por_dia)
+    assert gerar_dimensao_agentes(df).loc['2001', 'supervisor'] == esperado
+    agente_dia = gerar_agregados_diarios(df)['agente_dia']
+    assert supervisor_predominante(_contagens_supervisor_agregado(agente_dia))['2001'] == esperado
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [
+    (date(2026, 3, 1), date(2026, 3, 10)),
+    (date(2026, 3, 2), date(2026, 3, 4)),
+    (date(2026, 3, 6), date(2026, 3, 6)),
+])
+def test_nao_mapeados_agregado_igual_aos_registros(registros, data_inicio, data_fim):
+    fatos = gerar_nao_mapeados_agregado(gerar_agregados_diarios(registros), data_inicio, data_fim)
+    assert fatos['l5s_problema'] == _nao_mapeados_dos_registros(registros, data_inicio, data_fim)
+
+
+def test_correcoes_nos_agregados_iguais_as_dos_registros(registros):
+    agregados = gerar_agregados_diarios(registros)
+    corrigidos = aplicar_correcoes_supervisor_agregados(agregados, CORRECOES)
+    esperados = gerar_agregados_diarios(_corrigir_registros(registros, CORRECOES))
+    for nome in ['agente_dia', 'supervisor_dia']:
+        chaves = AGREGADOS_DIARIOS[nome]
+        pd.testing.assert_frame_equal(_ordenar(corrigidos[nome], chaves), _ordenar(esperados[nome], chaves), check_dtype=False)
+    # Os agregados recebidos não mudam
+    assert 'Sup C' not in set(agregados['agente_dia']['supervisor'].astype(str))
+
+
+def test_correcao_tira_o_l5_dos_nao_mapeados(registros):
+    periodo = (date(2026, 3, 1), date(2026, 3, 10))
+    registros = _corrigir_registros(registros, {'2002': 'Não Mapeado'})
+    agregados = gerar_agregados_diarios(registros)
+    assert '2002' in gerar_nao_mapeados_agregado(agregados, *periodo)['l5s_problema']
+    corrigidos = aplicar_correcoes_supervisor_agregados(agregados, {'2002': 'Sup A'})
+    fatos = gerar_nao_mapeados_agregado(corrigidos, *periodo)
+    assert '2002' not in fatos['l5s_problema']
+    assert fatos['l5s_problema'] == _nao_mapeados_dos_registros(_corrigir_registros(registros, {'2002': 'Sup A'}), *periodo)
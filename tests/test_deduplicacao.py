@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from utils_armazenamento import (
+    salvar_indice_deduplicacao, classificar_registros_novos, remover_registros_substituidos, calcular_hash_chaves
+)
+
+
+def _registros(linhas):
+    df = pd.DataFrame(linhas, columns=['data_hora_contato', 'protocolo', 'origem', 'status_ligacao', 'tempo_atendimento'])
+    df['data_hora_contato'] = pd.to_datetime(df['data_hora_contato'])
+    df['origem'] = df['origem'].astype('Int64')
+    return df
+
+
+def _historico():
+    return _registros([
+        ('2026-03-01 10:00:00', 'P1', 11999990001, 'Atendida', 100),
+        ('2026-03-01 11:00:00', 'P2', 11999990002, 'Atendida', 200),
+        ('2026-03-02 09:00:00', 'P3', 11999990003, 'Atendida', 300),
+    ])
+
+
+def test_classifica_insercao_atualizacao_e_existente(tmp_path):
+    historico = _historico()
+    salvar_indice_deduplicacao(str(tmp_path), historico)
+
+    lote = _registros([
+        ('2026-03-01 10:00:00', 'P1', 11999990001, 'Atendida', 100),    # igual: ignorado
+        ('2026-03-01 11:00:00', 'P2', 11999990002, 'Abandonada', 200),  # conteúdo revisado: atualização
+        ('2026-03-02 12:00:00', 'P4', 11999990004, 'Atendida', 50),     # chave nova: inserção
+        ('2026-03-02 12:00:00', 'P4', 11999990004, 'Atendida', 50),     # duplicado no próprio lote
+    ])
+    para_gravar, hashes_atualizados = classificar_registros_novos(lote, str(tmp_path))
+
+    assert sorted(para_gravar['protocolo']) == ['P2', 'P4']
+    assert len(hashes_atualizados) == 1
+    assert hashes_atualizados[0] == calcular_hash_chaves(lote.iloc[[1]])[0]
+
+    # Upsert: a versão antiga de P2 sai do histórico, a nova entra pelo lote
+    restante = remover_registros_substituidos(historico, hashes_atualizados, para_gravar['data_hora_contato'])
+    assert sorted(restante['protocolo']) == ['P1', 'P3']
+
+
+def test_lote_vazio_e_indice_ausente(tmp_path):
+    vazio, hashes = classificar_registros_novos(_registros([]), str(tmp_path))
+    assert vazio.empty and len(hashes) == 0
+
+    lote = _historico()
+    para_gravar, hashes = classificar_registros_novos(lote, str(tmp_path / 'sem_indice'))
+    assert len(para_gravar) == len(lote) and len(hashes) == 0
+
+
+def test_chave_independe_do_tipo_da_origem():
+    inteiro = _historico()
+    texto = inteiro.assign(origem=inteiro['origem'].astype('string[pyarrow]'))
+    np.testing.assert_array_equal(calcular_hash_chaves(inteiro), calcular_hash_chaves(texto))
@@ -0,0 +1,64 @@
+import pytest
+
+import app as modulo_app
+from app import app, condicional_por_versao
+
+CHAMADAS = []
+
+
+@app.route('/_teste_condicional', methods=['GET', 'POST'])
+@condicional_por_versao
+def _rota_condicional():
+    CHAMADAS.append(1)
+    return 'conteudo'
+
+
+@pytest.fixture
+def cliente(monkeypatch, registros):
+    """Cliente de teste com o cache de dados trocado por registros sintéticos de versão controlada pelo teste"""
+    estado = {'versao': 'v1'}
+
+    def cache_sintetico():
+        df = registros.copy(deep=False)
+        df.attrs['versao'] = estado['versao']
+        return df, {}
+
+    monkeypatch.setattr(modulo_app, 'ensure_data_in_cache', cache_sintetico)
+    CHAMADAS.clear()
+    cliente = app.test_client()
+    cliente.estado = estado
+    return cliente
+
+
+def test_get_com_etag_igual_responde_304_sem_calcular(cliente):
+    primeira = cliente.get('/_teste_condicional?data_inicio=2026-03-01')
+    assert primeira.status_code == 200 and primeira.headers['ETag'].startswith('W/')
+    segunda = cliente.get('/_teste_condicional?data_inicio=2026-03-01',
+                          headers={'If-None-Match': primeira.headers['ETag']})
+    assert segunda.status_code == 304
+    assert segunda.headers['ETag'] == primeira.headers['ETag']
+    assert len(CHAMADAS) == 1
+
+
+def test_etag_muda_com_a_versao_e_com_a_query(cliente):
+    etag = cliente.get('/_teste_condicional').headers['ETag']
+    assert cliente.get('/_teste_condicional?mvno=OperadoraA').headers['ETag'] != etag
+    # Nova versão (snapshot publicado ou correção persistida): o ETag antigo deixa de valer
+    cliente.estado['versao'] = 'v2'
+    resposta = cliente.get('/_teste_condicional', headers={'If-None-Match': etag})
+    assert resposta.status_code == 200 and resposta.headers['ETag'] != etag
+
+
+def test_etag_nao_depende_do_estado_do_processo(cliente):
+    etag = cliente.get('/_teste_condicional').headers['ETag']
+    # Limpar o cache de resultados (o que uma recarga em outro worker não faz aqui) não muda o ETag
+    modulo_app._limpar_resultados()
+    assert cliente.get('/_teste_condicional').headers['ETag'] == etag
+
+
+def test_post_nunca_responde_304(cliente):
+    etag = cliente.get('/_teste_condicional').headers['ETag']
+    resposta = cliente.post('/_teste_condicional', headers={'If-None-Match': etag})
+    assert resposta.status_code == 200
+    assert 'ETag' not in resposta.headers
+    assert len(CHAMADAS) == 2
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+from datetime import date, datetime
+
+from utils import fatiar_periodo
+
+
+def _por_mascara(df, data_inicio, data_fim):
+    """Filtro de referência (o usado antes da busca binária): máscara booleana no período inteiro dos dias"""
+    inicio = datetime.combine(data_inicio, datetime.min.time())
+    fim = datetime.combine(data_fim, datetime.max.time())
+    return df[(df['data_hora_contato'] >= inicio) & (df['data_hora_contato'] <= fim)]
+
+
+@pytest.fixture
+def registros_nas_bordas(registros):
+    # Registros exatamente na virada do dia e no último microssegundo, que a busca binária precisa incluir/excluir
+    bordas = registros.iloc[:4].copy()
+    bordas['data_hora_contato'] = pd.to_datetime(['2026-03-03 00:00:00', '2026-03-03 23:59:59.999999',
+                                                  '2026-03-04 00:00:00', '2026-03-05 23:59:59.999999'],
+                                                 format='ISO8601')
+    df = pd.concat([registros, bordas])
+    return df.sort_values('data_hora_contato', kind='stable', ignore_index=True)
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [
+    (date(2026, 3, 3), date(2026, 3, 3)),
+    (date(2026, 3, 3), date(2026, 3, 4)),
+    (date(2026, 3, 4), date(2026, 3, 5)),
+    (date(2026, 2, 1), date(2026, 3, 1)),
+    (date(2026, 3, 1), date(2026, 3, 31)),
+])
+def test_fatia_igual_ao_filtro_por_mascara(registros_nas_bordas, data_inicio, data_fim):
+    fatia = fatiar_periodo(registros_nas_bordas, data_inicio, data_fim)
+    pd.testing.assert_frame_equal(fatia, _por_mascara(registros_nas_bordas, data_inicio, data_fim))
+    # Fatia posicional: mantém o RangeIndex contíguo que o índice bitmap usa
+    assert isinstance(fatia.index, pd.RangeIndex)
+
+
+@pytest.mark.parametrize('data_inicio, data_fim', [
+    (date(2026, 1, 1), date(2026, 1, 31)),
+    (date(2026, 4, 1), date(2026, 4, 30)),
+    (date(2026, 3, 5), date(2026, 3, 4)),
+])
+def test_periodo_sem_registros_retorna_vazio(registros_nas_bordas, data_inicio, data_fim):
+    fatia = fatiar_periodo(registros_nas_bordas, data_inicio, data_fim)
+    assert fatia.empty
+    assert list(fatia.columns) == list(registros_nas_bordas.columns)
+
+
+def test_dataframe_vazio(registros):
+    vazio = registros.iloc[:0]
+    assert fatiar_periodo(vazio, date(2026, 3, 1), date(2026, 3, 10)).empty
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import date
+
+from utils import (
+    FILTROS_ATRIBUICAO_L5, fatiar_periodo, gerar_dimensao_agentes, gerar_tabela_desempenho_atendente, mascara_atribuicao_l5
+)
+
+PERIODO = (date(2026, 3, 2), date(2026, 3, 8))
+
+
+def _filtrar_linha_a_linha(df_rechamadas, dimensao_agentes, filtros):
+    """Referência linha a linha: atributo do L5 atribuído na dimensão; fora dela, o padrão de FILTROS_ATRIBUICAO_L5"""
+    mascara = []
+    for l5 in df_rechamadas['rechamada_atribuida_l5']:
+        passa = pd.notna(l5)
+        for coluna, valores in filtros.items():
+            if not passa or not valores or coluna not in FILTROS_ATRIBUICAO_L5:
+                continue
+            valor = dimensao_agentes[coluna].get(l5, FILTROS_ATRIBUICAO_L5[coluna])
+            passa = valor is not None and valor in valores
+        mascara.append(passa)
+    return np.array(mascara, dtype=bool)
+
+
+@pytest.fixture
+def periodo_multinome(registros):
+    """
+    Período com L5 de vários nomes (2001: 'Ana S. Souza' em um a cada três registros, inclusive o primeiro) e de
+    vários supervisores (todos: supervisor sorteado por registro); 2999 só existe como L5 atribuído.
+    """
+    df = registros.copy()
+    df['nome_agente'] = df['nome_agente'].astype(object)
+    df.loc[df.index[(df['l5_agente'] == '2001').to_numpy()][::3], 'nome_agente'] = 'Ana S. Souza'
+    df['nome_agente'] = df['nome_agente'].astype('string[pyarrow]')
+    return fatiar_periodo(df, *PERIODO)
+
+
+FILTROS = [
+    {'supervisor': ['Sup A']},
+    {'supervisor': ['Não Mapeado']},
+    {'supervisor': ['Sup A', 'Não Mapeado']},
+    {'supervisor': ['Inexistente']},
+    {'nome_agente': ['Ana Souza']},
+    {'nome_agente': ['Ana S. Souza']},
+    {'nome_agente': ['Ana Souza', 'Bruno Lima'], 'supervisor': ['Sup B']},
+    {'supervisor': ['Não Mapeado'], 'mvno': ['OperadoraA']},
+    {'nome_agente': ['Carla Dias'], 'mvno': ['OperadoraB']},
+]
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_mascara_igual_a_referencia_linha_a_linha(periodo_multinome, filtros):
+    # Mesma dimensão que o app passa (gerar_dimensao_agentes do período, sem os filtros)
+    dimensao_agentes = gerar_dimensao_agentes(periodo_multinome)
+    df_rechamadas = periodo_multinome[periodo_multinome['is_rechamada']]
+    esperado = _filtrar_linha_a_linha(df_rechamadas, dimensao_agentes, filtros)
+    obtido = mascara_atribuicao_l5(df_rechamadas['rechamada_atribuida_l5'], dimensao_agentes, filtros)
+    np.testing.assert_array_equal(obtido, esperado)
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_tabela1_filtrada_conta_as_rechamadas_da_referencia(periodo_multinome, filtros):
+    dimensao_agentes = gerar_dimensao_agentes(periodo_multinome)
+    tabela1 = gerar_tabela_desempenho_atendente(periodo_multinome, format_output=False, filtros_adicionais=filtros,
+                                                dimensao_agentes=dimensao_agentes)
+    df_rechamadas = periodo_multinome[periodo_multinome['is_rechamada']]
+    mascara = _filtrar_linha_a_linha(df_rechamadas, dimensao_agentes, filtros)
+    esperado = df_rechamadas[mascara].groupby('rechamada_atribuida_l5', observed=True).size()
+    # Agentes da Tabela 1: os que têm registro sob os filtros e alguma rechamada atribuída que passou neles
+    mascara_registros = np.ones(len(periodo_multinome), dtype=bool)
+    for coluna, valores in filtros.items():
+        mascara_registros &= periodo_multinome[coluna].isin(valores).to_numpy()
+    agentes = set(periodo_multinome.loc[mascara_registros, 'l5_agente'].astype(str))
+    esperado = esperado[esperado.index.astype(str).isin(agentes)]
+    obtido = tabela1.groupby('L5', observed=True)['Rechamada Total'].first() if not tabela1.empty else pd.Series(dtype=int)
+    assert dict(zip(obtido.index.astype(str), obtido.astype(int))) == dict(zip(esperado.index.astype(str), esperado.astype(int)))
+
+
+def test_l5_sem_atributo(periodo_multinome):
+    dimensao_agentes = gerar_dimensao_agentes(periodo_multinome)
+    l5s = periodo_multinome.loc[periodo_multinome['is_rechamada'], 'rechamada_atribuida_l5']
+    fora = (l5s == '2999').to_numpy()
+    assert fora.any()
+    # supervisor: L5 fora da dimensão conta como 'Não Mapeado'
+    assert mascara_atribuicao_l5(l5s, dimensao_agentes, {'supervisor': ['Não Mapeado']})[fora].all()
+    assert not mascara_atribuicao_l5(l5s, dimensao_agentes, {'supervisor': ['Sup A']})[fora].any()
+    # nome_agente: sem padrão, L5 fora da dimensão nunca passa
+    assert not mascara_atribuicao_l5(l5s, dimensao_agentes, {'nome_agente': ['Ana Souza', 'Bruno Lima']})[fora].any()
+
+
+def test_l5_com_varios_atributos_so_passa_pelo_da_dimensao(periodo_multinome):
+    """Mudança de comportamento (dimensão de agentes): o antigo mapa do primeiro registro filtrado aceitava qualquer atributo do L5"""
+    dimensao_agentes = gerar_dimensao_agentes(periodo_multinome)
+    l5s = periodo_multinome.loc[periodo_multinome['is_rechamada'], 'rechamada_atribuida_l5']
+    do_2001 = (l5s == '2001').to_numpy()
+    nomes = set(periodo_multinome.loc[periodo_multinome['l5_agente'] == '2001', 'nome_agente'].astype(str))
+    supervisores = set(periodo_multinome.loc[periodo_multinome['l5_agente'] == '2001', 'supervisor'].astype(str))
+    outro_nome = (nomes - {dimensao_agentes.loc['2001', 'nome_agente']}).pop()
+    outro_supervisor = (supervisores - {dimensao_agentes.loc['2001', 'supervisor']}).pop()
+
+    assert mascara_atribuicao_l5(l5s, dimensao_agentes, {'nome_agente': [dimensao_agentes.loc['2001', 'nome_agente']]})[do_2001].all()
+    assert not mascara_atribuicao_l5(l5s, dimensao_agentes, {'nome_agente': [outro_nome]})[do_2001].any()
+    assert not mascara_atribuicao_l5(l5s, dimensao_agentes, {'supervisor': [outro_supervisor]})[do_2001].any()
+    # Na Tabela 1, filtrar pelo outro nome deixa o L5 sem rechamadas (e fora da tabela)
+    tabela1 = gerar_tabela_desempenho_atendente(periodo_multinome, format_output=False, filtros_adicionais={'nome_agente': [outro_nome]},
+                                                dimensao_agentes=dimensao_agentes)
+    assert tabela1.empty or '2001' not in set(tabela1['L5'].astype(str))
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+from datetime import date
+
+from utils import fatiar_periodo
+from utils_indices import (
+    caminho_categorias_indices, construir_indices_bitmap, salvar_indices_bitmap, carregar_indices_bitmap, mascara_filtros_indexados
+)
+
+
+def test_indices_mapeados_resolvem_como_os_montados(registros, tmp_path):
+    registros.attrs['versao'] = 'v1'
+    indices = construir_indices_bitmap(registros)
+    caminho = tmp_path / 'indices.npy'
+    salvar_indices_bitmap(indices, caminho)
+    mapeados = carregar_indices_bitmap(registros, caminho)
+    assert isinstance(mapeados['colunas']['supervisor'][1], np.memmap)
+
+    periodo = fatiar_periodo(registros, date(2026, 3, 2), date(2026, 3, 6))
+    filtros = {'supervisor': ['Sup A', 'Não Mapeado'], 'mvno': ['OperadoraB'], 'ddd': ['11', '99']}
+    mascara, colunas = mascara_filtros_indexados(periodo, filtros, mapeados)
+    esperado, _ = mascara_filtros_indexados(periodo, filtros, indices)
+    np.testing.assert_array_equal(mascara, esperado)
+    referencia = np.ones(len(periodo), dtype=bool)
+    for coluna, valores in filtros.items():
+        referencia &= periodo[coluna].isin(valores).to_numpy()
+    np.testing.assert_array_equal(mascara, referencia)
+    assert sorted(colunas) == sorted(filtros)
+
+
+def test_arquivo_de_outros_dados_e_rejeitado(registros, tmp_path):
+    caminho = tmp_path / 'indices.npy'
+    salvar_indices_bitmap(construir_indices_bitmap(registros), caminho)
+    assert carregar_indices_bitmap(registros.iloc[:-10], caminho) is None
+    outras_categorias = registros.assign(supervisor=registros['supervisor'].cat.add_categories(['Sup Nova']))
+    assert carregar_indices_bitmap(outras_categorias, caminho) is None
+
+
+def test_mesmas_contagens_com_outras_categorias_sao_rejeitadas(registros, tmp_path):
+    caminho = tmp_path / 'indices.npy'
+    salvar_indices_bitmap(construir_indices_bitmap(registros), caminho)
+    # Mesmas linhas e mesmo número de categorias por dimensão: só os valores ou a ordem mudam
+    reordenadas = registros.assign(supervisor=registros['supervisor'].cat.reorder_categories(
+        list(reversed(registros['supervisor'].cat.categories))))
+    renomeadas = registros.assign(mvno=registros['mvno'].cat.rename_categories({'OperadoraA': 'OperadoraZ'}))
+    assert carregar_indices_bitmap(reordenadas, caminho) is None
+    assert carregar_indices_bitmap(renomeadas, caminho) is None
+    assert carregar_indices_bitmap(registros, caminho) is not None
+
+
+def test_indices_sem_arquivo_de_categorias_sao_rejeitados(registros, tmp_path):
+    caminho = tmp_path / 'indices.npy'
+    salvar_indices_bitmap(construir_indices_bitmap(registros), caminho)
+    os.remove(caminho_categorias_indices(caminho))
+    assert carregar_indices_bitmap(registros, caminho) is None
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from utils import gerar_tabela_desempenho_atendente, gerar_dimensao_agentes, fatiar_periodo
+from utils_agregados import gerar_agregados_diarios, gerar_tabela_desempenho_atendente_agregada
+
+
+def _tabelas(df, data_inicio, data_fim):
+    periodo = fatiar_periodo(df, data_inicio, data_fim)
+    dimensao = gerar_dimensao_agentes(periodo)
+    bruta = gerar_tabela_desempenho_atendente(periodo, format_output=False, dimensao_agentes=dimensao)
+    agregada = gerar_tabela_desempenho_atendente_agregada(gerar_agregados_diarios(df), data_inicio, data_fim, dimensao)
+    ordenar = lambda t: t.assign(L5=t['L5'].astype(str), Nome=t['Nome'].astype(str)).sort_values('L5').reset_index(drop=True)
+    return ordenar(bruta), ordenar(agregada)
+
+
+def test_agregados_reproduzem_tabela1_dos_registros(registros):
+    bruta, agregada = _tabelas(registros, date(2026, 3, 2), date(2026, 3, 7))
+    assert not bruta.empty
+    pd.testing.assert_frame_equal(bruta, agregada, check_dtype=False)
+
+
+def test_media_ignora_duracoes_nulas_nos_dois_caminhos(registros):
+    registros.loc[registros.index[::5], 'tempo_atendimento'] = pd.NA
+    bruta, agregada = _tabelas(registros, date(2026, 3, 1), date(2026, 3, 10))
+    np.testing.assert_allclose(bruta['Média de Ligação'], agregada['Média de Ligação'])
+    esperado = registros.groupby('l5_agente', observed=True)['tempo_atendimento'].mean().astype('float64')
+    np.testing.assert_allclose(bruta.set_index('L5')['Média de Ligação'], esperado.reindex(bruta['L5']).to_numpy())
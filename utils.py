@@ -1,11 +1,17 @@
 import requests
 import json
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, date
 import os
 import logging
 import re
-from constants import MVNOS_VALIDAS, PREFIXOS_MVNO_MAP, MAPEAMENTO_MOTIVOS
+from functools import lru_cache
+from constants import MVNOS_VALIDAS, PREFIXOS_MVNO_MAP, MAPEAMENTO_MOTIVOS, MESES_PT_BR
+from utils_armazenamento import origem_como_texto, datas_do_dataset, caminho_dataset_atual
+from utils_diagnostico import diagnostico_ativo, registrar_diagnostico
+from utils_indices import mascara_filtros_indexados
+from utils_agregados import supervisor_predominante
 
 logger = logging.getLogger(__name__)
 
@@ -119,13 +125,13 @@ def gerar_mapeamento_l5_supervisor_temporal(caminho_pasta_mops_historicas, camin
     month_abbr_map = {"jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6, "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12}
     
     # Carrega dados consolidados para análise de período ativo
-    dados_consolidado_path = 'dados_consolidado.parquet'
+    dados_consolidado_path = caminho_dataset_atual()
     periodo_dados_max = datetime.now().date()
     if os.path.exists(dados_consolidado_path):
         try:
-            df_dados = pd.read_parquet(dados_consolidado_path)
-            df_dados['data_hora_contato'] = pd.to_datetime(df_dados['data_hora_contato'])
-            periodo_dados_max = df_dados['data_hora_contato'].max().date()
+            datas_dados = datas_do_dataset(dados_consolidado_path)
+            if datas_dados:
+                periodo_dados_max = max(datas_dados)
             logger.info(f"Período máximo dos dados: {periodo_dados_max}")
         except Exception as e:
             logger.warning(f"Erro ao carregar dados consolidados para análise temporal: {e}")
@@ -624,14 +630,52 @@ def inferir_supervisor_por_padrao(l5, nome_agente, df_mapa_temp):
     # Se não conseguiu inferir por range, retorna Não Mapeado
     return 'Não Mapeado'
 
+# Semana customizada: semanas de 7 dias contadas a partir da sexta-feira de referência (S25)
+SEXTA_REFERENCIA_SEMANA = date(2025, 6, 13)
+NUMERO_SEMANA_REFERENCIA = 25
+
 def get_semana_customizada(date_obj):
     try: dt = pd.to_datetime(date_obj).date()
     except (ValueError, TypeError): return "Data Inválida"
-    reference_friday = date(2025, 6, 13); reference_week_number = 25
+    reference_friday = SEXTA_REFERENCIA_SEMANA; reference_week_number = NUMERO_SEMANA_REFERENCIA
     delta_days = (dt - reference_friday).days; week_offset = delta_days // 7
     custom_week_number = reference_week_number + week_offset
     return f"S{custom_week_number}"
 
+@lru_cache(maxsize=32)
+def gerar_dimensao_calendario(data_inicio, data_fim):
+    """
+    Dimensão calendário: uma linha por dia de [data_inicio, data_fim] (posição = código do dia, dias desde
+    data_inicio) com semana customizada, mês, semana ISO, rótulos pt-BR e chaves de ordenação.
+    Memoizada: o DataFrame retornado é compartilhado e não deve ser alterado.
+    """
+    dias = pd.date_range(data_inicio, data_fim, freq='D')
+    semanas_customizadas = NUMERO_SEMANA_REFERENCIA + (dias - pd.Timestamp(SEXTA_REFERENCIA_SEMANA)).days // 7
+    segundas = dias - pd.to_timedelta(dias.weekday, unit='D')
+    return pd.DataFrame({
+        'dia': dias,
+        'semana': 'S' + pd.Index(semanas_customizadas).astype(str),
+        'mes': dias.strftime('%m-%Y'),
+        'dia_label': dias.strftime('%d/%m'),
+        'semana_label': 'S' + pd.Index(dias.isocalendar().week).astype(str),
+        'mes_label': [MESES_PT_BR[mes - 1] for mes in dias.month],
+        'semana_sort_key': segundas.strftime('%Y-%m-%d'),
+        'mes_sort_key': dias.strftime('%Y-%m'),
+    })
+
+def rotulos_calendario(datas, colunas):
+    """Colunas da dimensão calendário para cada data (Series datetime), por junção no código do dia; NaT fica nulo"""
+    dias = datas.dt.floor('D')
+    if dias.notna().sum() == 0:
+        return pd.DataFrame({coluna: pd.Series(None, index=datas.index, dtype=object) for coluna in colunas})
+    inicio = dias.min()
+    calendario = gerar_dimensao_calendario(inicio.date(), dias.max().date())
+    codigos = (dias - inicio).dt.days.fillna(-1).astype('int64').to_numpy()
+    return pd.DataFrame({
+        coluna: pd.api.extensions.take(calendario[coluna].to_numpy(), codigos, allow_fill=True)
+        for coluna in colunas
+    }, index=datas.index)
+
 def calcular_rechamadas(df_processado):
     if df_processado.empty:
         return pd.DataFrame()
@@ -674,123 +718,209 @@ def classificar_tipos_rechamada(df):
     df_sorted.loc[rechamadas_nao_classificadas, 'tipo_rechamada'] = 'Sem Motivo'
 
     df_sorted.drop(columns=['last_motivo'], inplace=True, errors='ignore')
+    df_sorted['tipo_rechamada'] = df_sorted['tipo_rechamada'].astype('category')
     return df_sorted
 
-def gerar_tabela_desempenho_atendente(df_filtrado, format_output=True, filtros_adicionais=None):
+def atualizar_rechamadas_por_origem(df, mascara_novos):
+    """
+    Recalcula is_rechamada/tipo_rechamada apenas para as origens que receberam registros novos
+    ou atualizados (mascara_novos). As demais origens mantêm o estado já calculado.
+    Sem máscara (ou sem estado calculado no histórico), recalcula tudo.
+    """
+    if df.empty or mascara_novos is None or 'is_rechamada' not in df.columns:
+        return classificar_tipos_rechamada(calcular_rechamadas(df))
+
+    mascara_novos = pd.Series(mascara_novos, index=df.index).fillna(False).astype(bool)
+    origens_afetadas = df.loc[mascara_novos, 'origem'].dropna().unique()
+    mascara_afetados = (df['origem'].isin(origens_afetadas) | mascara_novos).to_numpy()
+    logger.info(f"Recalculando rechamadas de {len(origens_afetadas):,} origens ({mascara_afetados.sum():,} de {len(df):,} registros)")
+    if not mascara_afetados.any():
+        return df
+
+    df_recalculado = classificar_tipos_rechamada(calcular_rechamadas(df[mascara_afetados]))
+    return pd.concat([df[~mascara_afetados], df_recalculado], ignore_index=True)
+
+def mapear_com_padrao(serie, mapa, valor_padrao):
+    """Equivale a serie.map(mapa).fillna(valor_padrao), mas aceita chave/resultado categóricos"""
+    if isinstance(serie.dtype, pd.CategoricalDtype) and mapa.index.is_unique:
+        # Lookup pelos códigos: resolve uma vez por categoria e mantém o dtype dos valores (ex.: string[pyarrow])
+        valores_por_categoria = mapa.reindex(serie.cat.categories).array
+        if isinstance(valores_por_categoria, pd.arrays.NumpyExtensionArray):
+            valores_por_categoria = valores_por_categoria.to_numpy()  # object: take do numpy, sem o caminho depreciado
+        valores = pd.api.extensions.take(valores_por_categoria, serie.cat.codes.to_numpy(), allow_fill=True)
+        resultado = pd.Series(valores, index=serie.index, name=serie.name)
+    else:
+        resultado = serie.map(mapa)
+    if isinstance(resultado.dtype, pd.CategoricalDtype) and valor_padrao not in resultado.cat.categories:
+        resultado = resultado.cat.add_categories([valor_padrao])
+    return resultado.fillna(valor_padrao)
+
+def gerar_dimensao_agentes(df_periodo):
+    """
+    Dimensão de agentes do período, indexada por l5_agente: nome do primeiro registro e supervisor predominante
+    (supervisor_predominante: mais frequente; empate: primeiro dia, depois ordem alfabética; sem supervisor:
+    'Não Mapeado'). Única resolução L5 -> nome/supervisor usada pelas Tabelas 1 e 2 e pelo ranking, com a
+    mesma regra dos relatórios calculados dos agregados diários.
+    """
+    if df_periodo is None or df_periodo.empty:
+        return pd.DataFrame({'nome_agente': pd.Series(dtype=object), 'supervisor': pd.Series(dtype=object)},
+                            index=pd.Index([], name='l5_agente'))
+    dimensao = df_periodo.groupby('l5_agente', observed=True).agg(nome_agente=('nome_agente', 'first'))
+
+    pares = pd.DataFrame({
+        'l5_agente': df_periodo['l5_agente'].to_numpy(),
+        'supervisor': df_periodo['supervisor'].astype(object).to_numpy(),
+        'dia': df_periodo['data_hora_contato'].dt.floor('D').to_numpy(),
+    }).dropna(subset=['l5_agente', 'supervisor'])
+    contagens = pares.groupby(['l5_agente', 'supervisor'], sort=False).agg(
+        registros=('dia', 'size'), primeiro_dia=('dia', 'min')
+    ).reset_index()
+    modas = supervisor_predominante(contagens)
+    dimensao['supervisor'] = modas.reindex(dimensao.index.astype(object)).fillna('Não Mapeado').to_numpy()
+    return dimensao
+
+def fatiar_periodo(df, data_inicio, data_fim, coluna='data_hora_contato'):
+    """
+    Recorta os registros de [data_inicio 00:00, data_fim 23:59:59] por busca binária em `coluna`.
+    Exige df ordenado por `coluna` (o cache do app é mantido assim); retorna uma fatia posicional, sem cópia.
+    """
+    tempos = df[coluna]
+    inicio = tempos.searchsorted(datetime.combine(data_inicio, datetime.min.time()), side='left')
+    fim = tempos.searchsorted(datetime.combine(data_fim, datetime.max.time()), side='right')
+    return df.iloc[inicio:fim]
+
+def normalizar_valores_filtro(serie, valores):
+    """Converte os valores de filtro (texto vindo do frontend) para o dtype da coluna filtrada"""
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return pd.to_numeric(pd.Series(valores, dtype=object), errors='coerce').dropna().astype('int64').tolist()
+    return valores
+
+# Filtros aplicados às rechamadas pelo atributo do L5 que causou, lido da dimensão de agentes do período
+# (gerar_dimensao_agentes, a mesma da Tabela 2): coluna -> valor para L5 fora da dimensão (None: nunca passa).
+# Um valor por L5: L5 com vários supervisores ou nomes no período só passa com o supervisor predominante ou
+# o nome da dimensão (antes bastava um registro do L5 sob os filtros). Rechamada sem L5 atribuído não passa.
+FILTROS_ATRIBUICAO_L5 = {
+    'supervisor': 'Não Mapeado',
+    'nome_agente': None,
+}
+
+def mascara_atribuicao_l5(l5s, atributos_l5, filtros):
+    """
+    Máscara das rechamadas cujo L5 atribuído passa nos filtros de atribuição. Cada filtro vira o conjunto de
+    L5s permitidos na tabela de atributos (um valor por L5) e é resolvido por isin nos códigos categóricos.
+    """
+    mascara = l5s.notna().to_numpy()
+    for coluna, valores in filtros.items():
+        if not valores or coluna not in FILTROS_ATRIBUICAO_L5 or coluna not in atributos_l5.columns:
+            continue
+        atributo = atributos_l5[coluna]
+        mascara_coluna = l5s.isin(atributo.index[atributo.isin(valores).to_numpy()]).to_numpy()
+        padrao = FILTROS_ATRIBUICAO_L5[coluna]
+        if padrao is not None and padrao in valores:
+            mascara_coluna |= ~l5s.isin(atributo.index).to_numpy()
+        mascara &= mascara_coluna
+    return mascara
+
+def _diagnosticar_tabela1(l5s, df_agentes, df_rechamadas, df_para_contagem):
+    """Rechamadas por supervisor (L5 -> supervisor do primeiro registro no período) e detalhe dos L5s pedidos"""
+    rechamadas_por_l5 = df_rechamadas.groupby('rechamada_atribuida_l5', observed=True).size()
+    rechamadas_por_l5 = rechamadas_por_l5[rechamadas_por_l5 > 0]
+    primeiro_registro = df_para_contagem.drop_duplicates(subset=['l5_agente']).set_index('l5_agente')
+    supervisores = mapear_com_padrao(pd.Series(rechamadas_por_l5.index.astype(object), index=rechamadas_por_l5.index),
+                                     primeiro_registro['supervisor'], 'Desconhecido')
+    registrar_diagnostico('tabela1.rechamadas_por_supervisor',
+                          totais=rechamadas_por_l5.groupby(supervisores.astype(object).to_numpy()).sum().to_dict())
+    for l5 in l5s:
+        agente = df_agentes[df_agentes['l5_agente'] == l5]
+        registrar_diagnostico('tabela1.l5', l5=l5, encontrado=not agente.empty,
+                              nome=agente['nome_agente'].iloc[0] if not agente.empty else None,
+                              supervisor=agente['supervisor'].iloc[0] if not agente.empty else None,
+                              rechamadas=int(rechamadas_por_l5.get(l5, 0)))
+
+def _diagnosticar_tabela2(l5s, df_completo, df_rechamadas, name_map, supervisor_map):
+    """Resumo da atribuição das rechamadas e, para os L5s pedidos, mapeamento e registros originais"""
+    supervisores = df_rechamadas['rechamada_atribuida_supervisor'].astype(object)
+    registrar_diagnostico('tabela2.atribuicao', registros=len(df_rechamadas),
+                          com_supervisor=int((supervisores != 'Não Mapeado').sum()),
+                          rechamadas_por_supervisor=supervisores.value_counts().to_dict(),
+                          nomes_mais_frequentes=df_rechamadas['rechamada_atribuida_nome'].astype(object).value_counts().head(10).to_dict())
+    for l5 in l5s:
+        do_l5 = df_completo[df_completo['l5_agente'] == l5]
+        causadas = df_completo[df_completo['rechamada_atribuida_l5'] == l5]
+        registrar_diagnostico('tabela2.l5', l5=l5, nome=name_map.get(l5), supervisor=supervisor_map.get(l5),
+                              rechamadas_periodo=int((df_rechamadas['rechamada_atribuida_l5'] == l5).sum()),
+                              rechamadas_dataset=len(causadas),
+                              amostras=causadas[['data_hora_contato', 'rechamada_atribuida_l5', 'is_rechamada']].head(3).to_dict('records'),
+                              nomes_originais=sorted(do_l5['nome_agente'].dropna().astype(str).unique()),
+                              supervisores_originais=sorted(do_l5['supervisor'].dropna().astype(str).unique()))
+
+def gerar_tabela_desempenho_atendente(df_filtrado, format_output=True, filtros_adicionais=None, dimensao_agentes=None, indices_filtros=None):
+    """
+    Tabela 1 (desempenho por agente) a partir dos registros do período. `dimensao_agentes` (gerar_dimensao_agentes
+    do mesmo período) dá o supervisor de cada L5 e os atributos dos filtros de atribuição; calculada se ausente.
+    `indices_filtros` (construir_indices_bitmap do snapshot de onde df_filtrado foi recortado) acelera os filtros.
+    """
     if df_filtrado is None or df_filtrado.empty:
         return pd.DataFrame()
     
     # PRIMEIRA: Calcular rechamadas ANTES de aplicar filtros
-    df_rechamadas = df_filtrado[df_filtrado['is_rechamada'] == True].copy()
+    df_rechamadas = df_filtrado[df_filtrado['is_rechamada'] == True]
     logger.info(f"Tabela1 - Rechamadas do período: {len(df_rechamadas)} registros")
     if df_rechamadas.empty:
         return pd.DataFrame()
     
     # CORREÇÃO MAJOR: NÃO filtrar o dataset por agentes/supervisores
     # Isso será feito DEPOIS no filtro de rechamadas, igual à Tabela 2
-    df_para_contagem = df_filtrado.copy()
-
     # Aplicar filtros no df_para_contagem para obter lista correta de agentes filtrados
+    # (uma máscara acumulada e um único recorte, sem copiar o frame a cada filtro)
+    # Dimensões indexadas resolvem pelos bitmaps do snapshot (indices_filtros); as demais por isin
+    df_para_contagem = df_filtrado
     if filtros_adicionais:
+        mascara, colunas_indexadas = mascara_filtros_indexados(df_filtrado, filtros_adicionais, indices_filtros)
+        if mascara is None:
+            mascara = np.ones(len(df_filtrado), dtype=bool)
+        else:
+            logger.info(f"Tabela1 - Filtros indexados {colunas_indexadas}: {int(mascara.sum())} registros restantes")
         for coluna, valores in filtros_adicionais.items():
-            if valores and coluna in df_para_contagem.columns:
-                df_para_contagem = df_para_contagem[df_para_contagem[coluna].isin(valores)]
-                logger.info(f"Tabela1 - Aplicado filtro {coluna}={valores}: {len(df_para_contagem)} registros restantes")
+            if valores and coluna in df_filtrado.columns and coluna not in colunas_indexadas:
+                mascara &= df_filtrado[coluna].isin(normalizar_valores_filtro(df_filtrado[coluna], valores)).to_numpy()
+                logger.info(f"Tabela1 - Aplicado filtro {coluna}={valores}: {int(mascara.sum())} registros restantes")
+        df_para_contagem = df_filtrado[mascara]
 
-    df_filtrado_final = df_para_contagem.copy()
+    df_filtrado_final = df_para_contagem
 
     # Guardar filtros para aplicar nas rechamadas depois
     filtros_para_rechamadas = filtros_adicionais
 
-    # ---- BLOCO DE CÓDIGO CORRIGIDO E NO LUGAR CERTO ----
-    # Primeiro, definimos a função de apoio para escolher o supervisor
-    def supervisor_mais_frequente_tabela1(series):
-        """Retorna o supervisor mais frequente no período"""
-        counts = series.value_counts()
-        if counts.empty:
-            return 'Não Mapeado'
-        return counts.index[0]  # Supervisor com mais ocorrências
-
-    # Agora, usamos a função para pegar supervisor mais frequente
-    df_agentes = df_filtrado_final.groupby(['l5_agente', 'nome_agente']).agg(
+    # Supervisor de cada L5 vem da dimensão de agentes do período (a mesma da Tabela 2 e do ranking)
+    if dimensao_agentes is None:
+        dimensao_agentes = gerar_dimensao_agentes(df_filtrado)
+    df_agentes = df_filtrado_final.groupby(['l5_agente', 'nome_agente'], observed=True).agg(
         Contagem_de_Ligacoes=('protocolo', 'count'),
-        media_tempo_ligacao=('tempo_atendimento', 'mean'),
-        supervisor=('supervisor', supervisor_mais_frequente_tabela1)
+        media_tempo_ligacao=('tempo_atendimento', 'mean')
     ).reset_index()
+    # Média sem as durações nulas (Int32 anulável -> Float64); float64 como na Tabela 1 dos agregados
+    df_agentes['media_tempo_ligacao'] = df_agentes['media_tempo_ligacao'].astype('float64')
+    df_agentes['supervisor'] = mapear_com_padrao(df_agentes['l5_agente'], dimensao_agentes['supervisor'], 'Não Mapeado').astype(object)
 
-    # DEBUG: Verificar qual supervisor a safe_mode escolheu para Jhennifer
-    jhennifer_tabela1 = df_agentes[df_agentes['l5_agente'] == '2073']
-    if not jhennifer_tabela1.empty:
-        supervisor_escolhido = jhennifer_tabela1['supervisor'].iloc[0]
-        nome_escolhido = jhennifer_tabela1['nome_agente'].iloc[0]
-        logger.info(f"TABELA1 - L5 2073 supervisor: {supervisor_escolhido}, nome: '{nome_escolhido}'")
-    else:
-        logger.info("TABELA1 - L5 2073 (Jhennifer) não encontrado na Tabela 1")
-    # ---- FIM DO BLOCO CORRIGIDO ----
-
-    # SUPER DEBUG: Log detalhado das rechamadas por supervisor
-    if 'supervisor' in df_para_contagem.columns:
-        supervisor_counts = df_rechamadas.groupby('rechamada_atribuida_l5').size()
-        logger.info(f"TABELA1 - Rechamadas por agente (rechamada_atribuida_l5): {dict(supervisor_counts)}")
-
-        # Mapear L5 para supervisor para debug
-        agent_map = df_para_contagem.drop_duplicates(subset=['l5_agente']).set_index('l5_agente')['supervisor']
-        supervisor_totals = {}
-        supervisor_details = {}
-        for l5, count in supervisor_counts.items():
-            supervisor = agent_map.get(l5, 'Desconhecido')
-            supervisor_totals[supervisor] = supervisor_totals.get(supervisor, 0) + count
-            if supervisor not in supervisor_details:
-                supervisor_details[supervisor] = {}
-            # Mapear L5 para nome do agente
-            nome_agente = df_para_contagem[df_para_contagem['l5_agente'] == l5]['nome_agente'].iloc[0] if len(df_para_contagem[df_para_contagem['l5_agente'] == l5]) > 0 else 'Desconhecido'
-            supervisor_details[supervisor][nome_agente] = count
-
-        logger.info(f"TABELA1 - Total por supervisor: {supervisor_totals}")
-
-        # LOG ESPECÍFICO PARA BEATRIZ
-        if 'Beatriz Costa' in supervisor_details:
-            beatriz_total = sum(supervisor_details['Beatriz Costa'].values())
-            logger.info(f"TABELA1 - BEATRIZ COSTA DETALHADO:")
-            logger.info(f"TABELA1 - Agentes e rechamadas: {supervisor_details['Beatriz Costa']}")
-            logger.info(f"TABELA1 - Total calculado: {beatriz_total}")
-            logger.info(f"TABELA1 - Total do dicionário: {supervisor_totals.get('Beatriz Costa', 0)}")
+    # Diagnóstico (?debug=...): só roda quando ligado para a requisição
+    config_diagnostico = diagnostico_ativo()
+    if config_diagnostico:
+        _diagnosticar_tabela1(config_diagnostico['l5s'], df_agentes, df_rechamadas, df_para_contagem)
 
     # CORREÇÃO FINAL: Filtrar rechamadas usando MESMA LÓGICA da Tabela 2
-    if filtros_para_rechamadas:
-        df_rechamadas_filtradas = df_rechamadas.copy()
-
-        # Criar mapeamento L5→supervisor baseado no período (igual à Tabela 2)
-        agent_map_filtro = df_para_contagem.drop_duplicates(subset=['l5_agente']).set_index('l5_agente')['supervisor']
-
-        # Aplicar cada filtro
-        for coluna, valores in filtros_para_rechamadas.items():
-            if valores:
-                if coluna == 'supervisor':
-                    # CORREÇÃO: Filtrar rechamadas diretamente por supervisor mapeado
-                    # Aplicar o mapeamento L5→supervisor para cada rechamada e filtrar
-                    def supervisor_match(row):
-                        l5 = row['rechamada_atribuida_l5']
-                        if pd.notna(l5):
-                            supervisor = agent_map_filtro.get(l5, 'Não Mapeado')
-                            return supervisor in valores
-                        return False
-
-                    antes = len(df_rechamadas_filtradas)
-                    df_rechamadas_filtradas = df_rechamadas_filtradas[df_rechamadas_filtradas.apply(supervisor_match, axis=1)]
-                    logger.info(f"Tabela1 - Filtro supervisor={valores}: {antes} → {len(df_rechamadas_filtradas)} rechamadas")
-
-                elif coluna == 'nome_agente':
-                    # Pegar L5s dos agentes filtrados
-                    agentes_filtrados_l5 = df_para_contagem['l5_agente'].unique()
-                    antes = len(df_rechamadas_filtradas)
-                    df_rechamadas_filtradas = df_rechamadas_filtradas[df_rechamadas_filtradas['rechamada_atribuida_l5'].isin(agentes_filtrados_l5)]
-                    logger.info(f"Tabela1 - Filtro nome_agente={valores}: {antes} → {len(df_rechamadas_filtradas)} rechamadas")
+    # Atributos de cada L5 na dimensão de agentes, consultados pelos códigos de rechamada_atribuida_l5
+    if filtros_para_rechamadas and any(valores for coluna, valores in filtros_para_rechamadas.items() if coluna in FILTROS_ATRIBUICAO_L5):
+        mascara = mascara_atribuicao_l5(df_rechamadas['rechamada_atribuida_l5'], dimensao_agentes, filtros_para_rechamadas)
+        df_rechamadas_filtradas = df_rechamadas[mascara]
+        logger.info(f"Tabela1 - Filtros de atribuição {[c for c in filtros_para_rechamadas if c in FILTROS_ATRIBUICAO_L5]}: {len(df_rechamadas)} → {len(df_rechamadas_filtradas)} rechamadas")
     else:
         df_rechamadas_filtradas = df_rechamadas
 
-    contagem_rechamadas = df_rechamadas_filtradas.groupby('rechamada_atribuida_l5')['tipo_rechamada'].value_counts().unstack(fill_value=0)
-    logger.info(f"Tabela1 - Contagem de rechamadas por agente: {dict(contagem_rechamadas.sum(axis=1))}")
+    contagem_rechamadas = df_rechamadas_filtradas.groupby('rechamada_atribuida_l5', observed=True)['tipo_rechamada'].value_counts().unstack(fill_value=0)
+    contagem_rechamadas.columns = contagem_rechamadas.columns.astype(str)
+    if config_diagnostico:
+        registrar_diagnostico('tabela1.contagem_rechamadas', por_l5=contagem_rechamadas.sum(axis=1).to_dict())
     if 'Com Motivo' not in contagem_rechamadas: contagem_rechamadas['Com Motivo'] = 0
     if 'Sem Motivo' not in contagem_rechamadas: contagem_rechamadas['Sem Motivo'] = 0
     contagem_rechamadas = contagem_rechamadas.rename(columns={'Com Motivo': 'Rechamada com Motivo', 'Sem Motivo': 'Rechamada sem Motivo'})
@@ -814,9 +944,11 @@ def gerar_tabela_desempenho_atendente(df_filtrado, format_output=True, filtros_a
     df_tabela1 = df_tabela1[[col for col in ordem_colunas_final if col in df_tabela1.columns]]
     return df_tabela1
 
-def gerar_tabela_detalhes_rechamadas(df_completo, data_inicio_filtro, data_fim_filtro, filtros_adicionais=None):
+def gerar_tabela_detalhes_rechamadas(df_completo, data_inicio_filtro, data_fim_filtro, filtros_adicionais=None, dimensao_agentes=None, indices_filtros=None):
     """
     Gera tabela de detalhes de rechamadas, com suporte a filtros adicionais.
+    Nome/supervisor de quem causou vêm de `dimensao_agentes` (calculada sobre o período se ausente).
+    Os filtros viram uma máscara só (bitmaps de `indices_filtros` + isin) e um único recorte.
     """
     colunas_finais = [
         'Nome', 'Supervisor', 'Origem', 'DDD', 'Local (Cidade e Estado)', 'MVNO', 'Categoria',
@@ -831,166 +963,61 @@ def gerar_tabela_detalhes_rechamadas(df_completo, data_inicio_filtro, data_fim_f
     
     try:
         # ABORDAGEM MINIMALISTA: Apenas filtra e retorna dados básicos
-        df_completo['data_hora_contato'] = pd.to_datetime(df_completo['data_hora_contato'])
-        
-        # CORRIGIDO: Usar filtro datetime igual ao da Tabela 1
-        start_dt = datetime.combine(data_inicio_filtro, datetime.min.time())
-        end_dt = datetime.combine(data_fim_filtro, datetime.max.time())
-
-        rechamadas_filtro = (
-            (df_completo['is_rechamada'] == True) &
-            (df_completo['data_hora_contato'] >= start_dt) &
-            (df_completo['data_hora_contato'] <= end_dt)
-        )
-        
+        # CORRIGIDO: Usar filtro datetime igual ao da Tabela 1 (df_completo vem ordenado por data_hora_contato)
+        df_periodo = fatiar_periodo(df_completo, data_inicio_filtro, data_fim_filtro)
+
         # Retorna todos os dados das rechamadas, sem limitação artificial
-        df_rechamadas = df_completo.loc[rechamadas_filtro].copy()
+        df_rechamadas = df_periodo.loc[df_periodo['is_rechamada'] == True].copy()
         
         # IMPORTANTE: Cria campos de atribuição ANTES dos filtros
         if 'rechamada_atribuida_nome' not in df_rechamadas.columns:
-            # CORREÇÃO DEFINITIVA: Usar EXATAMENTE a mesma lógica da Tabela 1
-            # Aplicar safe_mode para escolher o supervisor correto quando há múltiplos
-            def safe_mode(series):
-                mode_result = series.mode()
-                if mode_result.empty:
-                    return series.iloc[0] if not series.empty else 'Não Mapeado'
-                return mode_result.iloc[0]
-
-            # Usar groupby + safe_mode igual à Tabela 1
-            # CORREÇÃO: Para nome, usar o primeiro registro (dataset principal)
-            # Para supervisor, usar o mais frequente (moda)
-            def supervisor_mais_frequente(series):
-                """Retorna o supervisor mais frequente no período"""
-                counts = series.value_counts()
-                if counts.empty:
-                    return 'Não Mapeado'
-                return counts.index[0]  # Supervisor com mais ocorrências
-
-            agent_mapping = df_completo.groupby('l5_agente').agg(
-                nome_agente=('nome_agente', 'first'),  # Nome do dataset principal
-                supervisor=('supervisor', supervisor_mais_frequente)  # Supervisor mais frequente
-            )
-
-            name_map = agent_mapping['nome_agente']
-            supervisor_map = agent_mapping['supervisor']
-
-            df_rechamadas['rechamada_atribuida_nome'] = df_rechamadas['rechamada_atribuida_l5'].map(name_map).fillna('Agente Desconhecido')
-            df_rechamadas['rechamada_atribuida_supervisor'] = df_rechamadas['rechamada_atribuida_l5'].map(supervisor_map).fillna('Não Mapeado')
-
-            # DEBUG: Verificar nome exato da Jhennifer
-            jhennifer_nome_tabela2 = name_map.get('2073', 'Não encontrado')
-            logger.info(f"TABELA2 - Nome exato L5 2073: '{jhennifer_nome_tabela2}'")
-
-            # DEBUG: Verificar especificamente o L5 2073 (Jhennifer)
-            jhennifer_l5 = '2073'
-            jhennifer_supervisor = supervisor_map.get(jhennifer_l5, 'Não Mapeado')
-            jhennifer_nome = name_map.get(jhennifer_l5, 'Não Mapeado')
-            jhennifer_rechamadas = len(df_rechamadas[df_rechamadas['rechamada_atribuida_l5'] == jhennifer_l5])
-
-            logger.info(f"TABELA2 - L5 2073 (Jhennifer): Supervisor={jhennifer_supervisor}, Nome={jhennifer_nome}, Rechamadas={jhennifer_rechamadas}")
-
-            # DEBUG: Verificar se existem rechamadas com L5 2073 no dataset completo
-            total_rechamadas_2073 = len(df_completo[df_completo['rechamada_atribuida_l5'] == '2073'])
-            rechamadas_2073_periodo = len(df_rechamadas[df_rechamadas['rechamada_atribuida_l5'] == '2073'])
-            logger.info(f"TABELA2 - Total rechamadas L5 2073 no dataset completo: {total_rechamadas_2073}")
-            logger.info(f"TABELA2 - Rechamadas L5 2073 no período filtrado: {rechamadas_2073_periodo}")
-
-            # DEBUG: Verificar algumas rechamadas do L5 2073 se existirem
-            if total_rechamadas_2073 > 0:
-                amostras_2073 = df_completo[df_completo['rechamada_atribuida_l5'] == '2073'][['data_hora_contato', 'rechamada_atribuida_l5', 'is_rechamada']].head(3)
-                logger.info(f"TABELA2 - Amostras rechamadas L5 2073: {amostras_2073.to_dict('records')}")
-
-            # DEBUG: Verificar se o mapeamento está igual ao da Tabela 1
-            beatriz_l5s_tabela1 = ['2000', '2034', '2092', '2107', '2105', '2156', '2158', '2073', '2039', '2059', '2075', '2116', '2028', '8011', '2033']
-            beatriz_mapeados = 0
-            for l5 in beatriz_l5s_tabela1:
-                supervisor_mapeado = supervisor_map.get(l5, 'Não Mapeado')
-                if supervisor_mapeado == 'Beatriz Costa':
-                    beatriz_mapeados += 1
-                logger.info(f"TABELA2 - L5 {l5} mapeado para: {supervisor_mapeado}")
-            logger.info(f"TABELA2 - Total L5s da Beatriz mapeados corretamente: {beatriz_mapeados}/15")
-
-            # DEBUG: Contar rechamadas por supervisor na Tabela 2
-            rechamadas_por_supervisor = df_rechamadas['rechamada_atribuida_supervisor'].value_counts()
-            logger.info(f"TABELA2 - Rechamadas por supervisor: {rechamadas_por_supervisor.to_dict()}")
-
-            beatriz_rechamadas_tabela2 = len(df_rechamadas[df_rechamadas['rechamada_atribuida_supervisor'] == 'Beatriz Costa'])
-            logger.info(f"TABELA2 - Total rechamadas Beatriz Costa: {beatriz_rechamadas_tabela2}")
-
-            # DEBUG: Log para verificar mapeamento
-            logger.info(f"Tabela2 - Registros antes do mapeamento: {len(df_rechamadas)}")
-            logger.info(f"Tabela2 - Registros com supervisor mapeado: {len(df_rechamadas[df_rechamadas['rechamada_atribuida_supervisor'] != 'Não Mapeado'])}")
-            logger.info(f"Tabela2 - Valores únicos de rechamada_atribuida_supervisor: {df_rechamadas['rechamada_atribuida_supervisor'].value_counts().to_dict()}")
-            logger.info(f"Tabela2 - Valores únicos de rechamada_atribuida_nome: {df_rechamadas['rechamada_atribuida_nome'].value_counts().head(10).to_dict()}")
-
-            # DEBUG ESPECÍFICO: Procurar Jessica
-            jessica_rechamadas = df_rechamadas[df_rechamadas['rechamada_atribuida_nome'].str.contains('Jessica', case=False, na=False)]
-            logger.info(f"Tabela2 - Rechamadas da Jessica: {len(jessica_rechamadas)}")
-            if len(jessica_rechamadas) > 0:
-                logger.info(f"Tabela2 - L5s da Jessica: {jessica_rechamadas['rechamada_atribuida_l5'].unique()}")
-
-            # DEBUG ESPECÍFICO: Contar Beatriz Costa
-            beatriz_rechamadas = df_rechamadas[df_rechamadas['rechamada_atribuida_supervisor'] == 'Beatriz Costa']
-            logger.info(f"TABELA2 - BEATRIZ COSTA: {len(beatriz_rechamadas)} rechamadas")
-            if len(beatriz_rechamadas) > 0:
-                beatriz_agentes = beatriz_rechamadas.groupby('rechamada_atribuida_nome').size().to_dict()
-                logger.info(f"TABELA2 - Agentes da Beatriz: {beatriz_agentes}")
-                logger.info(f"TABELA2 - Total calculado: {sum(beatriz_agentes.values())}")
-
-                # DEBUG: Verificar L5s que não foram mapeados
-                l5s_esperados = ['2000', '2034', '2092', '2107', '2105', '2156', '2158', '2073', '2039', '2059', '2075', '2116', '2028', '8011', '2033']
-                l5s_encontrados = beatriz_rechamadas['rechamada_atribuida_l5'].unique()
-                l5s_faltando = [l5 for l5 in l5s_esperados if l5 not in l5s_encontrados]
-                logger.info(f"TABELA2 - L5s esperados: {l5s_esperados}")
-                logger.info(f"TABELA2 - L5s encontrados: {sorted(l5s_encontrados)}")
-                logger.info(f"TABELA2 - L5s faltando: {l5s_faltando}")
-
-                # DEBUG: Verificar se existem esses L5s no dataset completo
-                for l5_faltando in l5s_faltando:
-                    existe_no_dataset = len(df_rechamadas[df_rechamadas['rechamada_atribuida_l5'] == l5_faltando])
-                    logger.info(f"TABELA2 - L5 {l5_faltando} existe no dataset: {existe_no_dataset} rechamadas")
-
-                    if existe_no_dataset > 0:
-                        # Verificar qual supervisor está mapeado para esse L5
-                        supervisor_mapeado = df_rechamadas[df_rechamadas['rechamada_atribuida_l5'] == l5_faltando]['rechamada_atribuida_supervisor'].iloc[0]
-                        nome_mapeado = df_rechamadas[df_rechamadas['rechamada_atribuida_l5'] == l5_faltando]['rechamada_atribuida_nome'].iloc[0]
-                        logger.info(f"TABELA2 - L5 {l5_faltando} mapeado como: {nome_mapeado} | Supervisor: {supervisor_mapeado}")
-
-                # DEBUG: Verificar o mapeamento original no dataset completo
-                logger.info("TABELA2 - Verificando mapeamento original...")
-                for l5_esperado in l5s_esperados:
-                    supervisor_original = df_completo[df_completo['l5_agente'] == l5_esperado]['supervisor'].unique()
-                    nome_original = df_completo[df_completo['l5_agente'] == l5_esperado]['nome_agente'].unique()
-                    logger.info(f"TABELA2 - L5 {l5_esperado} original: {nome_original} | Supervisor original: {supervisor_original}")
-
-        # Aplica filtros adicionais se fornecidos
+            # Mesma dimensão de agentes da Tabela 1: nome do primeiro registro, supervisor predominante
+            if dimensao_agentes is None:
+                dimensao_agentes = gerar_dimensao_agentes(df_periodo)
+            name_map = dimensao_agentes['nome_agente']
+            supervisor_map = dimensao_agentes['supervisor']
+
+            df_rechamadas['rechamada_atribuida_nome'] = mapear_com_padrao(df_rechamadas['rechamada_atribuida_l5'], name_map, 'Agente Desconhecido')
+            df_rechamadas['rechamada_atribuida_supervisor'] = mapear_com_padrao(df_rechamadas['rechamada_atribuida_l5'], supervisor_map, 'Não Mapeado')
+
+            config_diagnostico = diagnostico_ativo()
+            if config_diagnostico:
+                _diagnosticar_tabela2(config_diagnostico['l5s'], df_completo, df_rechamadas, name_map, supervisor_map)
+
+        # Aplica filtros adicionais se fornecidos: máscara acumulada sobre as rechamadas e um único recorte
         if filtros_adicionais:
             logger.info(f"Tabela2 - Aplicando filtros adicionais: {filtros_adicionais}")
             logger.info(f"Tabela2 - Dataset antes dos filtros: {len(df_rechamadas)} registros")
-            
+            mascara = np.ones(len(df_rechamadas), dtype=bool)
+
+            # supervisor na Tabela 2 é o de quem causou (rechamada_atribuida_supervisor), fora do índice
+            filtros_indexaveis = {coluna: valores for coluna, valores in filtros_adicionais.items() if coluna != 'supervisor'}
+            mascara_periodo, colunas_indexadas = mascara_filtros_indexados(df_periodo, filtros_indexaveis, indices_filtros)
+            if mascara_periodo is not None:
+                mascara &= mascara_periodo[(df_periodo['is_rechamada'] == True).to_numpy()]
+                logger.info(f"Tabela2 - Filtros indexados {colunas_indexadas}: {int(mascara.sum())} registros restantes")
+
             for coluna, valores in filtros_adicionais.items():
-                if valores:  # Só processa se valores não estão vazios
+                if valores and coluna not in colunas_indexadas:  # Só processa se valores não estão vazios
                     # MAPEAMENTO ESPECIAL: para tabela 2, nome_agente deve filtrar por rechamada_atribuida_nome
                     if coluna == 'nome_agente':
                         if 'rechamada_atribuida_nome' in df_rechamadas.columns:
-                            antes = len(df_rechamadas)
-                            df_rechamadas = df_rechamadas[df_rechamadas['rechamada_atribuida_nome'].isin(valores)]
-                            logger.info(f"Tabela2 - Filtro {coluna}→rechamada_atribuida_nome={valores}: {antes} → {len(df_rechamadas)} registros")
+                            mascara &= df_rechamadas['rechamada_atribuida_nome'].isin(valores).to_numpy()
+                            logger.info(f"Tabela2 - Filtro {coluna}→rechamada_atribuida_nome={valores}: {int(mascara.sum())} registros restantes")
                         else:
                             logger.warning(f"Tabela2 - Campo rechamada_atribuida_nome não existe ainda")
                     elif coluna == 'supervisor':
                         if 'rechamada_atribuida_supervisor' in df_rechamadas.columns:
-                            antes = len(df_rechamadas)
-                            df_rechamadas = df_rechamadas[df_rechamadas['rechamada_atribuida_supervisor'].isin(valores)]
-                            logger.info(f"Tabela2 - Filtro {coluna}→rechamada_atribuida_supervisor={valores}: {antes} → {len(df_rechamadas)} registros")
+                            mascara &= df_rechamadas['rechamada_atribuida_supervisor'].isin(valores).to_numpy()
+                            logger.info(f"Tabela2 - Filtro {coluna}→rechamada_atribuida_supervisor={valores}: {int(mascara.sum())} registros restantes")
                         else:
                             logger.warning(f"Tabela2 - Campo rechamada_atribuida_supervisor não existe ainda")
                     elif coluna in df_rechamadas.columns:
-                        antes = len(df_rechamadas)
-                        df_rechamadas = df_rechamadas[df_rechamadas[coluna].isin(valores)]
-                        logger.info(f"Tabela2 - Filtro {coluna}={valores}: {antes} → {len(df_rechamadas)} registros")
+                        mascara &= df_rechamadas[coluna].isin(normalizar_valores_filtro(df_rechamadas[coluna], valores)).to_numpy()
+                        logger.info(f"Tabela2 - Filtro {coluna}={valores}: {int(mascara.sum())} registros restantes")
                     else:
                         logger.warning(f"Tabela2 - Filtro ignorado {coluna} (coluna não existe)")
+            df_rechamadas = df_rechamadas[mascara]
         
         logger.info(f"Retornando {len(df_rechamadas)} rechamadas após filtros")
         
@@ -1015,7 +1042,9 @@ def gerar_tabela_detalhes_rechamadas(df_completo, data_inicio_filtro, data_fim_f
         # Adiciona colunas calculadas essenciais
         # IMPORTANTE: Usa tempo_atendimento_original (da chamada que causou), não da rechamada
         df_resultado['Tempo de Atendimento'] = df_resultado.get('tempo_atendimento_original', 0).apply(formatar_segundos_para_hhmmss)
-        df_resultado['Semana'] = df_resultado['data_hora_contato'].apply(get_semana_customizada)
+        if 'Origem' in df_resultado.columns:
+            df_resultado['Origem'] = origem_como_texto(df_resultado['Origem'])
+        df_resultado['Semana'] = rotulos_calendario(df_resultado['data_hora_contato'], ['semana'])['semana']
         df_resultado['Data/Hora da Chamada Original'] = df_resultado.get('data_chamada_original', '')
         df_resultado['Data/Hora da Rechamada'] = df_resultado['data_hora_contato']
         
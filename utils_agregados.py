@@ -0,0 +1,298 @@
+import logging
+import os
+import pandas as pd
+import config
+from utils_armazenamento import (
+    assinatura_dataset_valida, registrar_assinatura_dataset, invalidar_assinatura_dataset, pasta_agregados_snapshot, padronizar_texto
+)
+
+logger = logging.getLogger(__name__)
+
+# Agregados diários aditivos (somas e contagens, nunca médias): qualquer período é respondido
+# somando as linhas dos dias do intervalo. nome -> colunas de agrupamento além de 'dia'
+AGREGADOS_DIARIOS = {
+    'agente_dia': ['l5_agente', 'nome_agente', 'supervisor'],
+    'rechamada_l5_dia': ['rechamada_atribuida_l5', 'tipo_rechamada'],
+    'supervisor_dia': ['supervisor'],
+    'mvno_dia': ['mvno'],
+    'motivo_dia': ['motivo_categoria'],
+    'status_dia': ['status_ligacao'],
+}
+# Agregados usados pelos relatórios de reconciliação (/validar-contagem e /diagnostico-nao-mapeado)
+AGREGADOS_RECONCILIACAO = ['agente_dia', 'rechamada_l5_dia', 'mvno_dia', 'status_dia']
+
+def _caminho_agregado(pasta, nome):
+    return os.path.join(pasta, f"{nome}.parquet")
+
+def _agregar_por_dia(df, chaves):
+    tipo = df['tipo_rechamada'].astype(object) if 'tipo_rechamada' in df.columns else pd.Series(pd.NA, index=df.index)
+    is_rechamada = df['is_rechamada'].fillna(False).astype(bool)
+    df_base = pd.DataFrame({
+        'dia': df['data_hora_contato'].dt.floor('D'),
+        **{col: df[col] for col in chaves},
+        'ligacoes': df['protocolo'].notna().astype('int32'),
+        'registros': 1,
+        # Duração ausente fica fora da soma e da contagem usada na média
+        'soma_tempo_atendimento': df['tempo_atendimento'].fillna(0).astype('int64'),
+        'atendimentos_com_tempo': df['tempo_atendimento'].notna().astype('int32'),
+        'rechamadas': is_rechamada.astype('int32'),
+        'rechamadas_com_motivo': (is_rechamada & (tipo == 'Com Motivo')).astype('int32'),
+        'rechamadas_sem_motivo': (is_rechamada & (tipo == 'Sem Motivo')).astype('int32'),
+    })
+    return df_base.groupby(['dia'] + chaves, observed=True, dropna=False, sort=True).sum().reset_index()
+
+def gerar_agregados_diarios(df):
+    """Calcula os agregados diários a partir do dataset consolidado (já com rechamadas classificadas)."""
+    agregados = {}
+    if df is None or df.empty:
+        return agregados
+    for nome, chaves in AGREGADOS_DIARIOS.items():
+        if not all(col in df.columns for col in chaves):
+            logger.warning(f"Agregado '{nome}' ignorado: colunas ausentes no dataset")
+            continue
+        if nome == 'rechamada_l5_dia':
+            # Rechamadas contadas para o agente que atendeu a ligação anterior
+            df_rechamadas = df[df['is_rechamada'] == True]
+            agregados[nome] = (df_rechamadas.assign(dia=df_rechamadas['data_hora_contato'].dt.floor('D'))
+                               .groupby(['dia'] + chaves, observed=True, dropna=False, sort=True)
+                               .size().rename('rechamadas').reset_index())
+        else:
+            agregados[nome] = _agregar_por_dia(df, chaves)
+    return agregados
+
+def salvar_agregados_diarios(agregados, caminho_dataset):
+    """
+    Grava os agregados na pasta do snapshot (pasta_agregados_snapshot): a assinatura é removida antes e
+    registrada só depois de todos os arquivos (cada um via temporário e os.replace).
+    """
+    pasta = pasta_agregados_snapshot(caminho_dataset)
+    os.makedirs(pasta, exist_ok=True)
+    invalidar_assinatura_dataset(pasta)
+    for nome, df_agregado in agregados.items():
+        caminho = _caminho_agregado(pasta, nome)
+        caminho_tmp = f"{caminho}.{os.getpid()}.tmp"
+        df_agregado.to_parquet(caminho_tmp, index=False)
+        os.replace(caminho_tmp, caminho)
+    registrar_assinatura_dataset(pasta, caminho_dataset)
+    logger.info(f"Agregados diários gravados em '{pasta}': " + ", ".join(f"{nome}={len(df):,}" for nome, df in agregados.items()))
+
+def carregar_agregados_diarios(caminho_dataset, data_inicio=None):
+    """
+    Carrega os agregados diários do snapshot se eles correspondem a ele; senão retorna {}
+    (o chamador volta ao cálculo sobre os registros).
+    """
+    pasta = pasta_agregados_snapshot(caminho_dataset)
+    if not assinatura_dataset_valida(pasta, caminho_dataset):
+        logger.warning("Agregados diários ausentes ou desatualizados em relação ao dataset.")
+        return {}
+    filtros = [('dia', '>=', pd.Timestamp(data_inicio))] if data_inicio is not None else None
+    agregados = {}
+    for nome in AGREGADOS_DIARIOS:
+        caminho = _caminho_agregado(pasta, nome)
+        if os.path.exists(caminho):
+            df_agregado = pd.read_parquet(caminho, filters=filtros)
+            # Mesma padronização aplicada aos registros no cache do app
+            for col in ['nome_agente', 'supervisor']:
+                if col in df_agregado.columns:
+                    df_agregado[col] = padronizar_texto(df_agregado[col])
+            agregados[nome] = df_agregado
+    return agregados
+
+def aplicar_correcoes_supervisor_agregados(agregados, correcoes):
+    """
+    Agregados com o supervisor dos L5s corrigidos (as mesmas correções aplicadas aos registros do cache):
+    agente_dia é reagrupado com o supervisor novo e supervisor_dia é somado de novo a partir dele.
+    Os agregados recebidos não são alterados.
+    """
+    if not correcoes or 'agente_dia' not in agregados:
+        return agregados
+    agente_dia = agregados['agente_dia']
+    l5s = agente_dia['l5_agente'].astype(object)
+    mascara = l5s.isin(list(correcoes)).to_numpy()
+    if not mascara.any():
+        return agregados
+    supervisor = agente_dia['supervisor'].astype(object).copy()
+    supervisor[mascara] = l5s[mascara].map(correcoes).to_numpy()
+    chaves = ['dia'] + AGREGADOS_DIARIOS['agente_dia']
+    agente_dia = (agente_dia.assign(supervisor=supervisor)
+                  .groupby(chaves, observed=True, dropna=False, sort=True).sum().reset_index())
+    corrigidos = {**agregados, 'agente_dia': agente_dia}
+    if 'supervisor_dia' in agregados:
+        # agente_dia guarda todos os registros (dropna=False): a soma por supervisor é a mesma do pipeline
+        corrigidos['supervisor_dia'] = (agente_dia.drop(columns=['l5_agente', 'nome_agente'])
+                                        .groupby(['dia', 'supervisor'], observed=True, dropna=False, sort=True)
+                                        .sum().reset_index())
+    return corrigidos
+
+def supervisor_predominante(contagens):
+    """
+    Supervisor de cada L5 a partir das contagens por (l5_agente, supervisor), com 'registros' e 'primeiro_dia':
+    o de mais registros; empate: o do primeiro dia e, no mesmo dia, o primeiro em ordem alfabética. Regra única
+    da dimensão de agentes e dos relatórios agregados. Retorna a Series l5_agente -> supervisor.
+    """
+    modas = (contagens.assign(ordem_supervisor=contagens['supervisor'].astype(str))
+             .sort_values(['registros', 'primeiro_dia', 'ordem_supervisor'], ascending=[False, True, True], kind='stable')
+             .drop_duplicates(subset=['l5_agente']))
+    return pd.Series(modas['supervisor'].astype(object).to_numpy(),
+                     index=pd.Index(modas['l5_agente'].astype(object).to_numpy(), name='l5_agente'), name='supervisor')
+
+def _contagens_supervisor_agregado(agente_dia):
+    """Registros e primeiro dia por (l5_agente, supervisor) das linhas diárias de agente_dia"""
+    return (agente_dia.dropna(subset=['l5_agente', 'supervisor'])
+            .groupby(['l5_agente', 'supervisor'], observed=True)
+            .agg(registros=('registros', 'sum'), primeiro_dia=('dia', 'min'))
+            .reset_index())
+
+def somar_agregado_periodo(df_agregado, data_inicio, data_fim, chaves):
+    """Soma as linhas diárias de [data_inicio, data_fim] agrupando pelas chaves informadas."""
+    mascara = (df_agregado['dia'] >= pd.Timestamp(data_inicio)) & (df_agregado['dia'] <= pd.Timestamp(data_fim))
+    df_periodo = df_agregado.loc[mascara].drop(columns=['dia'])
+    return df_periodo.groupby(chaves, observed=True, dropna=False, sort=False).sum(numeric_only=True).reset_index()
+
+def gerar_tabela_desempenho_atendente_agregada(agregados, data_inicio, data_fim, dimensao_agentes=None):
+    """
+    Equivalente a gerar_tabela_desempenho_atendente (sem filtros adicionais) calculado a partir
+    dos agregados diários. Com `dimensao_agentes` (gerar_dimensao_agentes do período) o supervisor vem
+    dela, como nas demais tabelas. Retorna None se os agregados necessários não estiverem disponíveis.
+    """
+    if 'agente_dia' not in agregados or 'rechamada_l5_dia' not in agregados:
+        return None
+
+    df_agentes_supervisor = somar_agregado_periodo(agregados['agente_dia'], data_inicio, data_fim, ['l5_agente', 'nome_agente', 'supervisor'])
+    df_agentes_supervisor = df_agentes_supervisor.dropna(subset=['l5_agente', 'nome_agente'])
+    if df_agentes_supervisor.empty:
+        return pd.DataFrame()
+
+    chaves_agente = ['l5_agente', 'nome_agente']
+    # Agregados anteriores a atendimentos_com_tempo: todos os registros tinham duração (nulo era gravado como 0)
+    if 'atendimentos_com_tempo' not in df_agentes_supervisor.columns:
+        df_agentes_supervisor['atendimentos_com_tempo'] = df_agentes_supervisor['registros']
+    df_agentes = df_agentes_supervisor.groupby(chaves_agente, observed=True).agg(
+        ligacoes=('ligacoes', 'sum'), registros=('registros', 'sum'), soma_tempo_atendimento=('soma_tempo_atendimento', 'sum'),
+        atendimentos_com_tempo=('atendimentos_com_tempo', 'sum')
+    )
+    if dimensao_agentes is not None:
+        supervisores = dimensao_agentes['supervisor'].astype(object)
+        supervisores.index = supervisores.index.astype(object)
+        df_agentes['supervisor'] = supervisores.reindex(df_agentes.index.get_level_values('l5_agente').astype(object)).fillna('Não Mapeado').to_numpy()
+    else:
+        # Supervisor predominante do período, pela mesma regra da dimensão de agentes
+        agentes_periodo = _recortar_periodo(agregados['agente_dia'], data_inicio, data_fim)
+        supervisores = supervisor_predominante(_contagens_supervisor_agregado(agentes_periodo))
+        df_agentes['supervisor'] = supervisores.reindex(df_agentes.index.get_level_values('l5_agente').astype(object)).fillna('Não Mapeado').to_numpy()
+    df_agentes['media_tempo_ligacao'] = df_agentes['soma_tempo_atendimento'] / df_agentes['atendimentos_com_tempo'].replace(0, float('nan'))
+    df_agentes = df_agentes.reset_index()
+
+    df_rechamadas = somar_agregado_periodo(agregados['rechamada_l5_dia'], data_inicio, data_fim, ['rechamada_atribuida_l5', 'tipo_rechamada'])
+    df_rechamadas = df_rechamadas.dropna(subset=['rechamada_atribuida_l5'])
+    if df_rechamadas.empty:
+        return pd.DataFrame()
+    contagem_rechamadas = df_rechamadas.pivot_table(index='rechamada_atribuida_l5', columns='tipo_rechamada', values='rechamadas',
+                                                    aggfunc='sum', fill_value=0, observed=True)
+    contagem_rechamadas.columns = contagem_rechamadas.columns.astype(str)
+    contagem_rechamadas.index = contagem_rechamadas.index.astype(object)
+    for tipo in ['Com Motivo', 'Sem Motivo']:
+        if tipo not in contagem_rechamadas:
+            contagem_rechamadas[tipo] = 0
+
+    df_agentes['l5_agente'] = df_agentes['l5_agente'].astype(object)
+    df_tabela1 = pd.merge(df_agentes, contagem_rechamadas[['Com Motivo', 'Sem Motivo']], left_on='l5_agente', right_index=True, how='inner')
+    df_tabela1 = df_tabela1.rename(columns={'Com Motivo': 'Rechamada com Motivo', 'Sem Motivo': 'Rechamada sem Motivo'})
+    df_tabela1[['Rechamada com Motivo', 'Rechamada sem Motivo']] = df_tabela1[['Rechamada com Motivo', 'Rechamada sem Motivo']].fillna(0).astype(int)
+    df_tabela1['Rechamada Total'] = df_tabela1['Rechamada com Motivo'] + df_tabela1['Rechamada sem Motivo']
+    df_tabela1['perc_com_motivo'] = (df_tabela1['Rechamada com Motivo'] / df_tabela1['ligacoes'].replace(0, pd.NA)).fillna(0)
+    df_tabela1['perc_sem_motivo'] = (df_tabela1['Rechamada sem Motivo'] / df_tabela1['ligacoes'].replace(0, pd.NA)).fillna(0)
+    df_tabela1['perc_total'] = (df_tabela1['Rechamada Total'] / df_tabela1['ligacoes'].replace(0, pd.NA)).fillna(0)
+    df_tabela1 = df_tabela1.rename(columns={
+        'nome_agente': 'Nome', 'l5_agente': 'L5', 'media_tempo_ligacao': 'Média de Ligação',
+        'ligacoes': 'Contagem de Ligações', 'supervisor': 'Supervisor'
+    })
+    return df_tabela1[[
+        'Nome', 'L5', 'Supervisor', 'Média de Ligação', 'Contagem de Ligações', 'Rechamada com Motivo',
+        'Rechamada sem Motivo', 'Rechamada Total', 'perc_com_motivo', 'perc_sem_motivo', 'perc_total'
+    ]]
+
+def gerar_tendencia_agregada(agregados, data_inicio, data_fim):
+    """Rechamadas por dia (total, com/sem motivo) do período, a partir do agregado por supervisor."""
+    if 'supervisor_dia' not in agregados:
+        return None
+    df_agregado = agregados['supervisor_dia']
+    mascara = (df_agregado['dia'] >= pd.Timestamp(data_inicio)) & (df_agregado['dia'] <= pd.Timestamp(data_fim))
+    df_dias = df_agregado.loc[mascara].groupby('dia', sort=True)[['rechamadas', 'rechamadas_com_motivo', 'rechamadas_sem_motivo']].sum()
+    df_dias = df_dias[df_dias['rechamadas'] > 0]
+    return df_dias.rename(columns={'rechamadas': 'total', 'rechamadas_com_motivo': 'com_motivo', 'rechamadas_sem_motivo': 'sem_motivo'}).reset_index()
+
+def _recortar_periodo(df_agregado, data_inicio, data_fim):
+    mascara = (df_agregado['dia'] >= pd.Timestamp(data_inicio)) & (df_agregado['dia'] <= pd.Timestamp(data_fim))
+    return df_agregado.loc[mascara]
+
+def _contagens_por_valor(df_agregado, data_inicio, data_fim, coluna):
+    """{valor: registros} do período, sem nulos e sem valores zerados"""
+    contagens = somar_agregado_periodo(df_agregado, data_inicio, data_fim, [coluna]).dropna(subset=[coluna])
+    contagens = contagens[contagens['registros'] > 0]
+    return dict(zip(contagens[coluna].astype(object), contagens['registros'].astype(int)))
+
+def gerar_reconciliacao_agregada(agregados, data_inicio, data_fim):
+    """
+    Fatos de reconciliação do período (totais, registros sem protocolo, contagens por MVNO e status, ligações por
+    agente) somados dos agregados diários. None se algum agregado necessário não estiver disponível.
+    """
+    if not all(nome in agregados for nome in AGREGADOS_RECONCILIACAO):
+        return None
+    totais = _recortar_periodo(agregados['mvno_dia'], data_inicio, data_fim)[['registros', 'ligacoes', 'rechamadas']].sum()
+
+    # Igual ao groupby por (l5_agente, nome_agente) dos registros: agentes sem L5/nome ficam de fora
+    por_agente = somar_agregado_periodo(agregados['agente_dia'], data_inicio, data_fim, ['l5_agente', 'nome_agente'])
+    por_agente = por_agente.dropna(subset=['l5_agente', 'nome_agente'])
+    por_agente = por_agente.sort_values(['l5_agente', 'nome_agente'], key=lambda serie: serie.astype(str), kind='stable')
+    return {
+        'total_periodo': int(totais['registros']),
+        'sem_protocolo': int(totais['registros'] - totais['ligacoes']),
+        'total_rechamadas': int(totais['rechamadas']),
+        'total_ligacoes_agentes': int(por_agente['ligacoes'].sum()),
+        'total_registros_agentes': int(por_agente['registros'].sum()),
+        'mvnos': _contagens_por_valor(agregados['mvno_dia'], data_inicio, data_fim, 'mvno'),
+        'status': _contagens_por_valor(agregados['status_dia'], data_inicio, data_fim, 'status_ligacao'),
+        'top_agentes': [
+            {'nome_agente': linha.nome_agente, 'l5_agente': linha.l5_agente, 'total_ligacoes': int(linha.ligacoes)}
+            for linha in por_agente.nlargest(10, 'ligacoes').itertuples(index=False)
+        ],
+    }
+
+def gerar_nao_mapeados_agregado(agregados, data_inicio, data_fim):
+    """
+    L5s cujas rechamadas do período ficam 'Não Mapeado', com contagens, a partir dos agregados diários. O supervisor
+    de cada L5 é o predominante no período (supervisor_predominante, a mesma regra da dimensão de agentes).
+    """
+    if not all(nome in agregados for nome in AGREGADOS_RECONCILIACAO):
+        return None
+    agentes = _recortar_periodo(agregados['agente_dia'], data_inicio, data_fim)
+    registros_por_l5 = agentes.groupby('l5_agente', observed=True)['registros'].sum()
+    registros_por_l5.index = registros_por_l5.index.astype(object)
+    supervisor_por_l5 = supervisor_predominante(_contagens_supervisor_agregado(agentes))
+    supervisor_por_l5 = supervisor_por_l5.reindex(registros_por_l5.index).fillna('Não Mapeado')
+
+    rechamadas = somar_agregado_periodo(agregados['rechamada_l5_dia'], data_inicio, data_fim, ['rechamada_atribuida_l5'])
+    rechamadas = rechamadas.dropna(subset=['rechamada_atribuida_l5'])
+    rechamadas = rechamadas[rechamadas['rechamadas'] > 0]
+    rechamadas_por_l5 = pd.Series(rechamadas['rechamadas'].astype(int).to_numpy(), index=rechamadas['rechamada_atribuida_l5'].astype(object).to_numpy())
+    atribuido = supervisor_por_l5.reindex(rechamadas_por_l5.index).fillna('Não Mapeado')
+    nao_mapeados = rechamadas_por_l5[(atribuido == 'Não Mapeado').to_numpy()].sort_values(ascending=False, kind='stable')
+
+    supervisores_nos_dados = agentes['supervisor'].astype(object).drop_duplicates()
+    return {
+        'total_rechamadas': int(rechamadas_por_l5.sum()),
+        'l5s_mapeados': len(supervisor_por_l5),
+        'supervisores_unicos': sorted(str(s) for s in atribuido.unique()),
+        'registros_nao_mapeado': int(nao_mapeados.sum()),
+        'l5s_problema': {str(l5): int(contagem) for l5, contagem in nao_mapeados.items()},
+        'detalhes_l5s_problema': {
+            str(l5): {
+                'count': int(contagem),
+                'existe_no_mapeamento': l5 in supervisor_por_l5.index,
+                'registros_no_periodo': int(registros_por_l5.get(l5, 0)),
+            }
+            for l5, contagem in nao_mapeados.items()
+        },
+        'supervisores_nos_dados': sorted(str(s) for s in supervisores_nos_dados),
+    }
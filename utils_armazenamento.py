@@ -0,0 +1,462 @@
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import config
+
+logger = logging.getLogger(__name__)
+
+# Identificador inteiro só quando o texto é exatamente o número (sem zero à esquerda, máscara ou prefixo):
+# assim a conversão nunca junta duas origens diferentes na mesma chave
+_INTEIRO_CANONICO = r'^-?(0|[1-9][0-9]*)$'
+
+def _converter_coluna(serie, dtype, coluna=None):
+    if dtype in ('Int64', 'Int32'):
+        if not pd.api.types.is_numeric_dtype(serie):
+            texto = serie.astype('string').str.strip()
+            preenchido = texto.notna() & (texto != '')
+            nao_canonico = preenchido & ~texto.str.match(_INTEIRO_CANONICO).fillna(False)
+            if dtype == 'Int64' and nao_canonico.any():
+                # Identificador (origem) que não é puramente numérico: mantém a chave em texto, sem alterar valores
+                logger.warning(f"Coluna '{coluna}': {int(nao_canonico.sum()):,} valores não numéricos "
+                               f"(ex.: {texto[nao_canonico].iloc[0]!r}); mantida como texto")
+                return texto.astype('string[pyarrow]')
+            serie = pd.to_numeric(texto.where(preenchido), errors='coerce')
+            invalidos = preenchido & serie.isna()
+            if invalidos.any():
+                logger.warning(f"Coluna '{coluna}': {int(invalidos.sum()):,} valores não numéricos "
+                               f"(ex.: {texto[invalidos].iloc[0]!r}) gravados como nulos")
+        # Inteiros anuláveis: duração ausente continua nula (não vira 0 e não entra nas médias)
+        return pd.to_numeric(serie, errors='coerce').round().astype(dtype)
+    if dtype == 'bool':
+        return serie.astype('boolean').fillna(False).astype(bool)
+    if dtype == 'str':
+        return serie.astype(str)
+    return serie.astype(dtype)
+
+def _dtype_corresponde(dtype_atual, dtype):
+    if dtype == 'str':
+        return False
+    try:
+        return dtype_atual == pd.api.types.pandas_dtype(dtype)
+    except TypeError:
+        return False
+
+def aplicar_schema_armazenamento(df, schema=None):
+    """
+    Converte as colunas do DataFrame para os dtypes do schema de armazenamento.
+    Colunas que não existem no DataFrame são ignoradas; colunas fora do schema não são alteradas.
+    """
+    if df is None or df.empty:
+        return df
+    schema = schema or config.SCHEMA_ARMAZENAMENTO
+    for col, dtype in schema.items():
+        if col not in df.columns or _dtype_corresponde(df[col].dtype, dtype):
+            continue
+        try:
+            df[col] = _converter_coluna(df[col], dtype, col)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Não foi possível converter a coluna '{col}' para {dtype}: {e}")
+    return df
+
+def _tipo_arrow_para_pandas(tipo_arrow):
+    # Colunas texto permanecem em memória Arrow (string[pyarrow]) em vez de objetos Python
+    if pa.types.is_string(tipo_arrow) or pa.types.is_large_string(tipo_arrow):
+        return pd.StringDtype('pyarrow')
+    return None
+
+def ler_dados_consolidados(caminho_arquivo, filters=None, columns=None):
+    """Lê o dataset consolidado já com os dtypes do schema de armazenamento."""
+    tabela = pq.read_table(caminho_arquivo, filters=filters, columns=columns)
+    df = tabela.to_pandas(types_mapper=_tipo_arrow_para_pandas)
+    return aplicar_schema_armazenamento(df)
+
+def salvar_dados_consolidados(df, caminho_arquivo):
+    """
+    Grava o dataset consolidado ordenado por data_hora_contato, em row groups de tamanho fixo.
+    Com a ordenação, as estatísticas min/max de cada row group permitem que leituras por
+    período (filters em data_hora_contato) pulem a maior parte do arquivo.
+    """
+    if 'data_hora_contato' in df.columns:
+        df = df.sort_values(['data_hora_contato', 'origem'] if 'origem' in df.columns else 'data_hora_contato', kind='stable')
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    colunas_ordenacao = None
+    if 'data_hora_contato' in tabela.column_names:
+        colunas_ordenacao = [pq.SortingColumn(tabela.column_names.index('data_hora_contato'))]
+    # Grava em arquivo temporário e troca no final: nenhum leitor vê um arquivo pela metade
+    os.makedirs(os.path.dirname(caminho_arquivo) or '.', exist_ok=True)
+    caminho_tmp = f"{caminho_arquivo}.{os.getpid()}.tmp"
+    pq.write_table(
+        tabela, caminho_tmp,
+        row_group_size=config.PARQUET_LINHAS_POR_ROW_GROUP,
+        sorting_columns=colunas_ordenacao,
+        **config.PARQUET_OPCOES_ESCRITA
+    )
+    os.replace(caminho_tmp, caminho_arquivo)
+    logger.info(f"Dataset gravado em '{caminho_arquivo}': {len(df):,} registros, "
+                f"{pq.ParquetFile(caminho_arquivo).num_row_groups} row groups ordenados por data_hora_contato")
+
+def publicar_snapshot_arrow(df, caminho_arquivo):
+    """
+    Publica o DataFrame como arquivo Arrow IPC (Feather v2) sem compressão, pronto para memory-map.
+    Grava em arquivo temporário e troca com os.replace: leitores nunca veem um arquivo parcial
+    e quem já mapeou a versão anterior continua lendo-a até liberar.
+    """
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    caminho_tmp = f"{caminho_arquivo}.{os.getpid()}.tmp"
+    with pa.OSFile(caminho_tmp, 'wb') as destino:
+        with pa.ipc.new_file(destino, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    os.replace(caminho_tmp, caminho_arquivo)
+
+def carregar_snapshot_arrow(caminho_arquivo):
+    """
+    Mapeia o snapshot Arrow em memória. As páginas ficam no cache do SO, compartilhadas entre
+    os workers; colunas numéricas/datas sem nulos e textos Arrow apontam para o mapeamento sem cópia.
+    Esses arrays são somente leitura: alterações no cache devem substituir a coluna inteira.
+    """
+    tabela = pa.ipc.open_file(pa.memory_map(caminho_arquivo, 'r')).read_all()
+    return tabela.to_pandas(split_blocks=True, types_mapper=_tipo_arrow_para_pandas)
+
+def origem_como_texto(serie):
+    """Visão em texto (string[pyarrow]) da coluna origem, armazenada como inteiro."""
+    if not pd.api.types.is_integer_dtype(serie.dtype):
+        return serie.astype('string[pyarrow]')
+    texto = pc.cast(pa.array(serie, from_pandas=True), pa.string())
+    return pd.Series(pd.arrays.ArrowStringArray(texto), index=serie.index, name=serie.name)
+
+def padronizar_texto(serie):
+    """
+    Aplica strip + title na coluna. Para categóricas, normaliza apenas as categorias
+    (uma vez por valor distinto) e reconstrói os códigos, unindo categorias que passam a coincidir.
+    """
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie.str.strip().str.title()
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.astype(str).str.strip().str.title()
+    if len(serie.cat.categories) == 0:
+        return serie
+    categorias_novas = serie.cat.categories.astype(str).str.strip().str.title()
+    categorias_unicas = categorias_novas.unique()
+    mapa_codigos = categorias_unicas.get_indexer(categorias_novas)
+    codigos = serie.cat.codes.to_numpy()
+    codigos_novos = np.where(codigos >= 0, mapa_codigos[codigos], -1)
+    return pd.Series(pd.Categorical.from_codes(codigos_novos, categories=categorias_unicas), index=serie.index, name=serie.name)
+
+# --- Índice persistente de deduplicação (hash 64 bits das chaves, particionado por dia) ---
+
+# Formato dos arquivos derivados do dataset (índice e agregados), gravado junto da assinatura:
+# mudar o cálculo dos hashes ou as colunas dos agregados incrementa e força a reconstrução
+VERSAO_FORMATO_DERIVADOS = 2
+
+def calcular_hash_chaves(df, colunas=None):
+    """Hash uint64 por registro das colunas chave (COLUNAS_CHAVE_DUPLICATAS)."""
+    colunas = colunas or config.COLUNAS_CHAVE_DUPLICATAS
+    chaves = df[colunas]
+    if 'origem' in colunas:
+        # origem pela visão texto: a chave é a mesma com a coluna gravada como inteiro ou como texto
+        chaves = chaves.assign(origem=origem_como_texto(chaves['origem']))
+    return pd.util.hash_pandas_object(chaves, index=False).to_numpy()
+
+def calcular_hash_conteudo(df):
+    """Hash uint64 por registro dos campos que a API pode revisar (COLUNAS_CONTEUDO_REGISTRO)."""
+    colunas = [col for col in config.COLUNAS_CONTEUDO_REGISTRO if col in df.columns]
+    if not colunas:
+        return np.zeros(len(df), dtype='uint64')
+    return pd.util.hash_pandas_object(df[colunas], index=False).to_numpy()
+
+def _caminho_particao_indice(pasta_indice, dia):
+    return os.path.join(pasta_indice, f"dia={pd.Timestamp(dia).strftime('%Y-%m-%d')}.parquet")
+
+def _caminho_assinatura(pasta):
+    return os.path.join(pasta, '_assinatura.json')
+
+def _assinatura_dataset(caminho_dataset):
+    if not os.path.exists(caminho_dataset):
+        return None
+    stat = os.stat(caminho_dataset)
+    return {'tamanho': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _assinatura_derivados(caminho_dataset):
+    assinatura = _assinatura_dataset(caminho_dataset)
+    return None if assinatura is None else {**assinatura, 'formato': VERSAO_FORMATO_DERIVADOS}
+
+def registrar_assinatura_dataset(pasta, caminho_dataset):
+    """Marca os arquivos derivados da pasta (índice, agregados) como sincronizados com a versão atual do dataset."""
+    os.makedirs(pasta, exist_ok=True)
+    with open(_caminho_assinatura(pasta), 'w') as f:
+        json.dump(_assinatura_derivados(caminho_dataset), f)
+
+def invalidar_assinatura_dataset(pasta):
+    """Desmarca os derivados da pasta antes de regravá-los: um leitor no meio da gravação não os aceita"""
+    try:
+        os.remove(_caminho_assinatura(pasta))
+    except FileNotFoundError:
+        pass
+
+def assinatura_dataset_valida(pasta, caminho_dataset):
+    caminho_assinatura = _caminho_assinatura(pasta)
+    if not os.path.exists(caminho_assinatura):
+        return False
+    try:
+        with open(caminho_assinatura, 'r') as f:
+            return json.load(f) == _assinatura_derivados(caminho_dataset)
+    except (OSError, ValueError):
+        return False
+
+def salvar_indice_deduplicacao(pasta_indice, df, dias=None):
+    """
+    Regrava as partições do índice para os dias informados a partir do DataFrame (estado final do dataset).
+    Sem `dias`, regrava o índice inteiro. Dias sem registros no DataFrame têm a partição removida.
+    """
+    os.makedirs(pasta_indice, exist_ok=True)
+    if dias is None:
+        for nome in os.listdir(pasta_indice):
+            if nome.startswith('dia='):
+                os.remove(os.path.join(pasta_indice, nome))
+    dias_registros = df['data_hora_contato'].dt.floor('D') if not df.empty else pd.Series(dtype='datetime64[ns]')
+    if dias is not None:
+        dias = pd.DatetimeIndex(dias).floor('D').unique()
+        mascara = dias_registros.isin(dias).to_numpy()
+        df, dias_registros = df[mascara], dias_registros[mascara]
+    df_indice = pd.DataFrame({
+        'dia': dias_registros.to_numpy(),
+        'hash_chave': calcular_hash_chaves(df) if not df.empty else np.array([], dtype='uint64'),
+        'hash_conteudo': calcular_hash_conteudo(df) if not df.empty else np.array([], dtype='uint64'),
+    })
+    dias_gravados = set()
+    for dia, particao in df_indice.groupby('dia', sort=False):
+        particao[['hash_chave', 'hash_conteudo']].to_parquet(_caminho_particao_indice(pasta_indice, dia), index=False)
+        dias_gravados.add(dia)
+    for dia in (dias if dias is not None else []):
+        if dia not in dias_gravados and os.path.exists(_caminho_particao_indice(pasta_indice, dia)):
+            os.remove(_caminho_particao_indice(pasta_indice, dia))
+    logger.info(f"Índice de deduplicação: {len(df_indice):,} chaves gravadas em {len(dias_gravados)} partições diárias")
+
+def carregar_indice_deduplicacao(pasta_indice, dias):
+    """Carrega apenas as partições do índice correspondentes aos dias informados."""
+    particoes = []
+    for dia in pd.DatetimeIndex(dias).floor('D').unique():
+        caminho = _caminho_particao_indice(pasta_indice, dia)
+        if os.path.exists(caminho):
+            particoes.append(pd.read_parquet(caminho))
+    if not particoes:
+        return pd.DataFrame({'hash_chave': np.array([], dtype='uint64'), 'hash_conteudo': np.array([], dtype='uint64')})
+    return pd.concat(particoes, ignore_index=True)
+
+def classificar_registros_novos(df_novos, pasta_indice):
+    """
+    Compara o lote extraído com o índice persistido e mantém apenas inserções (chave nova)
+    e atualizações (chave existente com conteúdo diferente). Custo proporcional ao lote.
+
+    Retorna (df_para_gravar, hashes_das_chaves_atualizadas).
+    """
+    if df_novos.empty:
+        return df_novos, np.array([], dtype='uint64')
+
+    registros_lote = len(df_novos)
+    df_novos = df_novos.drop_duplicates(subset=config.COLUNAS_CHAVE_DUPLICATAS, keep='last')
+    hash_chave = calcular_hash_chaves(df_novos)
+    hash_conteudo = calcular_hash_conteudo(df_novos)
+
+    df_indice = carregar_indice_deduplicacao(pasta_indice, df_novos['data_hora_contato'].unique())
+    df_indice = df_indice.drop_duplicates(subset=['hash_chave'], keep='last')
+    posicoes = pd.Index(df_indice['hash_chave'].to_numpy()).get_indexer(hash_chave)
+    existe = posicoes >= 0
+    conteudo_anterior = df_indice['hash_conteudo'].to_numpy()[np.where(existe, posicoes, 0)] if len(df_indice) else hash_conteudo
+    eh_insercao = ~existe
+    eh_atualizacao = existe & (conteudo_anterior != hash_conteudo)
+
+    logger.info(f"📊 DEDUPLICAÇÃO - Lote: {registros_lote:,} | Duplicados no lote: {registros_lote - len(df_novos):,} | "
+                f"Inserções: {eh_insercao.sum():,} | Atualizações: {eh_atualizacao.sum():,} | Já existentes: {(existe & ~eh_atualizacao).sum():,}")
+    return df_novos[eh_insercao | eh_atualizacao], hash_chave[eh_atualizacao]
+
+def remover_registros_substituidos(df_historico, hashes_atualizados, dias):
+    """Remove do histórico as versões antigas dos registros atualizados (hash apenas nos dias afetados)."""
+    if df_historico.empty or len(hashes_atualizados) == 0:
+        return df_historico
+    dias = pd.DatetimeIndex(dias).floor('D').unique()
+    mascara_dias = df_historico['data_hora_contato'].dt.floor('D').isin(dias).to_numpy()
+    candidatos = df_historico.index[mascara_dias]
+    substituidos = np.isin(calcular_hash_chaves(df_historico.loc[candidatos]), hashes_atualizados)
+    logger.info(f"Substituindo {substituidos.sum():,} registros atualizados pela API")
+    return df_historico.drop(index=candidatos[substituidos])
+
+def garantir_indice_deduplicacao(pasta_indice, df_historico, caminho_dataset):
+    """
+    Reconstrói o índice a partir do histórico quando ele não existe ou não corresponde ao dataset atual
+    (ex.: primeira execução ou dataset regravado fora do pipeline). Nesse caso o histórico também é
+    deduplicado uma única vez. Retorna o histórico pronto para receber o lote novo.
+    """
+    if assinatura_dataset_valida(pasta_indice, caminho_dataset):
+        return df_historico
+    logger.warning("Índice de deduplicação ausente ou desatualizado. Reconstruindo a partir do histórico...")
+    if not df_historico.empty:
+        registros_antes = len(df_historico)
+        df_historico = df_historico.drop_duplicates(subset=config.COLUNAS_CHAVE_DUPLICATAS, keep='last')
+        logger.info(f"Histórico deduplicado na reconstrução: {registros_antes - len(df_historico):,} duplicados removidos")
+    salvar_indice_deduplicacao(pasta_indice, df_historico)
+    registrar_assinatura_dataset(pasta_indice, caminho_dataset)
+    return df_historico
+
+def dias_sem_particao_indice(pasta_indice, datas):
+    """Dias presentes em `datas` que ainda não têm partição no índice (ex.: preenchidos por gaps)."""
+    dias = pd.DatetimeIndex(pd.Series(datas).dt.floor('D').unique())
+    return [dia for dia in dias if not os.path.exists(_caminho_particao_indice(pasta_indice, dia))]
+
+# --- Manifesto do dataset (resumo por dia para decisões do pipeline sem ler o histórico) ---
+# O manifesto também é o ponteiro para o snapshot publicado: 'arquivo' indica a versão atual
+# (imutável) e a troca do manifesto via os.replace publica a nova versão de forma atômica.
+
+def _pasta_manifesto(caminho_manifesto=None):
+    """
+    Pasta do manifesto: base de todos os caminhos do dataset (snapshots, 'arquivo' do manifesto, arquivo legado),
+    para o pipeline e o app resolverem os mesmos arquivos mesmo rodando a partir de diretórios diferentes.
+    """
+    return os.path.dirname(os.path.abspath(caminho_manifesto or config.ARQUIVO_MANIFESTO_DADOS))
+
+def _pasta_snapshots(caminho_manifesto=None):
+    return os.path.join(_pasta_manifesto(caminho_manifesto), config.PASTA_SNAPSHOTS)
+
+def caminho_snapshot_versao(versao, caminho_manifesto=None):
+    return os.path.join(_pasta_snapshots(caminho_manifesto), f"dados_consolidado_v{versao:06d}.parquet")
+
+def pasta_agregados_snapshot(caminho_dataset):
+    """Pasta dos agregados diários de um arquivo do dataset: ao lado dele, uma por snapshot (imutável como ele)"""
+    return f"{os.path.splitext(caminho_dataset)[0]}_{config.PASTA_AGREGADOS_DIARIOS}"
+
+def caminho_dataset_atual(caminho_manifesto=None):
+    """Arquivo do dataset apontado pelo manifesto; sem ele, o arquivo único legado (ARQUIVO_DADOS_CONSOLIDADO)."""
+    caminho_manifesto = caminho_manifesto or config.ARQUIVO_MANIFESTO_DADOS
+    pasta_base = _pasta_manifesto(caminho_manifesto)
+    manifesto = carregar_manifesto(caminho_manifesto, validar=False)
+    if manifesto and manifesto.get('arquivo'):
+        caminho = os.path.join(pasta_base, manifesto['arquivo'])
+        if os.path.exists(caminho):
+            return caminho
+        logger.warning(f"Snapshot '{caminho}' apontado pelo manifesto não existe. Usando o arquivo legado.")
+    return os.path.join(pasta_base, config.ARQUIVO_DADOS_CONSOLIDADO)
+
+def versao_publicada(caminho_manifesto=None):
+    """
+    Identificador barato da versão publicada (um stat, sem ler arquivos): muda a cada troca do
+    manifesto. Sem manifesto, usa o stat do arquivo legado.
+    """
+    caminho_manifesto = caminho_manifesto or config.ARQUIVO_MANIFESTO_DADOS
+    for caminho in (caminho_manifesto, os.path.join(_pasta_manifesto(caminho_manifesto), config.ARQUIVO_DADOS_CONSOLIDADO)):
+        try:
+            stat = os.stat(caminho)
+            return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        except OSError:
+            continue
+    return None
+
+def remover_snapshots_antigos(caminho_atual, manter=None, caminho_manifesto=None):
+    """
+    Remove snapshots além dos `manter` mais recentes, com a pasta de agregados de cada um
+    (leitores com o arquivo aberto não são afetados).
+    """
+    manter = manter or config.SNAPSHOTS_MANTIDOS
+    pasta_snapshots = _pasta_snapshots(caminho_manifesto)
+    if not os.path.isdir(pasta_snapshots):
+        return
+    snapshots = sorted(nome for nome in os.listdir(pasta_snapshots) if nome.startswith('dados_consolidado_v') and nome.endswith('.parquet'))
+    for nome in snapshots[:-manter]:
+        caminho = os.path.join(pasta_snapshots, nome)
+        if os.path.abspath(caminho) != os.path.abspath(caminho_atual):
+            os.remove(caminho)
+            shutil.rmtree(pasta_agregados_snapshot(caminho), ignore_errors=True)
+            logger.info(f"Snapshot antigo removido: {caminho}")
+
+def gerar_manifesto(df, caminho_dataset, manifesto_anterior=None, caminho_manifesto=None):
+    """
+    Resumo do dataset gravado: registros por dia, por MVNO (fonte) e 'Não Mapeado' por dia,
+    período coberto e versão dos dados (incrementada a cada gravação). 'arquivo' é relativo à pasta do manifesto.
+    """
+    versao = (manifesto_anterior or {}).get('versao', 0) + 1
+    manifesto = {
+        'versao': versao,
+        'gerado_em': pd.Timestamp.now().isoformat(timespec='seconds'),
+        'arquivo': os.path.relpath(os.path.abspath(caminho_dataset), _pasta_manifesto(caminho_manifesto)),
+        'assinatura': _assinatura_dataset(caminho_dataset),
+        'total_registros': int(len(df)),
+        'data_min': None,
+        'data_max': None,
+        'dias': {},
+    }
+    if df.empty:
+        return manifesto
+    dias = df['data_hora_contato'].dt.strftime('%Y-%m-%d')
+    registros = dias.value_counts()
+    nao_mapeados = dias[(df['supervisor'] == 'Não Mapeado').to_numpy()].value_counts() if 'supervisor' in df.columns else pd.Series(dtype='int64')
+    por_mvno = df.groupby([dias, df['mvno']], observed=True).size() if 'mvno' in df.columns else pd.Series(dtype='int64')
+    for dia in sorted(registros.index):
+        manifesto['dias'][dia] = {
+            'registros': int(registros[dia]),
+            'nao_mapeados': int(nao_mapeados.get(dia, 0)),
+            'por_mvno': {str(mvno): int(qtd) for mvno, qtd in por_mvno.loc[dia].items()} if dia in por_mvno.index.get_level_values(0) else {},
+        }
+    manifesto['data_min'] = min(manifesto['dias'])
+    manifesto['data_max'] = max(manifesto['dias'])
+    return manifesto
+
+def salvar_manifesto(manifesto, caminho_manifesto):
+    caminho_tmp = f"{caminho_manifesto}.{os.getpid()}.tmp"
+    with open(caminho_tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False)
+    os.replace(caminho_tmp, caminho_manifesto)
+    logger.info(f"Manifesto publicado ('{manifesto.get('arquivo')}'): versão {manifesto['versao']}, {manifesto['total_registros']:,} registros, "
+                f"{len(manifesto['dias'])} dias ({manifesto['data_min']} a {manifesto['data_max']})")
+
+def carregar_manifesto(caminho_manifesto=None, caminho_dataset=None, validar=True):
+    """
+    Lê o manifesto. Retorna None se não existir ou (com validar=True) não corresponder ao dataset
+    atual, ex.: dataset regravado fora do pipeline; nesse caso o chamador lê os dados.
+    """
+    caminho_manifesto = caminho_manifesto or config.ARQUIVO_MANIFESTO_DADOS
+    if not os.path.exists(caminho_manifesto):
+        return None
+    try:
+        with open(caminho_manifesto, 'r', encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Manifesto ilegível ({e}). Usando leitura do dataset.")
+        return None
+    if validar and caminho_dataset is None:
+        caminho_dataset = os.path.join(_pasta_manifesto(caminho_manifesto), manifesto.get('arquivo') or config.ARQUIVO_DADOS_CONSOLIDADO)
+    if validar and manifesto.get('assinatura') != _assinatura_dataset(caminho_dataset):
+        logger.warning("Manifesto não corresponde ao dataset atual. Usando leitura do dataset.")
+        return None
+    return manifesto
+
+def datas_do_dataset(caminho_dataset=None, manifesto=None):
+    """
+    Conjunto de dias (date) com registros no dataset: pelo manifesto quando válido,
+    senão lendo apenas a coluna data_hora_contato.
+    """
+    caminho_dataset = caminho_dataset or caminho_dataset_atual()
+    manifesto = manifesto or carregar_manifesto(caminho_dataset=caminho_dataset)
+    if manifesto is not None:
+        return {pd.Timestamp(dia).date() for dia in manifesto['dias']}
+    if not os.path.exists(caminho_dataset):
+        return set()
+    datas = pq.read_table(caminho_dataset, columns=['data_hora_contato']).column('data_hora_contato').to_pandas()
+    return set(pd.to_datetime(datas).dropna().dt.date.unique())
+
+def proporcao_nao_mapeados(data_inicio, caminho_dataset=None, manifesto=None):
+    """Fração de registros 'Não Mapeado' a partir de data_inicio (None se não houver registros)."""
+    caminho_dataset = caminho_dataset or caminho_dataset_atual()
+    manifesto = manifesto or carregar_manifesto(caminho_dataset=caminho_dataset)
+    inicio = pd.Timestamp(data_inicio).strftime('%Y-%m-%d')
+    if manifesto is not None:
+        dias = [resumo for dia, resumo in manifesto['dias'].items() if dia >= inicio]
+        total = sum(resumo['registros'] for resumo in dias)
+        return sum(resumo['nao_mapeados'] for resumo in dias) / total if total else None
+    df = ler_dados_consolidados(caminho_dataset, filters=[('data_hora_contato', '>=', pd.Timestamp(data_inicio))],
+                                columns=['data_hora_contato', 'supervisor'])
+    return (df['supervisor'] == 'Não Mapeado').sum() / len(df) if len(df) else None
@@ -0,0 +1,163 @@
+import json
+import re
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Protocolo server-side do DataTables: a página envia draw/start/length, busca global,
+# ordenação e a busca por coluna (os filtros de cabeçalho mandam '^valor1$|^valor2$')
+TAMANHO_PAGINA_PADRAO = 25
+TAMANHO_PAGINA_MAXIMO = 1000
+_ALTERNATIVA_EXATA = re.compile(r'^\^(.*)\$$')
+
+def _valores_exatos(padrao):
+    """Converte '^a$|^b$' (escapeRegex do DataTables) na lista de valores; None se não for nesse formato"""
+    valores = []
+    for alternativa in re.split(r'(?<!\\)\|', padrao):
+        encontrado = _ALTERNATIVA_EXATA.match(alternativa)
+        if not encontrado:
+            return None
+        valores.append(re.sub(r'\\(.)', r'\1', encontrado.group(1)))
+    return valores
+
+def _inteiro(valor, padrao):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return padrao
+
+def ler_parametros_datatables(args):
+    """Lê os parâmetros do DataTables (request.values) em um dicionário simples"""
+    colunas = []
+    i = 0
+    while f'columns[{i}][data]' in args:
+        colunas.append({
+            'data': args.get(f'columns[{i}][data]'),
+            'busca': args.get(f'columns[{i}][search][value]', ''),
+            'regex': args.get(f'columns[{i}][search][regex]') == 'true',
+        })
+        i += 1
+
+    ordem = []
+    j = 0
+    while f'order[{j}][column]' in args:
+        indice = _inteiro(args.get(f'order[{j}][column]'), -1)
+        if 0 <= indice < len(colunas):
+            ordem.append((colunas[indice]['data'], args.get(f'order[{j}][dir]', 'asc') != 'desc'))
+        j += 1
+
+    filtros_colunas = {}
+    for coluna in colunas:
+        if not coluna['busca']:
+            continue
+        valores = _valores_exatos(coluna['busca']) if coluna['regex'] else None
+        filtros_colunas[coluna['data']] = valores if valores is not None else coluna['busca']
+
+    tamanho = _inteiro(args.get('length'), TAMANHO_PAGINA_PADRAO)
+    return {
+        'draw': _inteiro(args.get('draw'), 0),
+        'inicio': max(_inteiro(args.get('start'), 0), 0),
+        # length=-1 é "todos" no DataTables; limitado para não voltar ao payload sem limite
+        'tamanho': TAMANHO_PAGINA_MAXIMO if tamanho < 0 else min(tamanho, TAMANHO_PAGINA_MAXIMO),
+        'busca': args.get('search[value]', ''),
+        'ordem': ordem,
+        'filtros_colunas': filtros_colunas,
+    }
+
+def mascara_valores(serie, valores):
+    """serie.isin(valores) comparando como texto (os valores chegam do navegador como strings)"""
+    valores = [str(v) for v in valores]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Resolve nas categorias, sem converter a coluna inteira
+        categorias = serie.cat.categories
+        return serie.isin(categorias[categorias.astype(str).isin(valores)])
+    if pd.api.types.is_string_dtype(serie.dtype) and not pd.api.types.is_object_dtype(serie.dtype):
+        return serie.isin(valores)
+    return serie.astype(str).isin(valores)
+
+def aplicar_filtros_colunas(df, filtros_colunas):
+    """Filtros por coluna: lista = valores exatos; texto = contém (sem diferenciar maiúsculas)"""
+    for coluna, filtro in filtros_colunas.items():
+        if coluna in df.columns:
+            df = df[mascara_filtro_coluna(df[coluna], filtro)]
+    return df
+
+def preparar_facetas(df, colunas):
+    """Colunas de faceta como categóricas (valores distintos + códigos), calculadas uma vez por tabela"""
+    return pd.DataFrame({
+        coluna: df[coluna] if isinstance(df[coluna].dtype, pd.CategoricalDtype) else df[coluna].astype('category')
+        for coluna in colunas if coluna in df.columns
+    }, index=df.index)
+
+def contar_facetas(df_facetas, filtros_colunas, mascara_base=None):
+    """
+    Valores distintos e contagens de cada faceta sob os filtros ativos das demais facetas (a própria
+    seleção não restringe as opções da faceta). Conta por bincount dos códigos categóricos.
+    """
+    mascara_linhas = np.ones(len(df_facetas), dtype=bool) if mascara_base is None else np.asarray(mascara_base, dtype=bool)
+    mascaras = {coluna: mascara_filtro_coluna(df_facetas[coluna], filtro).to_numpy()
+                for coluna, filtro in filtros_colunas.items() if coluna in df_facetas.columns}
+    facetas = {}
+    for coluna in df_facetas.columns:
+        mascara = mascara_linhas.copy()
+        for outra, mascara_outra in mascaras.items():
+            if outra != coluna:
+                mascara &= mascara_outra
+        categorias = df_facetas[coluna].cat.categories
+        codigos = df_facetas[coluna].cat.codes.to_numpy()[mascara]
+        contagens = np.bincount(codigos[codigos >= 0], minlength=len(categorias))
+        valores = sorted((str(valor), int(contagem)) for valor, contagem in zip(categorias, contagens)
+                         if contagem > 0 and str(valor).strip())
+        facetas[coluna] = [{'valor': valor, 'contagem': contagem} for valor, contagem in valores]
+    return facetas
+
+def mascara_filtro_coluna(serie, filtro):
+    if isinstance(filtro, list):
+        return mascara_valores(serie, filtro)
+    return serie.astype(str).str.contains(filtro, case=False, regex=False, na=False)
+
+def mascara_busca_global(df, termo):
+    mascara = pd.Series(False, index=df.index)
+    for coluna in df.columns:
+        mascara |= df[coluna].astype(str).str.contains(termo, case=False, regex=False, na=False)
+    return mascara
+
+def aplicar_busca_global(df, termo):
+    if not termo or df.empty:
+        return df
+    return df[mascara_busca_global(df, termo)]
+
+def ordenar_e_paginar(df, ordem, inicio, tamanho):
+    ordem = [(coluna, crescente) for coluna, crescente in ordem if coluna in df.columns]
+    if ordem:
+        df = df.sort_values([c for c, _ in ordem], ascending=[a for _, a in ordem], kind='stable', na_position='last')
+    return df.iloc[inicio:inicio + tamanho]
+
+def serializar_colunar(df):
+    """
+    JSON colunar: {"colunas": [...], "linhas": n, "valores": {coluna: [...]}}, sem repetir os nomes das colunas
+    por linha. Categóricas vão codificadas em dicionário, {"dicionario": [...], "codigos": [...]} (código -1 = nulo).
+    Decodificado no navegador por decodificarColunar (dashboard.html).
+    """
+    partes = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            dicionario = pd.Series(serie.cat.categories).to_json(orient='values', date_format='iso')
+            valores = f'{{"dicionario": {dicionario}, "codigos": {json.dumps(serie.cat.codes.tolist())}}}'
+        else:
+            valores = serie.to_json(orient='values', date_format='iso')
+        partes.append(f'{json.dumps(str(coluna))}: {valores}')
+    return f'{{"colunas": {json.dumps([str(c) for c in df.columns])}, "linhas": {len(df)}, "valores": {{{", ".join(partes)}}}}}'
+
+def resposta_datatables(draw, total, filtrados, df_pagina, extras=None, formato='registros'):
+    """Monta o JSON de resposta; as linhas são serializadas direto pelo pandas (datas em ISO), por registro ou colunar"""
+    cabecalho = {'draw': draw, 'recordsTotal': int(total), 'recordsFiltered': int(filtrados)}
+    cabecalho.update(extras or {})
+    if formato == 'colunar':
+        dados = serializar_colunar(df_pagina)
+    else:
+        dados = df_pagina.to_json(orient='records', date_format='iso') if not df_pagina.empty else '[]'
+    return json.dumps(cabecalho, ensure_ascii=False)[:-1] + f', "data": {dados}}}'
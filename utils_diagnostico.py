@@ -0,0 +1,38 @@
+import json
+import logging
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# Diagnóstico das tabelas, ligado por requisição (?debug=1 ou ?debug=2073,2074) e desligado por padrão.
+# O caminho normal só consulta diagnostico_ativo() (um ContextVar.get) e não monta nada do diagnóstico.
+_DIAGNOSTICO = contextvars.ContextVar('diagnostico_tabelas', default=None)
+
+def ler_parametro_debug(valor):
+    """
+    Interpreta o parâmetro debug: vazio/0/false -> None (desligado); 1/true/todos -> () (resumos gerais);
+    lista de L5s separada por vírgula -> tupla com os L5s a detalhar.
+    """
+    valor = (valor or '').strip()
+    if valor.lower() in ('', '0', 'false', 'nao', 'não'):
+        return None
+    if valor.lower() in ('1', 'true', 'sim', 'todos'):
+        return ()
+    return tuple(l5.strip() for l5 in valor.split(',') if l5.strip())
+
+def ativar_diagnostico(l5s=()):
+    """Liga o diagnóstico no contexto atual; devolve o token para desativar_diagnostico"""
+    return _DIAGNOSTICO.set({'l5s': tuple(str(l5) for l5 in l5s)})
+
+def desativar_diagnostico(token):
+    _DIAGNOSTICO.reset(token)
+
+def diagnostico_ativo():
+    """Configuração do diagnóstico ({'l5s': (...)}) ou None quando desligado"""
+    return _DIAGNOSTICO.get()
+
+def registrar_diagnostico(etapa, **dados):
+    """Registra um evento de diagnóstico estruturado (uma linha JSON por etapa); não faz nada se desligado"""
+    if _DIAGNOSTICO.get() is None:
+        return
+    logger.info(f"DIAGNOSTICO {etapa} {json.dumps(dados, ensure_ascii=False, default=str)}")
@@ -0,0 +1,150 @@
+import csv
+import io
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+logger = logging.getLogger(__name__)
+
+# formato -> (mimetype, extensão); o charset dos tipos text/* é acrescentado pelo Flask (utf-8)
+FORMATOS_EXPORTACAO = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+# CSV e Parquet levam uma tabela só: parâmetro 'tabela' -> aba do Excel
+TABELAS_EXPORTACAO = {
+    'desempenho': 'Desempenho por Agente',
+    'detalhes': 'Detalhes de Rechamadas',
+}
+LINHAS_POR_BLOCO = 10_000
+
+COLUNAS_TABELA1_EXPORTACAO = [
+    'Nome', 'L5', 'Supervisor', 'Média de Ligação', 'Contagem de Ligações',
+    'Rechamada com Motivo', 'Rechamada sem Motivo', 'Rechamada Total',
+    '% com Motivo', '% sem Motivo', '% Total'
+]
+# 13 colunas exatamente iguais ao frontend
+COLUNAS_TABELA2_EXPORTACAO = [
+    'Nome', 'Supervisor', 'Origem', 'DDD', 'Local (Cidade e Estado)', 'MVNO', 'Categoria',
+    'Tipo de Rechamada', 'Semana', 'Tempo de Atendimento', 'Data/Hora da Chamada Original',
+    'Data/Hora da Rechamada', 'Status'
+]
+
+def formatar_hhmmss(serie):
+    """Segundos -> 'HH:MM:SS' (nulo -> '00:00:00'), sem apply por linha"""
+    segundos = pd.to_numeric(serie, errors='coerce').fillna(0).to_numpy(dtype='float64')
+    horas = (segundos // 3600).astype('int64')
+    minutos = ((segundos % 3600) // 60).astype('int64')
+    resto = (segundos % 60).astype('int64')
+    partes = [pd.Series(p, index=serie.index).astype(str).str.zfill(2) for p in (horas, minutos, resto)]
+    return partes[0] + ':' + partes[1] + ':' + partes[2]
+
+def formatar_percentual(serie):
+    """Fração -> '12,3%' (nulo -> '0,0%')"""
+    valores = pd.to_numeric(serie, errors='coerce')
+    texto = pd.Series(np.char.mod('%.1f', valores.fillna(0).to_numpy(dtype='float64') * 100), index=serie.index)
+    return (texto.str.replace('.', ',', regex=False) + '%').where(valores.notna(), '0,0%')
+
+def formatar_data_hora(serie):
+    """Data/hora -> 'dd/mm/aaaa HH:MM:SS' (nulo -> '')"""
+    if not pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        serie = pd.to_datetime(serie, errors='coerce')
+    return serie.dt.strftime('%d/%m/%Y %H:%M:%S').fillna('')
+
+def preparar_tabelas_exportacao(df_tabela1_bruto, df_tabela2_bruto, formatar=True):
+    """
+    Tabelas do relatório com as colunas do frontend, por nome de aba. formatar=False mantém os valores
+    tipados (segundos, frações, datas), usado no Parquet.
+    """
+    df_tabela1 = df_tabela1_bruto.rename(columns={'perc_com_motivo': '% com Motivo', 'perc_sem_motivo': '% sem Motivo', 'perc_total': '% Total'})
+    df_tabela2 = df_tabela2_bruto
+    if formatar and not df_tabela1.empty:
+        df_tabela1 = df_tabela1.assign(**{
+            'Média de Ligação': formatar_hhmmss(df_tabela1['Média de Ligação']),
+            '% com Motivo': formatar_percentual(df_tabela1['% com Motivo']),
+            '% sem Motivo': formatar_percentual(df_tabela1['% sem Motivo']),
+            '% Total': formatar_percentual(df_tabela1['% Total']),
+        })
+    if formatar and not df_tabela2.empty:
+        df_tabela2 = df_tabela2.assign(**{
+            col: formatar_data_hora(df_tabela2[col])
+            for col in ['Data/Hora da Chamada Original', 'Data/Hora da Rechamada'] if col in df_tabela2.columns
+        })
+    return {
+        TABELAS_EXPORTACAO['desempenho']: df_tabela1[[c for c in COLUNAS_TABELA1_EXPORTACAO if c in df_tabela1.columns]],
+        TABELAS_EXPORTACAO['detalhes']: df_tabela2[[c for c in COLUNAS_TABELA2_EXPORTACAO if c in df_tabela2.columns]],
+    }
+
+def _blocos_de_linhas(df, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Linhas em blocos como tuplas de objetos Python (nulos -> None)"""
+    for inicio in range(0, len(df), linhas_por_bloco):
+        bloco = df.iloc[inicio:inicio + linhas_por_bloco].astype(object)
+        yield bloco.where(bloco.notna(), None).itertuples(index=False, name=None)
+
+def escrever_xlsx(caminho, tabelas, progresso=None):
+    """Excel em modo write-only do openpyxl: as linhas vão para o arquivo em blocos, sem montar a planilha em memória"""
+    total = sum(len(df) for df in tabelas.values()) or 1
+    escritas = 0
+    workbook = Workbook(write_only=True)
+    fonte_cabecalho = Font(bold=True)
+    for nome_aba, df in tabelas.items():
+        planilha = workbook.create_sheet(title=nome_aba)
+        cabecalho = []
+        for coluna in df.columns:
+            celula = WriteOnlyCell(planilha, value=str(coluna))
+            celula.font = fonte_cabecalho
+            cabecalho.append(celula)
+        planilha.append(cabecalho)
+        for linhas in _blocos_de_linhas(df):
+            for linha in linhas:
+                planilha.append(linha)
+                escritas += 1
+            if progresso:
+                progresso(escritas / total)
+    workbook.save(caminho)
+
+def escrever_parquet(caminho, df, progresso=None):
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(caminho, tabela.schema, compression='snappy') as escritor:
+        for inicio in range(0, max(tabela.num_rows, 1), LINHAS_POR_BLOCO):
+            escritor.write_table(tabela.slice(inicio, LINHAS_POR_BLOCO))
+            if progresso:
+                progresso(min(inicio + LINHAS_POR_BLOCO, tabela.num_rows) / max(tabela.num_rows, 1))
+
+def gerar_csv_em_blocos(df, progresso=None):
+    """CSV (';', com BOM para o Excel) gerado em blocos: o cabeçalho sai antes de qualquer linha ser convertida"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    escritor.writerow([str(c) for c in df.columns])
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+    escritas = 0
+    for linhas in _blocos_de_linhas(df):
+        buffer.seek(0)
+        buffer.truncate()
+        for linha in linhas:
+            escritor.writerow(['' if v is None else v for v in linha])
+            escritas += 1
+        if progresso:
+            progresso(escritas / max(len(df), 1))
+        yield buffer.getvalue().encode('utf-8')
+
+def escrever_exportacao(caminho, formato, df_tabela1_bruto, df_tabela2_bruto, tabela='detalhes', progresso=None):
+    """Grava o relatório em `caminho` no formato pedido (xlsx: as duas abas; csv/parquet: a tabela escolhida)"""
+    if formato == 'xlsx':
+        escrever_xlsx(caminho, preparar_tabelas_exportacao(df_tabela1_bruto, df_tabela2_bruto), progresso)
+    elif formato == 'parquet':
+        df = preparar_tabelas_exportacao(df_tabela1_bruto, df_tabela2_bruto, formatar=False)[TABELAS_EXPORTACAO[tabela]]
+        escrever_parquet(caminho, df, progresso)
+    elif formato == 'csv':
+        df = preparar_tabelas_exportacao(df_tabela1_bruto, df_tabela2_bruto)[TABELAS_EXPORTACAO[tabela]]
+        with open(caminho, 'wb') as destino:
+            for bloco in gerar_csv_em_blocos(df, progresso):
+                destino.write(bloco)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Dimensões filtradas pela interface (filtros_adicionais) com índice bitmap por snapshot
+DIMENSOES_INDEXADAS = ['mvno', 'supervisor', 'motivo_categoria', 'tipo_rechamada', 'ddd', 'status_ligacao', 'semana']
+
+def construir_indices_bitmap(df, colunas=DIMENSOES_INDEXADAS):
+    """
+    Índice bitmap do snapshot: para cada dimensão, um bitmap compactado (np.packbits, 1 bit por linha) por
+    categoria. Montado uma vez por versão; vale para o DataFrame exato usado na construção (mesma ordem de linhas),
+    identificado por df.attrs['versao'].
+    """
+    indices = {'versao': df.attrs.get('versao'), 'linhas': len(df), 'colunas': {}}
+    for coluna in colunas:
+        # Só categóricas (como no cache): os valores do filtro são comparados direto com as categorias
+        if coluna not in df.columns or not isinstance(df[coluna].dtype, pd.CategoricalDtype):
+            continue
+        serie = df[coluna]
+        codigos = serie.cat.codes.to_numpy()
+        categorias = serie.cat.categories
+        bitmaps = np.empty((len(categorias), (len(df) + 7) // 8), dtype=np.uint8)
+        for codigo in range(len(categorias)):
+            bitmaps[codigo] = np.packbits(codigos == codigo)
+        indices['colunas'][coluna] = (categorias, bitmaps)
+    logger.info(f"Índices bitmap montados: {', '.join(f'{c}={len(cat)}' for c, (cat, _) in indices['colunas'].items())} "
+                f"({sum(b.nbytes for _, b in indices['colunas'].values()) / 1024 ** 2:.1f} MB)")
+    return indices
+
+def caminho_categorias_indices(caminho_arquivo):
+    """Arquivo das categorias de cada dimensão, ao lado do .npy (x.indices.npy -> x.indices.json)"""
+    return f"{os.path.splitext(caminho_arquivo)[0]}.json"
+
+def _categorias_por_dimensao(df, colunas):
+    """{dimensão: categorias como texto, na ordem dos códigos}, só das dimensões indexáveis de df (ordem de colunas)"""
+    return {
+        coluna: [str(valor) for valor in df[coluna].cat.categories]
+        for coluna in colunas
+        if coluna in df.columns and isinstance(df[coluna].dtype, pd.CategoricalDtype)
+    }
+
+def _gravar_atomico(caminho_arquivo, gravar):
+    caminho_tmp = f"{caminho_arquivo}.{os.getpid()}.tmp"
+    with open(caminho_tmp, 'wb') as destino:
+        gravar(destino)
+    os.replace(caminho_tmp, caminho_arquivo)
+
+def salvar_indices_bitmap(indices, caminho_arquivo):
+    """
+    Grava os bitmaps de todas as dimensões empilhados (na ordem de indices['colunas']) em um .npy, para os
+    workers mapearem em vez de cada um montar a sua cópia, e as categorias de cada dimensão (a linha de cada
+    bitmap) em caminho_categorias_indices. Arquivos temporários e os.replace, como o snapshot Arrow.
+    """
+    categorias = {
+        'linhas': indices['linhas'],
+        'colunas': {coluna: [str(valor) for valor in cats] for coluna, (cats, _) in indices['colunas'].items()},
+    }
+    bitmaps = [b for _, b in indices['colunas'].values()]
+    bitmaps = np.concatenate(bitmaps) if bitmaps else np.empty((0, (indices['linhas'] + 7) // 8), dtype=np.uint8)
+    _gravar_atomico(caminho_categorias_indices(caminho_arquivo),
+                    lambda destino: destino.write(json.dumps(categorias, ensure_ascii=False).encode('utf-8')))
+    _gravar_atomico(caminho_arquivo, lambda destino: np.save(destino, bitmaps))
+
+def carregar_indices_bitmap(df, caminho_arquivo, colunas=DIMENSOES_INDEXADAS):
+    """
+    Índices de df com os bitmaps mapeados do arquivo (mmap_mode='r', páginas compartilhadas entre os workers).
+    Antes de mapear, confere linhas, dimensões e os valores e a ordem das categorias de cada uma com os gravados
+    ao lado do .npy: mesmo número de categorias com outros valores levaria os filtros às linhas erradas.
+    None se o arquivo não corresponder a df.
+    """
+    try:
+        with open(caminho_categorias_indices(caminho_arquivo), encoding='utf-8') as f:
+            gravadas = json.load(f)
+    except FileNotFoundError:
+        return None
+    categorias_df = _categorias_por_dimensao(df, colunas)
+    if gravadas.get('linhas') != len(df) or list(gravadas.get('colunas', {}).items()) != list(categorias_df.items()):
+        return None
+    bitmaps = np.load(caminho_arquivo, mmap_mode='r')
+    total_categorias = sum(len(cats) for cats in categorias_df.values())
+    if bitmaps.ndim != 2 or bitmaps.shape != (total_categorias, (len(df) + 7) // 8):
+        return None
+    indices = {'versao': df.attrs.get('versao'), 'linhas': len(df), 'colunas': {}}
+    posicao = 0
+    for coluna in categorias_df:
+        categorias = df[coluna].cat.categories
+        indices['colunas'][coluna] = (categorias, bitmaps[posicao:posicao + len(categorias)])
+        posicao += len(categorias)
+    return indices
+
+def _faixa_no_snapshot(df, indices):
+    """Posições [inicio, fim) de df no snapshot indexado; None se df não for um recorte contíguo (iloc) dele"""
+    if df.attrs.get('versao') != indices['versao']:
+        return None
+    posicoes = df.index
+    if not isinstance(posicoes, pd.RangeIndex) or posicoes.step != 1 or posicoes.stop > indices['linhas']:
+        return None
+    return posicoes.start, posicoes.stop
+
+def mascara_filtros_indexados(df, filtros, indices):
+    """
+    Resolve os filtros das dimensões indexadas em uma máscara booleana das linhas de df (recorte do snapshot):
+    OR dos bitmaps dos valores de cada dimensão, AND entre dimensões, só nos bytes do recorte.
+    Retorna (mascara, colunas resolvidas); (None, []) sem índice aplicável ou sem filtro indexado.
+    """
+    if not indices or not filtros:
+        return None, []
+    faixa = _faixa_no_snapshot(df, indices)
+    if faixa is None:
+        return None, []
+    inicio, fim = faixa
+    primeiro_byte, ultimo_byte = inicio // 8, (fim + 7) // 8
+    bits = None
+    colunas = []
+    for coluna, valores in filtros.items():
+        if not valores or coluna not in indices['colunas']:
+            continue
+        categorias, bitmaps = indices['colunas'][coluna]
+        selecionadas = np.flatnonzero(categorias.isin(valores))
+        uniao = np.bitwise_or.reduce(bitmaps[selecionadas, primeiro_byte:ultimo_byte], axis=0) if len(selecionadas) \
+            else np.zeros(ultimo_byte - primeiro_byte, dtype=np.uint8)
+        bits = uniao if bits is None else bits & uniao
+        colunas.append(coluna)
+    if bits is None:
+        return None, []
+    deslocamento = inicio - primeiro_byte * 8
+    return np.unpackbits(bits)[deslocamento:deslocamento + fim - inicio].view(bool), colunas
@@ -0,0 +1,80 @@
+import bisect
+import math
+import threading
+
+# Registro de métricas em memória, por processo, exposto em /metrics no formato texto do Prometheus (0.0.4).
+# Com vários workers do gunicorn cada um tem o seu registro: o scrape vê o worker que atendeu.
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BYTES = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3)
+TIPO_CONTEUDO_METRICAS = 'text/plain; version=0.0.4; charset=utf-8'
+
+_METRICAS = {}
+_LOCK = threading.Lock()
+
+def registrar_metrica(nome, tipo, ajuda, buckets=None):
+    """Declara a métrica ('counter', 'gauge' ou 'histogram'); registrar de novo o mesmo nome não faz nada"""
+    with _LOCK:
+        _METRICAS.setdefault(nome, {
+            'tipo': tipo, 'ajuda': ajuda,
+            'buckets': tuple(buckets or BUCKETS_SEGUNDOS) if tipo == 'histogram' else None,
+            'series': {},
+        })
+
+def _rotulos(rotulos):
+    return tuple(sorted((chave, str(valor)) for chave, valor in rotulos.items()))
+
+def incrementar(nome, valor=1, **rotulos):
+    metrica = _METRICAS[nome]
+    chave = _rotulos(rotulos)
+    with _LOCK:
+        metrica['series'][chave] = metrica['series'].get(chave, 0) + valor
+
+def definir(nome, valor, **rotulos):
+    metrica = _METRICAS[nome]
+    with _LOCK:
+        metrica['series'][_rotulos(rotulos)] = valor
+
+def observar(nome, valor, **rotulos):
+    """Registra uma observação no histograma: contagem do bucket, soma e total"""
+    metrica = _METRICAS[nome]
+    chave = _rotulos(rotulos)
+    posicao = bisect.bisect_left(metrica['buckets'], valor)
+    with _LOCK:
+        serie = metrica['series'].get(chave)
+        if serie is None:
+            serie = metrica['series'][chave] = {'buckets': [0] * (len(metrica['buckets']) + 1), 'soma': 0.0, 'total': 0}
+        serie['buckets'][posicao] += 1
+        serie['soma'] += valor
+        serie['total'] += 1
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ''
+    return '{' + ','.join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos) + '}'
+
+def _formatar_numero(valor):
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+def gerar_exposicao():
+    """Todas as métricas no formato texto do Prometheus (histogramas com buckets cumulativos, _sum e _count)"""
+    linhas = []
+    with _LOCK:
+        for nome, metrica in sorted(_METRICAS.items()):
+            linhas.append(f"# HELP {nome} {_escapar(metrica['ajuda'])}")
+            linhas.append(f"# TYPE {nome} {metrica['tipo']}")
+            for rotulos, serie in sorted(metrica['series'].items()):
+                if metrica['tipo'] != 'histogram':
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_numero(serie)}")
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(metrica['buckets'] + (math.inf,), serie['buckets']):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos + (('le', _formatar_numero(limite)),))} {acumulado}")
+                linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_formatar_numero(serie['soma'])}")
+                linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {serie['total']}")
+    return '\n'.join(linhas) + '\n'